@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Vectorized backtester for the example threshold strategy
+
+Replays recorded price history (see price_store.py) through the rules in
+strategy.py, and sweeps grids of the settings.py parameters across all cores.
+
+Usage:
+    ./backtest.py ethusd            # backtest the parameters in settings.py
+    ./backtest.py ethusd --sweep    # sweep SWEEP_GRID, saving DATA_DIR/ethusd/backtest.csv
+
+How it stays fast:
+    For a given (gain, loss, overpay) the tick each position exits on only
+    depends on the tick it was bought on, so the exit tick for every possible
+    buy tick is found at once with NumPy, using sparse tables of range
+    maxes/mins and binary lifting (O(n log n)).  Every other parameter (order
+    sizes, active order count, net gain/loss stops) is then applied to the
+    resulting chain of trades, so the expensive part is shared by every
+    parameter set in a (gain, loss, overpay) group.
+
+    Sparse tables take log2(n) copies of the prices, so the ticks are split
+    into chunks of BACKTEST_CHUNK_SIZE.  Each chunk's tables are built while
+    it's being searched, and a position that doesn't exit within its own
+    chunk skips ahead to the first chunk that could hold its exit, using
+    tables over the chunks' maxes/mins.  Memory stays linear in the number of
+    ticks, at the cost of rebuilding the chunk tables for each group when
+    there's more than one chunk.
+
+Simplifications vs the live bot:
+    - orders fill completely at their limit price on the tick they're placed
+    - amounts aren't rounded to the currencies' decimal places
+"""
+
+import os
+import sys
+import csv
+
+from random import Random
+from itertools import groupby, product
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, NamedTuple, Optional, Tuple
+
+from strategy import add_percentage, sell_thresholds
+from price_store import symbol_store
+from settings import (
+    USD_MIN_ORDER_AMT,
+    USD_MAX_ORDER_AMT,
+    MAX_LOSS_RATIO,
+    MAX_GAIN_RATIO,
+    MAX_ACTIVE_ORDERS,
+    OVERPAY_RATIO,
+    USD_MAX_NET_GAINS,
+    USD_MAX_NET_LOSS,
+    BACKTEST_CHUNK_SIZE,
+    DATA_DIR,
+)
+
+try:
+    import numpy as np
+except ImportError:
+    print('The package numpy is required to run backtests:')
+    print('    pip install numpy')
+    raise SystemExit(1)
+
+
+class Params(NamedTuple):
+    """one set of strategy parameters, named after their settings.py equivalents"""
+    max_gain_ratio: float = float(MAX_GAIN_RATIO)
+    max_loss_ratio: float = float(MAX_LOSS_RATIO)
+    overpay_ratio: float = float(OVERPAY_RATIO)
+    max_active_orders: int = MAX_ACTIVE_ORDERS
+    usd_min_order_amt: float = float(USD_MIN_ORDER_AMT)
+    usd_max_order_amt: float = float(USD_MAX_ORDER_AMT)
+    usd_max_net_gains: float = float(USD_MAX_NET_GAINS)
+    usd_max_net_loss: float = float(USD_MAX_NET_LOSS)
+    seed: int = 0                   # seeds the random order sizes
+
+
+class Result(NamedTuple):
+    params: Params
+    net_pnl: float                  # realized USD profit of all the closed orders
+    max_drawdown: float             # largest USD drop from a peak in realized profit
+    trades: int                     # number of buy -> sell pairs closed
+    stopped: Optional[str]          # 'gains' or 'loss' if a net limit stopped the bot early
+
+
+SWEEP_GRID = {
+    'max_gain_ratio': [0.005, 0.01, 0.02, 0.03, 0.05],
+    'max_loss_ratio': [-0.005, -0.0075, -0.01, -0.02, -0.05],
+    'overpay_ratio': [0.001, 0.0025, 0.005],
+    'max_active_orders': [1, 5, 10],
+}
+
+
+### Exit Search
+
+Table = List['np.ndarray']
+
+
+class Tables(NamedTuple):
+    """the range tables exit_ticks() searches, built once per price series"""
+    chunk_size: int
+    chunk: Optional[Tuple[Table, Table]]    # (maxes, mins) of the only chunk, None if they're built per chunk
+    maxes: Table                            # over each chunk's max price
+    mins: Table                             # over each chunk's min price
+
+
+def sparse_table(values: 'np.ndarray', reduce) -> Table:
+    """levels where table[k][i] == reduce(values[i:i + 2**k]), e.g. reduce=np.maximum for range maxes"""
+    table = [values]
+    step = 1
+    while step * 2 <= len(values):
+        table.append(reduce(table[-1][:-step], table[-1][step:]))
+        step *= 2
+    return table
+
+def sparse_tables(prices: 'np.ndarray', chunk_size: int=BACKTEST_CHUNK_SIZE) -> Tables:
+    """the chunk tables of a price series, and the range tables of the chunks' maxes & mins"""
+    starts = np.arange(0, len(prices), chunk_size)
+    chunk = None
+    if len(prices) <= chunk_size:
+        chunk = (sparse_table(prices, np.maximum), sparse_table(prices, np.minimum))
+    return Tables(
+        chunk_size=chunk_size,
+        chunk=chunk,
+        maxes=sparse_table(np.maximum.reduceat(prices, starts), np.maximum),
+        mins=sparse_table(np.minimum.reduceat(prices, starts), np.minimum),
+    )
+
+def first_crossing(table: Table, thresholds: 'np.ndarray', above: bool, starts: 'np.ndarray'=None) -> 'np.ndarray':
+    """for every threshold, the first index j >= its start (by default its own index) with a value past it (len(table[0]) if never)"""
+    n = len(table[0])
+    pos = np.arange(n) if starts is None else starts
+    # binary lifting: skip ahead by each power of two while nothing in the window crosses
+    for k in reversed(range(len(table))):
+        level, step = table[k], 1 << k
+        fits = pos + step <= n
+        window = level[np.minimum(pos, len(level) - 1)]
+        clear = (window <= thresholds) if above else (window >= thresholds)
+        pos = np.where(fits & clear, pos + step, pos)
+    return pos
+
+def chunked_crossing(prices: 'np.ndarray', tables: Tables, thresholds: 'np.ndarray', above: bool) -> 'np.ndarray':
+    """for every tick i, the first tick j >= i with a price past thresholds[i] (len(prices) if never), a chunk at a time"""
+    n, size = len(prices), tables.chunk_size
+    chunk_table = tables.maxes if above else tables.mins
+    crossings = np.full(n, n, dtype=np.int64)
+    waiting = defaultdict(list)     # {chunk: [arrays of earlier ticks whose first crossing is in it]}
+
+    for chunk, start in enumerate(range(0, n, size)):
+        end = min(start + size, n)
+        if tables.chunk is not None:
+            table = tables.chunk[0 if above else 1]
+        else:
+            table = sparse_table(prices[start:end], np.maximum if above else np.minimum)
+
+        # the ticks that cross within their own chunk
+        found = first_crossing(table, thresholds[start:end], above) + start
+        missed = np.flatnonzero(found == end) + start
+        found[found == end] = n
+        crossings[start:end] = found
+
+        # the earlier ticks that skipped ahead to this chunk, which always holds their crossing
+        if chunk in waiting:
+            earlier = np.concatenate(waiting.pop(chunk))
+            starts = np.zeros(len(earlier), dtype=np.int64)
+            crossings[earlier] = first_crossing(table, thresholds[earlier], above, starts) + start
+
+        # the rest skip ahead to the first later chunk with a price past their threshold
+        if missed.size:
+            starts = np.full(missed.size, chunk + 1, dtype=np.int64)
+            later = first_crossing(chunk_table, thresholds[missed], above, starts)
+            order = np.argsort(later, kind='stable')
+            chunks, firsts = np.unique(later[order], return_index=True)
+            for later_chunk, ticks in zip(chunks.tolist(), np.split(missed[order], firsts[1:])):
+                if later_chunk < len(chunk_table[0]):
+                    waiting[later_chunk].append(ticks)
+
+    return crossings
+
+def exit_ticks(prices: 'np.ndarray', tables: Tables, gain: float, loss: float, overpay: float) -> 'np.ndarray':
+    """for every tick an order could be bought on, the tick it would be sold on"""
+    upper, lower = sell_thresholds(add_percentage(prices, overpay), gain, loss)
+    return np.minimum(
+        chunked_crossing(prices, tables, upper, above=True),
+        chunked_crossing(prices, tables, lower, above=False),
+    )
+
+def trade_chain(exits: 'np.ndarray') -> Tuple['np.ndarray', 'np.ndarray']:
+    """(buy_ticks, sell_ticks) of a position that's re-bought on the tick after each sale"""
+    n, exit_list = len(exits), exits.tolist()
+    buys, sells = [], []
+    tick = 0
+    while tick < n and exit_list[tick] < n:
+        buys.append(tick)
+        sells.append(exit_list[tick])
+        tick = exit_list[tick] + 1
+    return np.array(buys, dtype=np.int64), np.array(sells, dtype=np.int64)
+
+
+### Simulation
+
+def simulate(prices: 'np.ndarray', buys: 'np.ndarray', sells: 'np.ndarray', params: Params) -> Result:
+    """apply order sizes and net gain/loss stops to a chain of trades"""
+
+    # all max_active_orders positions are bought on the same ticks, so they
+    # follow the same chain, each with its own random size
+    # (random.Random rather than numpy.random, which breaks on the secrets.py settings imports)
+    rng = Random(params.seed)
+    steps = [rng.randint(0, 100) / 100 for _ in range(len(buys) * params.max_active_orders)]
+    steps = np.array(steps).reshape(len(buys), params.max_active_orders)
+    order_amts = params.usd_min_order_amt + steps * (params.usd_max_order_amt - params.usd_min_order_amt)
+
+    buy_prices = add_percentage(prices[buys], params.overpay_ratio)
+    sell_prices = add_percentage(prices[sells], -params.overpay_ratio)
+    # amt bought = usd / price, profit = amt * (sell limit - buy limit)
+    profits = order_amts.sum(axis=1) * (sell_prices - buy_prices) / prices[buys]
+    net_gains = np.cumsum(profits)
+
+    stopped = None
+    hits = np.flatnonzero((net_gains > params.usd_max_net_gains) | (net_gains < params.usd_max_net_loss))
+    if hits.size:
+        stop = hits[0]
+        stopped = 'gains' if net_gains[stop] > params.usd_max_net_gains else 'loss'
+        net_gains = net_gains[:stop + 1]
+
+    if not net_gains.size:
+        return Result(params, 0.0, 0.0, 0, stopped)
+
+    peaks = np.maximum.accumulate(np.concatenate(([0.0], net_gains)))[1:]
+    return Result(
+        params=params,
+        net_pnl=float(net_gains[-1]),
+        max_drawdown=float((peaks - net_gains).max()),
+        trades=len(net_gains) * params.max_active_orders,
+        stopped=stopped,
+    )
+
+def backtest(prices: 'np.ndarray', params: Params=Params(), tables: Tables=None) -> Result:
+    """run the strategy over a series of prices with one set of parameters"""
+    prices = np.asarray(prices, dtype=np.float64)
+    if tables is None:
+        tables = sparse_tables(prices)
+    exits = exit_ticks(prices, tables, params.max_gain_ratio, params.max_loss_ratio, params.overpay_ratio)
+    return simulate(prices, *trade_chain(exits), params)
+
+
+### Parameter Sweeps
+
+def param_grid(**values: List) -> List[Params]:
+    """every combination of the given Params field values, e.g. param_grid(max_gain_ratio=[0.01, 0.02])"""
+    fields = list(values)
+    return [Params(**dict(zip(fields, combo))) for combo in product(*values.values())]
+
+exit_key = lambda params: (params.max_gain_ratio, params.max_loss_ratio, params.overpay_ratio)
+
+# set in each worker process (or inherited from the parent when it forks)
+_prices: Optional['np.ndarray'] = None
+_tables: Optional[Tables] = None
+
+def init_worker(prices: 'np.ndarray') -> None:
+    global _prices, _tables
+    if _prices is not prices or _tables is None:
+        _prices, _tables = prices, sparse_tables(prices)
+
+def run_group(group: List[Params]) -> List[Result]:
+    """backtest parameter sets that share the same exit ticks, computing them once"""
+    exits = exit_ticks(_prices, _tables, *exit_key(group[0]))
+    buys, sells = trade_chain(exits)
+    return [simulate(_prices, buys, sells, params) for params in group]
+
+def sweep(prices: 'np.ndarray', grid: List[Params], processes: int=None) -> List[Result]:
+    """backtest every parameter set in grid, spread across a pool of processes"""
+    prices = np.asarray(prices, dtype=np.float64)
+    init_worker(prices)  # build the tables once up front so forked workers share them
+
+    groups = [list(group) for _, group in groupby(sorted(grid, key=exit_key), key=exit_key)]
+    with ProcessPoolExecutor(processes, initializer=init_worker, initargs=(prices,)) as pool:
+        return [result for results in pool.map(run_group, groups) for result in results]
+
+
+def print_results(results: List[Result], limit: int=20) -> None:
+    print(f'{"gain":>7}{"loss":>8}{"overpay":>8}{"orders":>7}{"net P&L":>11}{"drawdown":>10}{"trades":>8}  stopped')
+    for result in sorted(results, key=lambda result: result.net_pnl, reverse=True)[:limit]:
+        p = result.params
+        print(
+            f'{p.max_gain_ratio:>7.4f}{p.max_loss_ratio:>8.4f}{p.overpay_ratio:>8.4f}{p.max_active_orders:>7}'
+            f'{result.net_pnl:>11.2f}{result.max_drawdown:>10.2f}{result.trades:>8}  {result.stopped or ""}'
+        )
+
+def save_results(path: str, results: List[Result]) -> None:
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow([*Params._fields, 'net_pnl', 'max_drawdown', 'trades', 'stopped'])
+        for result in results:
+            writer.writerow([*result.params, *result[1:]])
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__)
+        raise SystemExit(1)
+
+    symbol = sys.argv[1]
+    data_dir = os.path.join(DATA_DIR, symbol)
+    _, prices = symbol_store(data_dir, symbol).prices()
+    print(f'[i] Loaded {len(prices)} prices from {data_dir}')
+
+    if '--sweep' in sys.argv:
+        results = sweep(prices, param_grid(**SWEEP_GRID))
+        save_results(os.path.join(data_dir, 'backtest.csv'), results)
+        print(f'[√] Backtested {len(results)} parameter sets, saved to {data_dir}/backtest.csv')
+    else:
+        results = [backtest(prices)]
+    print_results(results)
@@ -0,0 +1,144 @@
+"""
+Run the whole benchmark suite, save the results as json, and compare two runs
+
+Each suite's run() returns {case: seconds} (lower is better), and the results
+are saved together with the commit & machine they were measured on, so a run
+can be compared against an earlier baseline.  The quick suites are repeated
+and keep each case's best time, to cut down on noise from the rest of the
+machine.  Compare runs from the same machine, timings from different
+hardware don't mean much.
+
+Usage:
+    python3 -m benchmarks                               # saves DATA_DIR/benchmarks/<commit>-<time>.json
+    python3 -m benchmarks --quick                       # skip 1M orders & the larger tick runs
+    python3 -m benchmarks --only signing currency -o baseline.json
+    python3 -m benchmarks --compare baseline.json DATA_DIR/benchmarks/latest.json --threshold 0.1
+"""
+
+import os
+import sys
+import json
+import platform
+import argparse
+import subprocess
+
+from time import time
+from typing import Callable, Dict, List, Tuple
+
+from settings import DATA_DIR
+
+from benchmarks import currency, order, signing, persistence, tick
+
+Results = Dict[str, Dict[str, float]]
+
+THRESHOLD = 0.2     # slowdown ratio above which a case is flagged as a regression, e.g. 0.2 = 20% slower
+
+
+def current(results: dict) -> Dict[str, float]:
+    """the current implementation's seconds, from suites that also time the baseline it replaced"""
+    return {case: seconds[1] if isinstance(seconds, tuple) else seconds for case, seconds in results.items()}
+
+
+def suites(quick: bool=False) -> Dict[str, Tuple[Callable[[], Dict[str, float]], int]]:
+    """{suite: (run, times to repeat it)}"""
+    return {
+        'signing': (lambda: signing.run(), 5),
+        'currency': (lambda: current(currency.run()), 5),
+        'order': (lambda: current(order.run()), 5),
+        'persistence': (lambda: persistence.run(persistence.SIZES[:2] if quick else persistence.SIZES), 1),
+        'tick': (lambda: tick.run(tick.ACTIVE_ORDERS[:2] if quick else tick.ACTIVE_ORDERS), 1),
+    }
+
+
+def best_of(suite: Callable[[], Dict[str, float]], repeat: int) -> Dict[str, float]:
+    runs = [suite() for _ in range(repeat)]
+    return {case: min(results[case] for results in runs) for case in runs[0]}
+
+
+def commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run(only: List[str]=None, quick: bool=False) -> dict:
+    results: Results = {}
+    for name, (suite, repeat) in suites(quick).items():
+        if only and name not in only:
+            continue
+        print(f'[i] Running benchmarks.{name}...')
+        results[name] = best_of(suite, repeat)
+        for case, seconds in results[name].items():
+            print(f'    {case:<26}{seconds * 1000:>12.3f}ms')
+    return {
+        'commit': commit(),
+        'timestamp': round(time()),
+        'python': platform.python_version(),
+        'machine': f'{platform.system()} {platform.machine()} {platform.node()}',
+        'quick': quick,
+        'results': results,
+    }
+
+
+def save(report: dict, path: str=None) -> str:
+    """write a run's json atomically, also as latest.json when saved to the default dir"""
+    if path is None:
+        directory = os.path.join(DATA_DIR, 'benchmarks')
+        path = os.path.join(directory, f'{report["commit"]}-{report["timestamp"]}.json')
+        paths = [path, os.path.join(directory, 'latest.json')]
+    else:
+        paths = [path]
+    for dest in paths:
+        os.makedirs(os.path.dirname(dest) or '.', exist_ok=True)
+        tmp_path = f'{dest}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=4)
+        os.replace(tmp_path, dest)
+    return path
+
+
+def compare(old: dict, new: dict, threshold: float=THRESHOLD) -> List[Tuple[str, str, float, float, float]]:
+    """(suite, case, old seconds, new seconds, new / old) of every case that got slower by more than threshold"""
+    regressions = []
+    for suite, cases in new['results'].items():
+        for case, seconds in cases.items():
+            baseline = old['results'].get(suite, {}).get(case)
+            if not baseline:
+                continue
+            ratio = seconds / baseline
+            flag = 'REGRESSION' if ratio > 1 + threshold else 'faster' if ratio < 1 - threshold else ''
+            print(f'{suite:<12}{case:<26}{baseline * 1000:>12.3f}ms{seconds * 1000:>12.3f}ms{ratio:>8.2f}x  {flag}')
+            if flag == 'REGRESSION':
+                regressions.append((suite, case, baseline, seconds, ratio))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python3 -m benchmarks', description='Run or compare the benchmark suite')
+    parser.add_argument('--only', nargs='+', choices=list(suites()), help='suites to run (default: all)')
+    parser.add_argument('--quick', action='store_true', help='skip 1M orders & the larger tick runs')
+    parser.add_argument('-o', '--output', help='json file to save the results to')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two saved runs instead')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help='slowdown ratio to flag, e.g. 0.2 = 20%% slower')
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0], encoding='utf-8') as f:
+            old = json.load(f)
+        with open(args.compare[1], encoding='utf-8') as f:
+            new = json.load(f)
+        print(f'[i] Comparing {old["commit"]} -> {new["commit"]}, flagging cases over {args.threshold:.0%} slower')
+        if old.get('machine') != new.get('machine'):
+            print(f'[!] Runs are from different machines: {old.get("machine")} vs {new.get("machine")}')
+        regressions = compare(old, new, args.threshold)
+        if regressions:
+            print(f'[X] {len(regressions)} regressions')
+            sys.exit(1)
+        print('[√] No regressions')
+    else:
+        print(f'[√] Saved results to {save(run(args.only, args.quick), args.output)}')
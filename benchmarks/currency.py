@@ -0,0 +1,85 @@
+"""
+Currency arithmetic & comparison benchmarks
+
+Compares the scaled-integer symbols.Currency against the original
+Decimal-backed implementation it replaced.
+
+Usage:
+    python3 -m benchmarks.currency
+"""
+
+from timeit import timeit
+from decimal import Decimal
+
+from symbols import USD
+
+
+class DecimalUSD:
+    """the original Decimal-backed Currency, kept here as the baseline to beat"""
+    icon = '$'
+    decimal_places = 2
+
+    def __init__(self, amt: Decimal) -> None:
+        self.amt = Decimal(round(Decimal(amt), self.decimal_places))
+
+    def __add__(self, other: object) -> 'DecimalUSD':
+        if isinstance(other, self.__class__):
+            return self.__class__(other.amt + self.amt)
+        return NotImplemented
+
+    def __radd__(self, other: object) -> 'DecimalUSD':
+        if other == 0:
+            return self
+        if isinstance(other, self.__class__):
+            return self.__class__(self.amt + other.amt)
+        return NotImplemented
+
+    def __sub__(self, other: object) -> 'DecimalUSD':
+        if isinstance(other, self.__class__):
+            return self.__class__(self.amt - other.amt)
+        return NotImplemented
+
+    def __mul__(self, other: object) -> 'DecimalUSD':
+        if isinstance(other, (int, Decimal)):
+            return self.__class__(self.amt * other)
+        return NotImplemented
+
+    def __gt__(self, other: object) -> bool:
+        if isinstance(other, (int, float, Decimal)):
+            return self.amt > other
+        if isinstance(other, self.__class__):
+            return self.amt > other.amt
+        return NotImplemented
+
+
+def cases(cls) -> dict:
+    a, b = cls(Decimal('915.39')), cls(Decimal('914.44'))
+    amounts = [cls(Decimal(n) / 100) for n in range(1000)]
+    return {
+        'construct': lambda: cls(Decimal('915.39')),
+        'add': lambda: a + b,
+        'sub': lambda: a - b,
+        'mul int': lambda: a * 3,
+        'mul Decimal': lambda: a * Decimal('0.0025'),
+        'compare': lambda: a > b,
+        'compare int': lambda: a > 900,
+        'sum 1k': lambda: sum(amounts),
+    }
+
+
+def run(number: int=20000) -> dict:
+    """{case: (decimal_seconds, integer_seconds)} for `number` runs of each case"""
+    baseline, current = cases(DecimalUSD), cases(USD)
+    return {
+        name: (
+            timeit(baseline[name], number=number // (100 if name == 'sum 1k' else 1)),
+            timeit(current[name], number=number // (100 if name == 'sum 1k' else 1)),
+        )
+        for name in current
+    }
+
+
+if __name__ == '__main__':
+    print(f'{"case":<14}{"Decimal":>12}{"int units":>12}{"speedup":>10}')
+    for name, (old, new) in run().items():
+        print(f'{name:<14}{old:>11.4f}s{new:>11.4f}s{old / new:>9.1f}x')
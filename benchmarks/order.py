@@ -0,0 +1,100 @@
+"""
+Order construction & property access benchmarks
+
+Compares the slotted, caching symbols.Order against the original
+dict-backed implementation it replaced.
+
+Usage:
+    python3 -m benchmarks.order
+"""
+
+from timeit import timeit
+from decimal import Decimal
+
+from symbols import Order, Currency, USD, currency_by_symbol
+
+
+class DictOrder:
+    """the original Order that re-parses its json on every access, kept as the baseline to beat"""
+
+    def __init__(self, json):
+        if json.get('result') == 'error':
+            raise Exception(json.get('reason'))
+        assert 'id' in json, 'Order json must have an id field.'
+        self.data = json
+
+    def __getattr__(self, attr):
+        return self.data[attr]
+
+    @property
+    def is_filled(self):
+        return self.remaining_amount == "0"
+
+    @property
+    def buy_amt(self) -> Currency:
+        return currency_by_symbol[self.symbol[:3]](Decimal(self.original_amount))
+
+    @property
+    def price_amt(self) -> Currency:
+        return currency_by_symbol[self.symbol[3:]](Decimal(self.price))
+
+    @property
+    def filled_amt(self) -> Currency:
+        return USD(Decimal(self.price) * Decimal(self.executed_amount))
+
+
+def order_json(i: int) -> dict:
+    return {
+        "order_id": str(44375901 + i),
+        "id": str(44375901 + i),
+        "symbol": "ethusd",
+        "exchange": "gemini",
+        "avg_execution_price": "915.39",
+        "side": "buy",
+        "type": "exchange limit",
+        "timestamp": "1515014100",
+        "timestampms": 1515014100000 + i,
+        "is_live": False,
+        "is_cancelled": False,
+        "is_hidden": False,
+        "was_forced": False,
+        "executed_amount": "0.0123",
+        "remaining_amount": "0",
+        "options": [],
+        "price": "915.39",
+        "original_amount": "0.0123",
+    }
+
+
+def cases(cls, n: int) -> dict:
+    payloads = [order_json(i) for i in range(n)]
+    orders = [cls(payload) for payload in payloads]
+
+    def read_tick():
+        # what one runloop tick + net gains sum touches for every order
+        for order in orders:
+            order.is_filled
+            order.price_amt
+            order.buy_amt
+            order.filled_amt
+
+    return {
+        f'construct {n}': lambda: [cls(payload) for payload in payloads],
+        f'read {n}': read_tick,
+        f'read {n} x10': lambda: [read_tick() for _ in range(10)],
+    }
+
+
+def run(n: int=5000, number: int=5) -> dict:
+    """{case: (dict_seconds, slotted_seconds)} for `number` runs of each case"""
+    baseline, current = cases(DictOrder, n), cases(Order, n)
+    return {
+        name: (timeit(baseline[name], number=number), timeit(current[name], number=number))
+        for name in current
+    }
+
+
+if __name__ == '__main__':
+    print(f'{"case":<18}{"dict":>12}{"slotted":>12}{"speedup":>10}')
+    for name, (old, new) in run().items():
+        print(f'{name:<18}{old:>11.4f}s{new:>11.4f}s{old / new:>9.1f}x')
@@ -0,0 +1,97 @@
+"""
+Order persistence benchmarks at 1k, 100k & 1M orders
+
+Times each of data.py's persistence paths on a synthetic history of closed
+buy/sell pairs: appending them to the order journal, compacting it into the
+binary snapshot, loading the snapshot back (closed orders are parsed lazily),
+reading every closed order after loading, and replaying a journal that was
+never compacted.
+
+Usage:
+    python3 -m benchmarks.persistence                   # 1k, 100k & 1M orders
+    python3 -m benchmarks.persistence 1000 100000
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+
+from time import perf_counter
+from typing import Dict, Iterable, List, Tuple
+
+from benchmarks.order import order_json
+from symbols import Order
+from data import OrderJournal
+
+SIZES = (1_000, 100_000, 1_000_000)
+
+
+def pairs(n: int) -> List[Tuple[Order, Order]]:
+    """n closed (buy, sell) pairs, i.e. 2n orders"""
+    return [
+        (
+            Order(order_json(2 * i)),
+            Order({**order_json(2 * i + 1), 'side': 'sell', 'price': '920.00', 'avg_execution_price': '920.00'}),
+        )
+        for i in range(n // 2)
+    ]
+
+
+def timed(func) -> float:
+    started = perf_counter()
+    func()
+    return perf_counter() - started
+
+
+def load(path: str) -> Tuple[dict, dict]:
+    journal = OrderJournal(path)
+    orders = journal.load()
+    journal.close()
+    return orders
+
+
+def run_size(n: int) -> Dict[str, float]:
+    """{case: seconds} for one history of n orders"""
+    closes = pairs(n)
+    closed_orders = {buy.id: {'buy': buy, 'sell': sell} for buy, sell in closes}
+    results = {}
+
+    with tempfile.TemporaryDirectory() as path, tempfile.TemporaryDirectory() as uncompacted_path:
+        journal = OrderJournal(path, compact_after=len(closes) + 1)
+        journal.load()
+
+        def append():
+            for buy, sell in closes:
+                journal.closed(buy, sell)
+            journal.commit(force=True)
+
+        results[f'journal {n}'] = timed(append)
+        shutil.copy(journal.journal_path, uncompacted_path)
+        results[f'compact {n}'] = timed(lambda: journal.compact({}, closed_orders, force=True))
+        journal.close()
+        del closes, closed_orders   # only keep one copy of the orders in memory at a time, 1M of them take GBs
+
+        loaded = []
+        results[f'load {n}'] = timed(lambda: loaded.extend(load(path)))
+        results[f'read all {n}'] = timed(lambda: [pair['sell'].price_amt for pair in loaded[1].values()])
+        del loaded
+
+        results[f'replay journal {n}'] = timed(lambda: load(uncompacted_path))
+
+    return results
+
+
+def run(sizes: Iterable[int]=SIZES) -> Dict[str, float]:
+    """{case: seconds} for every size"""
+    results = {}
+    for n in sizes:
+        results.update(run_size(n))
+    return results
+
+
+if __name__ == '__main__':
+    sizes = [int(arg) for arg in sys.argv[1:]] or SIZES
+    for n in sizes:
+        for name, seconds in run_size(n).items():
+            print(f'{name:<24}{seconds:>10.3f}s{seconds / n * 1e6:>10.2f}us/order')
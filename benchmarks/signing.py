@@ -0,0 +1,58 @@
+"""
+Request signing benchmarks: nonces, base_headers & the full signed request
+
+Times the work every private request does before it hits the network:
+reserving a nonce (with the durable write to the nonce file every
+`block_size` nonces), and base_headers() serializing, base64-encoding and
+HMAC-SHA384 signing the payload.  The nonce file lives in a temp dir, so the
+bot's real nonce file is never touched.
+
+Usage:
+    python3 -m benchmarks.signing
+"""
+
+import os
+import tempfile
+
+from timeit import timeit
+
+import gemini_api as api
+from nonces import NonceAllocator
+from settings import NONCE_BLOCK_SIZE
+
+
+def cases(nonce_dir: str) -> dict:
+    per_request = NonceAllocator(os.path.join(nonce_dir, 'per-request.txt'), block_size=1)
+    blocks = NonceAllocator(os.path.join(nonce_dir, 'blocks.txt'), block_size=NONCE_BLOCK_SIZE)
+    order = {'symbol': 'ethusd', 'amount': '0.0123', 'price': '915.39', 'side': 'buy', 'type': 'exchange limit'}
+
+    def signed(allocator: NonceAllocator, url: str, payload: dict=None):
+        def sign():
+            api.nonce_allocator = allocator
+            api.base_headers(url, dict(payload) if payload else None)
+        return sign
+
+    return {
+        'nonce fsync each': lambda: per_request.allocate(),
+        'nonce blocks': lambda: blocks.allocate(),
+        'headers status': signed(blocks, '/order/status', {'order_id': 44375901}),
+        'headers new order': signed(blocks, '/order/new', order),
+        'headers fsync each': signed(per_request, '/order/new', order),
+    }
+
+
+def run(number: int=2000) -> dict:
+    """{case: seconds} for `number` runs of each case"""
+    default_allocator = api.nonce_allocator
+    try:
+        with tempfile.TemporaryDirectory() as nonce_dir:
+            return {name: timeit(case, number=number) for name, case in cases(nonce_dir).items()}
+    finally:
+        api.nonce_allocator = default_allocator
+
+
+if __name__ == '__main__':
+    number = 2000
+    print(f'{"case":<22}{"total":>10}{"per call":>12}{"calls/s":>12}')
+    for name, seconds in run(number).items():
+        print(f'{name:<22}{seconds:>9.4f}s{seconds / number * 1e6:>10.1f}us{number / seconds:>12.0f}')
@@ -0,0 +1,86 @@
+"""
+Cold start benchmark: recovering a bot's order state after a long run
+
+Builds a synthetic history of closed buy/sell pairs (plus a few active
+orders) in a temp dir, then times everything ThresholdBot.start() does with
+it before it can trade: loading the orders, totalling the P&L ledger, and
+indexing the active orders' sell triggers.  Compares the JSON snapshots
+against the binary snapshot (snapshot.py) that replaced them, each followed
+by a short journal.
+
+Usage:
+    python3 -m benchmarks.startup              # 1M closed orders
+    python3 -m benchmarks.startup 100000
+"""
+
+import os
+import sys
+import json
+import tempfile
+
+from time import perf_counter
+
+from benchmarks.order import order_json
+from data import OrderJournal, load_active_orders, load_closed_orders
+from snapshot import write_snapshot
+from ledger import PnLLedger
+from triggers import SellTriggers
+
+COLD_START_TARGET = 1.0     # seconds to be ready to trade after a restart with 1M closed orders
+ACTIVE_ORDERS = 5
+JOURNAL_CLOSES = 1000       # pairs closed since the last snapshot, replayed from the journal
+
+
+def write_history(path: str, n: int) -> None:
+    """n closed pairs & ACTIVE_ORDERS active orders as JSON snapshots, like the bot used to save them"""
+    with open(os.path.join(path, 'closed-orders.json'), 'w', encoding='utf-8') as f:
+        for i in range(n):
+            buy = order_json(2 * i)
+            sell = {**order_json(2 * i + 1), 'side': 'sell', 'price': '920.00', 'avg_execution_price': '920.00'}
+            f.write(f'{json.dumps(buy)}->{json.dumps(sell)}\n')
+    with open(os.path.join(path, 'active-orders.json'), 'w', encoding='utf-8') as f:
+        for i in range(ACTIVE_ORDERS):
+            f.write(f'{json.dumps(order_json(2 * n + i))}\n')
+
+
+def write_journal(path: str, n: int) -> None:
+    """JOURNAL_CLOSES more closed pairs, appended to the journal after the snapshot"""
+    with open(os.path.join(path, 'orders-journal.jsonl'), 'w', encoding='utf-8') as f:
+        for i in range(2 * n + ACTIVE_ORDERS, 2 * n + ACTIVE_ORDERS + 2 * JOURNAL_CLOSES, 2):
+            sell = {**order_json(i + 1), 'side': 'sell', 'price': '920.00'}
+            f.write(f'{json.dumps({"op": "close", "buy": order_json(i), "sell": sell})}\n')
+
+
+def start(path: str) -> float:
+    """seconds to recover the state in path the way ThresholdBot.start() does"""
+    started = perf_counter()
+    journal = OrderJournal(path)
+    active_orders, closed_orders = journal.load()
+    PnLLedger().load('ethusd', closed_orders)
+    SellTriggers(active_orders.values())
+    elapsed = perf_counter() - started
+    journal.close()
+    return elapsed
+
+
+def run(n: int=1_000_000) -> dict:
+    """{case: seconds} for a cold start from each snapshot format"""
+    with tempfile.TemporaryDirectory() as json_dir, tempfile.TemporaryDirectory() as binary_dir:
+        write_history(json_dir, n)
+        write_snapshot(binary_dir, load_active_orders(json_dir), load_closed_orders(json_dir))
+        write_journal(json_dir, n)
+        write_journal(binary_dir, n)
+        return {
+            f'json {n}': start(json_dir),
+            f'binary {n}': start(binary_dir),
+        }
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    results = run(n)
+    for name, seconds in results.items():
+        print(f'{name:<18}{seconds:>11.3f}s')
+    binary = results[f'binary {n}']
+    target = COLD_START_TARGET * n / 1_000_000
+    print(f'speedup {results[f"json {n}"] / binary:.1f}x, target {target:.3f}s: {"ok" if binary <= target else "MISSED"}')
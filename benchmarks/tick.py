@@ -0,0 +1,84 @@
+"""
+End-to-end tick latency against the local mock exchange
+
+Runs the runloop's body (poll the ticker, then ThresholdBot.tick(): refresh
+the active orders, buy, sell, persist) over HTTP against mock_exchange.py,
+moving the price between ticks so orders keep filling and selling.  Active
+orders are polled rather than pushed, so each tick's cost grows with
+MAX_ACTIVE_ORDERS, which is varied across runs.  The bot runs in a temp data
+dir, with a temp nonce file, so the real bot state is never touched.
+
+Usage:
+    python3 -m benchmarks.tick              # MAX_ACTIVE_ORDERS of 1, 5, 20 & 50
+    python3 -m benchmarks.tick 5 100
+"""
+
+import io
+import os
+import sys
+import random
+import tempfile
+import contextlib
+
+from time import perf_counter
+from decimal import Decimal
+from statistics import mean, median
+from typing import Dict, Iterable, List
+
+import gemini_api as api
+from nonces import NonceAllocator
+from mock_exchange import MockExchange
+from example import ThresholdBot, poll_price
+
+ACTIVE_ORDERS = (1, 5, 20, 50)
+TICKS = 200
+STEP = Decimal('0.004')     # max price move between ticks, enough to trigger sells at the default gain/loss ratios
+
+
+def tick_latencies(exchange: MockExchange, max_active_orders: int, ticks: int=TICKS, seed: int=0) -> List[float]:
+    """seconds each of `ticks` runloop ticks took"""
+    prices = random.Random(seed)
+    random.seed(seed)       # the order amounts
+    price = Decimal('915.39')
+    exchange.trade(price)
+    latencies = []
+    with tempfile.TemporaryDirectory() as data_dir, contextlib.redirect_stdout(io.StringIO()):
+        bot = ThresholdBot('ethusd', data_dir=data_dir, use_order_events=False,
+                           max_active_orders=max_active_orders).start()
+        try:
+            for _ in range(ticks):
+                started = perf_counter()
+                bot.tick(poll_price(bot))
+                latencies.append(perf_counter() - started)
+                price = round(price * (1 + STEP * Decimal(prices.uniform(-1, 1))), 2)
+                exchange.trade(price)
+        finally:
+            bot.stop()
+    return latencies
+
+
+def run(active_orders: Iterable[int]=ACTIVE_ORDERS, ticks: int=TICKS) -> Dict[str, float]:
+    """{case: seconds} of the mean, median & p99 tick latency at each MAX_ACTIVE_ORDERS"""
+    default_client, default_allocator = api.client, api.nonce_allocator
+    exchange = MockExchange('ethusd').start()
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as nonce_dir:
+            api.client = api.GeminiClient(exchange.url, ws_url=exchange.ws_url, rate_limit=False)
+            api.nonce_allocator = NonceAllocator(os.path.join(nonce_dir, '.last_nonce.txt'))
+            for n in active_orders:
+                latencies = sorted(tick_latencies(exchange, n, ticks))
+                results[f'mean {n} orders'] = mean(latencies)
+                results[f'p50 {n} orders'] = median(latencies)
+                results[f'p99 {n} orders'] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            api.client.close()
+    finally:
+        api.client, api.nonce_allocator = default_client, default_allocator
+        exchange.stop()
+    return results
+
+
+if __name__ == '__main__':
+    active_orders = [int(arg) for arg in sys.argv[1:]] or ACTIVE_ORDERS
+    for name, seconds in run(active_orders).items():
+        print(f'{name:<18}{seconds * 1000:>10.2f}ms')
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Multi-resolution OHLCV candles aggregated from the price feed as it arrives
+
+Every price is added to the current 1s, 1m, 5m, 1h & 1d candle of its symbol.
+When a candle's period ends it moves into a fixed-size in-memory ring buffer
+of the latest CANDLE_BUFFER_SIZE candles for that resolution, and is
+appended to DATA_DIR/<symbol>/candles/<resolution>.i64 with the next flush.
+Each file is rows of 6 little-endian int64s, scaled like the price store:
+
+    start_ms, open, high, low, close, volume
+
+Querying the last n candles reads the ring buffer, and only seeks back into
+the file for whatever's older, so it's O(n) no matter how long the history is:
+
+    candles = symbol_candles('data/ethusd', 'ethusd')
+    candles.append(timestamp_ms, price, volume)
+    candles.last('5m', 12)      # [(start_ms, open, high, low, close, volume), ...] oldest first, as Decimals
+
+A candle's volume is the sum of its trades' sizes, polled prices add 0 to it
+since the ticker only has the rolling 24h volume.  Periods without any
+trades don't get a candle.  The open candles aren't saved, catch_up()
+rebuilds them from the price store on startup.
+
+Usage:
+    ./candles.py backfill data/ethusd      # rebuild all the candles from the price store in one pass
+    ./candles.py last data/ethusd 1h 24    # print the last 24 hourly candles
+"""
+
+import os
+import sys
+import json
+
+from time import time
+from array import array
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+from symbols import currency_pair_by_symbol
+from price_store import PriceStore, symbol_store
+from settings import CANDLE_BUFFER_SIZE, PRICE_STORE_FLUSH_INTERVAL
+
+RESOLUTIONS = {
+    '1s': 1000,
+    '1m': 60 * 1000,
+    '5m': 5 * 60 * 1000,
+    '1h': 60 * 60 * 1000,
+    '1d': 24 * 60 * 60 * 1000,
+}
+FIELDS = ('start_ms', 'open', 'high', 'low', 'close', 'volume')
+ROW_SIZE = len(FIELDS) * 8
+BACKFILL_CHUNK_SIZE = 1 << 20   # price store rows aggregated at a time when backfilling
+
+Candle = Tuple[int, int, int, int, int, int]
+
+
+class CandleSeries:
+    """OHLCV candles of one resolution: the open candle, a ring buffer of the latest closed ones, and their file"""
+
+    def __init__(self, path: str, resolution_ms: int, capacity: int=CANDLE_BUFFER_SIZE) -> None:
+        self.path = path
+        self.resolution_ms = resolution_ms
+        self.capacity = capacity
+        self.ring = array('q', bytes(ROW_SIZE * capacity))     # capacity rows of FIELDS
+        self.count = 0          # closed candles in the ring
+        self.pos = 0            # row the next closed candle goes in
+        self.pending = 0        # newest closed candles in the ring that haven't been flushed yet
+        self.current: Optional[List[int]] = None                # the open candle
+        self.flushed = self.repair()                            # rows in the file
+        self.last_start = self.read_rows(self.flushed - 1, self.flushed)[0][0] if self.flushed else -1
+
+    def repair(self) -> int:
+        """truncate a row torn by a crash mid-flush, returns the number of complete rows"""
+        if not os.path.exists(self.path):
+            return 0
+        size = os.path.getsize(self.path)
+        if size % ROW_SIZE:
+            with open(self.path, 'ab') as f:
+                f.truncate(size - size % ROW_SIZE)
+        return size // ROW_SIZE
+
+    ### Writing
+
+    def add(self, timestamp_ms: int, price: int, volume: int) -> None:
+        """add a trade or price, in scaled int units"""
+        start = timestamp_ms - timestamp_ms % self.resolution_ms
+        current = self.current
+        if current is not None and start == current[0]:
+            if price > current[2]:
+                current[2] = price
+            elif price < current[3]:
+                current[3] = price
+            current[4] = price
+            current[5] += volume
+        elif start > self.last_start:
+            if current is not None:
+                self.close_candle()
+            self.current = [start, price, price, price, price, volume]
+            self.last_start = start
+        # else it's older than a candle that's already closed, so it's dropped
+
+    def add_many(self, timestamps: 'np.ndarray', prices: 'np.ndarray', volumes: 'np.ndarray') -> None:
+        """add a chunk of sorted rows at once, e.g. from the price store, with NumPy"""
+        import numpy as np
+
+        starts = timestamps - timestamps % self.resolution_ms
+        # rows for the open candle are added to it, anything older than that was already closed
+        keep = starts >= self.current[0] if self.current else starts > self.last_start
+        starts, prices, volumes = starts[keep], prices[keep], volumes[keep]
+        if not len(starts):
+            return
+
+        # the first row of each candle in the chunk, then OHLCV of each one in a single pass per field
+        firsts = np.flatnonzero(np.r_[True, starts[1:] != starts[:-1]])
+        lasts = np.r_[firsts[1:], len(starts)] - 1
+        candles = zip(
+            starts[firsts].tolist(),
+            prices[firsts].tolist(),
+            np.maximum.reduceat(prices, firsts).tolist(),
+            np.minimum.reduceat(prices, firsts).tolist(),
+            prices[lasts].tolist(),
+            np.add.reduceat(volumes, firsts).tolist(),
+        )
+        for start, open_, high, low, close, volume in candles:
+            current = self.current
+            if current is not None and start == current[0]:
+                # continues the candle that was open before this chunk
+                current[2], current[3] = max(current[2], high), min(current[3], low)
+                current[4] = close
+                current[5] += volume
+                continue
+            if current is not None:
+                self.close_candle()
+            self.current = [start, open_, high, low, close, volume]
+            self.last_start = start
+
+    def close_candle(self) -> None:
+        i = self.pos * len(FIELDS)
+        self.ring[i:i + len(FIELDS)] = array('q', self.current)
+        self.pos = (self.pos + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.pending += 1
+        self.current = None
+        if self.pending == self.capacity:
+            # about to overwrite candles that were never written out
+            self.flush()
+
+    def flush(self) -> None:
+        """append the closed candles that aren't in the file yet"""
+        if not self.pending:
+            return
+        rows = self.ring_rows(self.pending)
+        out = array('q', (value for row in rows for value in row))
+        if sys.byteorder != 'little':
+            out.byteswap()
+        with open(self.path, 'ab') as f:
+            out.tofile(f)
+        self.flushed += self.pending
+        self.pending = 0
+
+    ### Reading
+
+    def ring_rows(self, n: int) -> List[Candle]:
+        """the newest n closed candles in the ring, oldest first"""
+        n = min(n, self.count)
+        rows = []
+        for k in range(n, 0, -1):
+            i = (self.pos - k) % self.capacity * len(FIELDS)
+            rows.append(tuple(self.ring[i:i + len(FIELDS)]))
+        return rows
+
+    def read_rows(self, start: int, end: int) -> List[Candle]:
+        """rows [start, end) of the file"""
+        if end <= start:
+            return []
+        values = array('q')
+        with open(self.path, 'rb') as f:
+            f.seek(start * ROW_SIZE)
+            values.frombytes(f.read((end - start) * ROW_SIZE))
+        if sys.byteorder != 'little':
+            values.byteswap()
+        return [tuple(values[i:i + len(FIELDS)]) for i in range(0, len(values), len(FIELDS))]
+
+    def last(self, n: int, include_open: bool=True) -> List[Candle]:
+        """the last n candles oldest first, optionally ending with the one that's still open"""
+        if n <= 0:
+            return []
+        rows = [tuple(self.current)] if include_open and self.current is not None else []
+        n -= len(rows)
+        from_ring = self.ring_rows(n)
+        # the ring's flushed candles are also the last rows of the file, anything older is read from there
+        in_file = self.flushed - (len(from_ring) - min(self.pending, len(from_ring)))
+        older = self.read_rows(max(0, in_file - (n - len(from_ring))), in_file) if n > len(from_ring) else []
+        return older + from_ring + rows
+
+    def reset(self) -> None:
+        """delete all the candles, e.g. before a backfill"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.count = self.pos = self.pending = self.flushed = 0
+        self.current = None
+        self.last_start = -1
+
+
+class CandleAggregator:
+    """OHLCV candles at every resolution in RESOLUTIONS, updated from each price"""
+
+    def __init__(self, path: str, price_decimals: int=2, volume_decimals: int=2,
+                       capacity: int=CANDLE_BUFFER_SIZE, flush_interval: float=PRICE_STORE_FLUSH_INTERVAL) -> None:
+        self.path = path
+        self.flush_interval = flush_interval
+        self.last_flush = time()
+        os.makedirs(path, exist_ok=True)
+
+        # the scale of the stored ints is fixed when the candles are first created
+        meta_path = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        else:
+            meta = {'price_decimals': price_decimals, 'volume_decimals': volume_decimals}
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+        self.price_decimals = meta['price_decimals']
+        self.volume_decimals = meta['volume_decimals']
+
+        self.series: Dict[str, CandleSeries] = {
+            name: CandleSeries(os.path.join(path, f'{name}.i64'), resolution_ms, capacity)
+            for name, resolution_ms in RESOLUTIONS.items()
+        }
+
+    def append(self, timestamp_ms: int, price: Decimal, volume: Decimal=Decimal(0)) -> None:
+        """add a price to the open candle of every resolution"""
+        price_units = round(Decimal(price).scaleb(self.price_decimals))
+        volume_units = round(Decimal(volume).scaleb(self.volume_decimals))
+        for series in self.series.values():
+            series.add(timestamp_ms, price_units, volume_units)
+        if time() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        self.last_flush = time()
+        for series in self.series.values():
+            series.flush()
+
+    def close(self) -> None:
+        self.flush()
+
+    def last(self, resolution: str, n: int, include_open: bool=True) -> List[Tuple]:
+        """the last n candles of a resolution (e.g. '5m'), oldest first, with the prices & volumes as Decimals"""
+        return [
+            (start_ms, *(Decimal(value).scaleb(-self.price_decimals) for value in (open_, high, low, close)),
+             Decimal(volume).scaleb(-self.volume_decimals))
+            for start_ms, open_, high, low, close, volume in self.series[resolution].last(n, include_open)
+        ]
+
+    def catch_up(self, store: PriceStore, chunk_size: int=BACKFILL_CHUNK_SIZE) -> int:
+        """add the prices in a store that came after each resolution's last saved candle, in one streaming pass
+
+        Open candles aren't saved, so this rebuilds them on startup from the
+        price store, along with any candles missed while the bot was stopped.
+        Returns the number of rows read.
+        """
+        assert (store.price_decimals, store.volume_decimals) == (self.price_decimals, self.volume_decimals), \
+            'The price store and candles must be scaled the same way'
+
+        store.flush()
+        start_ms = min(
+            series.last_start + series.resolution_ms if series.last_start >= 0 else 0
+            for series in self.series.values()
+        )
+        timestamps, prices, volumes = store.read(start_ms)
+        for start in range(0, len(timestamps), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            for series in self.series.values():
+                series.add_many(timestamps[chunk], prices[chunk], volumes[chunk])
+        self.flush()
+        return len(timestamps)
+
+    def backfill(self, store: PriceStore, chunk_size: int=BACKFILL_CHUNK_SIZE) -> int:
+        """rebuild every resolution's candles from all of a price store, returns the rows read"""
+        for series in self.series.values():
+            series.reset()
+        return self.catch_up(store, chunk_size)
+
+
+def symbol_candles(data_dir: str, symbol: str) -> CandleAggregator:
+    """the candles in a symbol's data dir, scaled to its currencies' decimal places like its price store"""
+    A, B = currency_pair_by_symbol[symbol]  # 'ethusd' => (ETH, USD)
+    return CandleAggregator(os.path.join(data_dir, 'candles'), B.decimal_places, A.decimal_places)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3 or sys.argv[1] not in ('backfill', 'last'):
+        print(__doc__)
+        raise SystemExit(1)
+
+    data_dir = sys.argv[2]
+    symbol = os.path.basename(os.path.normpath(data_dir))
+    candles = symbol_candles(data_dir, symbol)
+    if sys.argv[1] == 'backfill':
+        started = time()
+        count = candles.backfill(symbol_store(data_dir, symbol))
+        print(f'[√] Rebuilt the candles in {candles.path} from {count} prices in {time() - started:.2f}s')
+    else:
+        resolution, n = sys.argv[3], int(sys.argv[4]) if len(sys.argv) > 4 else 20
+        for start_ms, open_, high, low, close, volume in candles.last(resolution, n):
+            print(f'{start_ms}   O: {open_}   H: {high}   L: {low}   C: {close}   V: {volume}')
@@ -1,11 +1,18 @@
 import os
 import json
+import threading
 
+from time import time
 from datetime import datetime
 from decimal import Decimal
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
 
 from symbols import Order, Currency
-from gemini_api import order_status
+from snapshot import read_snapshot, write_snapshot
+from indicators import Indicators
+from gemini_api import order_status, new_order, new_client_order_id, find_order
+from settings import JOURNAL_FSYNC_INTERVAL, JOURNAL_COMPACT_AFTER, MAX_CONCURRENT_REQUESTS
 
 ### Logging & Persistence
 
@@ -26,13 +33,49 @@ def load_active_orders(path: str) -> dict:
         for line in f:
             order = Order(json.loads(line.strip()))
             active_orders[order.id] = order
-            print(f' - {order.id}: {order}')
     return active_orders
 
+def atomic_write_lines(path: str, lines: Iterable[str]) -> None:
+    """write a file via a temp file & rename, so a crash never leaves it half-written"""
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for line in lines:
+            f.write(f'{line}\n')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def read_jsonl_log(path: str) -> Iterator[dict]:
+    """the records of an append-only jsonl log, cutting off a write torn by a crash at its tail
+
+    The file is truncated after the last complete line, so the next record
+    appended starts on a fresh line instead of being glued onto the torn one.
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb+') as f:
+        good = 0
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            try:
+                record = json.loads(line)
+            except json.decoder.JSONDecodeError:
+                break
+            good += len(line)
+            yield record
+        size = os.fstat(f.fileno()).st_size
+        if size > good:
+            print(f'[!] Dropping {size - good} bytes torn by a crash from the end of {path}')
+            f.truncate(good)
+            f.flush()
+            os.fsync(f.fileno())
+
 def save_active_orders(path: str, orders: dict) -> None:
-    with open(os.path.join(path, 'active-orders.json'), 'w', encoding='utf-8') as f:
-        for order in orders.values():
-            f.write(f'{json.dumps(order.data)}\n')
+    atomic_write_lines(
+        os.path.join(path, 'active-orders.json'),
+        (json.dumps(order.data) for order in orders.values()),
+    )
 
 
 def load_closed_orders(path: str) -> dict:
@@ -46,11 +89,242 @@ def load_closed_orders(path: str) -> dict:
                 'buy': buy_order,
                 'sell': sell_order,
             }
-            print(f' - {sell_order.id}: {sell_order}')
     return closed_orders
 
 def save_closed_orders(path: str, orders: dict) -> None:
-    with open(os.path.join(path, 'closed-orders.json'), 'w', encoding='utf-8') as f:
-        for buy_id, pair in orders.items():
-            buy_order, sell_order = pair['buy'], pair['sell']
-            f.write(f'{json.dumps(buy_order.data)}->{json.dumps(sell_order.data)}\n')
+    atomic_write_lines(
+        os.path.join(path, 'closed-orders.json'),
+        (f'{json.dumps(pair["buy"].data)}->{json.dumps(pair["sell"].data)}' for pair in orders.values()),
+    )
+
+def save_indicators(path: str, indicators: Indicators) -> None:
+    atomic_write_lines(os.path.join(path, 'indicators.json'), [json.dumps(indicators.state())])
+
+def load_indicators(path: str, indicators: Indicators) -> Indicators:
+    """restore the indicators' state from their last checkpoint in path, if there is one"""
+    try:
+        with open(os.path.join(path, 'indicators.json'), 'r', encoding='utf-8') as f:
+            indicators.restore(json.load(f))
+    except FileNotFoundError:
+        pass
+    return indicators
+
+
+def load_snapshot(path: str) -> Tuple[Dict[str, Order], Dict[str, dict]]:
+    """(active_orders, closed_orders) from the binary snapshot, or the older json ones if there isn't one yet"""
+    snapshot = read_snapshot(path)
+    if snapshot is not None:
+        return snapshot
+    # data dirs from before the binary snapshot, it's written the next time state is saved
+    active_orders, closed_orders = {}, {}
+    if os.path.exists(os.path.join(path, 'active-orders.json')):
+        active_orders = load_active_orders(path)
+    if os.path.exists(os.path.join(path, 'closed-orders.json')):
+        closed_orders = load_closed_orders(path)
+    return active_orders, closed_orders
+
+
+class OrderJournal:
+    """Append-only log of order state changes on top of the active & closed orders snapshots
+
+    Each line of orders-journal.jsonl holds the full order json after a change
+    (open, update, fill, or close), so replaying it is idempotent.  Recovery
+    loads the last snapshot then replays the journal, and compact() rewrites the
+    snapshot (atomically, see snapshot.py) and empties the journal once it gets long.
+    """
+
+    def __init__(self, path: str, fsync_interval: float=JOURNAL_FSYNC_INTERVAL,
+                       compact_after: int=JOURNAL_COMPACT_AFTER) -> None:
+        self.path = path
+        self.journal_path = os.path.join(path, 'orders-journal.jsonl')
+        self.fsync_interval = fsync_interval
+        self.compact_after = compact_after
+        self.records = 0        # records appended since the last snapshot
+        self.unsynced = 0       # records written but not fsync'd yet
+        self.last_sync = time()
+        self.lock = threading.Lock()
+        self.file = None
+
+    def load(self) -> Tuple[Dict[str, Order], Dict[str, dict]]:
+        """recover (active_orders, closed_orders) from the last snapshot plus the journal"""
+
+        active_orders, closed_orders = load_snapshot(self.path)
+        for record in read_jsonl_log(self.journal_path):
+            self.replay(record, active_orders, closed_orders)
+            self.records += 1
+
+        self.file = open(self.journal_path, 'a', encoding='utf-8')
+        return active_orders, closed_orders
+
+    @staticmethod
+    def replay(record: dict, active_orders: dict, closed_orders: dict) -> None:
+        if record['op'] == 'close':
+            buy_order, sell_order = Order(record['buy']), Order(record['sell'])
+            active_orders.pop(buy_order.id, None)
+            closed_orders[buy_order.id] = {'buy': buy_order, 'sell': sell_order}
+        else:
+            order = Order(record['order'])
+            if order.id not in closed_orders:
+                active_orders[order.id] = order
+
+    def append(self, record: dict) -> None:
+        with self.lock:
+            self.file.write(f'{json.dumps(record)}\n')
+            self.records += 1
+            self.unsynced += 1
+
+    def opened(self, order: Order) -> None:
+        self.append({'op': 'open', 'order': order.data})
+
+    def updated(self, order: Order) -> None:
+        self.append({'op': 'fill' if order.is_filled else 'update', 'order': order.data})
+
+    def closed(self, buy_order: Order, sell_order: Order) -> None:
+        self.append({'op': 'close', 'buy': buy_order.data, 'sell': sell_order.data})
+
+    def commit(self, force: bool=False) -> None:
+        """flush appended records to the OS, and fsync them at most once per fsync_interval"""
+        with self.lock:
+            self.file.flush()
+            if self.unsynced and (force or time() - self.last_sync >= self.fsync_interval):
+                os.fsync(self.file.fileno())
+                self.unsynced = 0
+                self.last_sync = time()
+
+    def compact(self, active_orders: dict, closed_orders: dict, force: bool=False) -> None:
+        """snapshot the current state and empty the journal, once it has compact_after records"""
+        with self.lock:
+            if not (force or self.records >= self.compact_after):
+                return
+            write_snapshot(self.path, active_orders, closed_orders)
+            # only truncate once the snapshot is durable, replaying over it is harmless
+            self.file.close()
+            self.file = open(self.journal_path, 'w', encoding='utf-8')
+            os.fsync(self.file.fileno())
+            self.records = self.unsynced = 0
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.commit(force=True)
+            self.file.close()
+            self.file = None
+
+
+class ClientOrderTable:
+    """Idempotency table of the orders we've asked Gemini to place, by client_order_id
+
+    Each order is written to client-orders.jsonl (and fsync'd) before it's sent,
+    then resolved with Gemini's response.  An order whose response never came,
+    because every retry timed out or the process crashed, stays pending until
+    reconcile() looks it up by its client_order_id, so it's adopted if Gemini
+    got it and dropped if not, but never placed a second time.
+    """
+
+    def __init__(self, path: str, compact_after: int=JOURNAL_COMPACT_AFTER) -> None:
+        self.path = os.path.join(path, 'client-orders.jsonl')
+        self.compact_after = compact_after
+        self.pending: Dict[str, dict] = {}      # {client_order_id: new_order() kwargs} sent without a response
+        self.placed: Dict[str, dict] = {}       # {client_order_id: order status} since the last compaction
+        self.records = 0
+        self.lock = threading.Lock()
+        self.file = None
+
+    def load(self) -> 'ClientOrderTable':
+        for record in read_jsonl_log(self.path):
+            if record['op'] == 'intent':
+                self.pending[record['client_order_id']] = record['order']
+            else:
+                self.pending.pop(record['client_order_id'], None)
+            self.records += 1
+        self.file = open(self.path, 'a', encoding='utf-8')
+        return self
+
+    def append(self, records: Iterable[dict], sync: bool=False) -> None:
+        with self.lock:
+            for record in records:
+                self.file.write(f'{json.dumps(record)}\n')
+                self.records += 1
+            self.file.flush()
+            if sync:
+                os.fsync(self.file.fileno())
+
+    ### Placing Orders
+
+    def record(self, orders: List[dict]) -> List[dict]:
+        """give each order (a dict of new_order() kwargs) a client_order_id and durably record it before it's sent"""
+        orders = [{**order, 'client_order_id': order.get('client_order_id') or new_client_order_id()} for order in orders]
+        unsent = [order for order in orders if order['client_order_id'] not in self.placed]
+        for order in unsent:
+            self.pending[order['client_order_id']] = {key: str(value) for key, value in order.items()}
+        self.append(({
+            'op': 'intent',
+            'client_order_id': order['client_order_id'],
+            'order': self.pending[order['client_order_id']],
+        } for order in unsent), sync=True)
+        return orders
+
+    def resolve(self, client_order_id: str, status: Optional[dict]) -> None:
+        """record gemini's response to an order, or None if gemini never got it"""
+        self.pending.pop(client_order_id, None)
+        if status is not None and 'order_id' in status:
+            self.placed[client_order_id] = status
+            self.append([{'op': 'placed', 'client_order_id': client_order_id, 'order_id': str(status['order_id'])}])
+        else:
+            self.append([{'op': 'failed', 'client_order_id': client_order_id}])
+        self.compact()
+
+    def place(self, orders: List[dict], concurrency: int=MAX_CONCURRENT_REQUESTS) -> List[Optional[dict]]:
+        """place orders concurrently, returning gemini's response to each, or None for any it didn't place"""
+
+        for order in orders:
+            client_order_id = order.get('client_order_id')
+            if client_order_id in self.pending:
+                # sent before without a response, so only send it again if gemini never got it
+                status = find_order(client_order_id)
+                if status is not None:
+                    self.resolve(client_order_id, status)
+
+        orders = self.record(orders)
+        unsent = [order for order in orders if order['client_order_id'] not in self.placed]
+        if unsent:
+            with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(unsent)))) as pool:
+                futures = [(order['client_order_id'], pool.submit(new_order, **order)) for order in unsent]
+                for client_order_id, future in futures:
+                    try:
+                        status = future.result()
+                        self.resolve(client_order_id, status)
+                        if 'order_id' not in status:
+                            print(f'[!] Order {client_order_id} was rejected: {status.get("message")}')
+                    except Exception as e:
+                        print(f'[!] Order {client_order_id} failed ({e}), it will be reconciled later')
+
+        return [self.placed.get(order['client_order_id']) for order in orders]
+
+    def reconcile(self) -> List[dict]:
+        """look up every pending order on gemini, returns the statuses of the ones it received"""
+        found = []
+        for client_order_id in list(self.pending):
+            status = find_order(client_order_id)
+            self.resolve(client_order_id, status)
+            if status is not None:
+                found.append(status)
+        return found
+
+    def compact(self) -> None:
+        """rewrite the table with just the pending orders once it has compact_after records"""
+        with self.lock:
+            if self.records < self.compact_after:
+                return
+            atomic_write_lines(self.path, (
+                json.dumps({'op': 'intent', 'client_order_id': client_order_id, 'order': order})
+                for client_order_id, order in self.pending.items()
+            ))
+            self.file.close()
+            self.file = open(self.path, 'a', encoding='utf-8')
+            self.records = len(self.pending)
+            self.placed.clear()
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
@@ -3,6 +3,7 @@
 Usage:
     pip install -r requirements.txt
     ./example.py ethusd
+    ./example.py ethusd btcusd      # trade several symbols in one process (or: ./example.py all)
 
 Config:
     cp secrets_default.py secrets.py
@@ -15,44 +16,54 @@ MyPy Type-Checing:
 
 import os
 import sys
+import threading
 
-from random import randint
+from typing import Deque, Dict, List, Optional, Tuple
 from datetime import datetime
-from time import sleep
+from collections import deque
+from time import sleep, time
 from decimal import Decimal
 
 import gemini_api as api
-from symbols import USD, Order, currency_pair_by_symbol, currency_art
+from order_stream import OrderEventDispatcher
+from market_data import MarketDataFeed
+from orderbook import OrderBook
+from scheduler import FairScheduler
+from symbols import Currency, Order, currency_pair_by_symbol, currency_art
+from price_store import symbol_store, import_csv
+from candles import symbol_candles
+from strategy import add_percentage, random_order_amt, net_limit_hit, buy_allowed
+from indicators import default_indicators
+from triggers import SellTriggers
+from ledger import PnLLedger, DAY_MS
+from metrics import metrics, start_exporter
+from recorder import Recorder
 from data import (
-    save_price,
     save_order,
-    load_active_orders,
-    load_closed_orders,
-    save_active_orders,
-    save_closed_orders,
+    save_indicators,
+    load_indicators,
+    load_snapshot,
+    OrderJournal,
+    ClientOrderTable,
 )
 from settings import (
     POLL_DELAY,
     SYMBOL,
-    USD_MIN_ORDER_AMT,
-    USD_MAX_ORDER_AMT,
     MAX_LOSS_RATIO,
     MAX_GAIN_RATIO,
     MAX_ACTIVE_ORDERS,
     OVERPAY_RATIO,
-    USD_MAX_NET_GAINS,
-    USD_MAX_NET_LOSS,
+    INDICATOR_CHECKPOINT_INTERVAL,
+    PRICE_FROM_BOOK,
+    USE_ORDER_EVENTS,
+    USE_MARKET_DATA,
+    RECORD_SESSION,
     DATA_DIR,
 )
 
 ### Main
 
-add_percentage = lambda price, ratio: price + (price * ratio)
-net_profit = lambda pair: pair['sell'].filled_amt - pair['buy'].filled_amt
-
-def runloop(symbol: str):
-    """that's right, it's an 84 line function, read it and weep"""
-
+def print_intro(symbol: str) -> None:
     print(currency_art[symbol])
     print(
         f'This bot buys random starting amounts, then sells if the price\n'
@@ -62,105 +73,441 @@ def runloop(symbol: str):
         '====================================================================='
     )
 
-    data_dir = os.path.join(DATA_DIR, symbol)
+def load_orders(data_dir: str, journal: OrderJournal=None) -> Tuple[dict, dict]:
+    """load the (active_orders, closed_orders) saved in data_dir, creating it if needed"""
     if os.path.exists(data_dir):
-        print(f'[i] Loading order data from {data_dir}:')
-        active_orders = load_active_orders(data_dir)
-        closed_orders = load_closed_orders(data_dir)
-        print(f'[√] Loaded {len(active_orders) + len(closed_orders)} orders from {data_dir} ({len(active_orders)} active orders).')
+        print(f'[i] Loading order data from {data_dir}...')
+        started = time()
+        if journal:
+            active_orders, closed_orders = journal.load()
+        else:
+            active_orders, closed_orders = load_snapshot(data_dir)
+        print(
+            f'[√] Loaded {len(active_orders) + len(closed_orders)} orders from {data_dir} '
+            f'({len(active_orders)} active orders) in {time() - started:.2f}s.'
+        )
         print('=====================================================================')
     else:
         os.makedirs(data_dir)
-        active_orders = {}
-        closed_orders = {}
-
-    A, B = currency_pair_by_symbol[symbol]  # 'ethusd' => (ETH, USD)
-    net_gains = sum(net_profit(pair) for pair in closed_orders.values())
-
-    while True:
-        now = round(datetime.now().timestamp())
-        ticker_status = api.ticker(symbol)
-        price = B(Decimal(ticker_status['last']))
-        volume = USD(Decimal(ticker_status['volume']['USD']))
-        save_price(data_dir, price)
-        print(f'{now}   Price: {repr(price)}   Volume: {repr(volume)}   Net Gains: {repr(net_gains)}')
-
-        # Update the status of all the active orders
-        for id, order in active_orders.items():
-            if not order.is_filled:
-                active_orders[id] = Order(api.order_status(order.id))
-
-        # Perform the initial buys and add them to active orders
-        while len(active_orders) < MAX_ACTIVE_ORDERS:
-            rand_amt = Decimal(randint(0, 100)/100) * (USD_MAX_ORDER_AMT - USD_MIN_ORDER_AMT)
-            order_amt = USD_MIN_ORDER_AMT + rand_amt
-
-            buy_order = Order(api.new_order(
-                side='buy',
-                symbol=symbol,
-                amt=A(order_amt / price.amt),
-                price=add_percentage(price, OVERPAY_RATIO),
-            ))
-            active_orders[buy_order.id] = buy_order
-            save_order(data_dir, buy_order)
-            print(f'[>] Bought {repr(buy_order.buy_amt)} @ {repr(buy_order.price_amt)}')
-
-        # For each order, sell it if it's gained or lost enough to hit its limit
-        for id, order in active_orders.items():
-            if (price > add_percentage(Decimal(order.price), MAX_GAIN_RATIO) or
-                  price < add_percentage(Decimal(order.price), MAX_LOSS_RATIO)):
-                
-                buy_order = active_orders.pop(id)
-                sell_price = add_percentage(price, -OVERPAY_RATIO)
-                sell_order = Order(api.new_order(
-                    side='sell',
-                    symbol=symbol,
-                    amt=buy_order.buy_amt,
-                    price=sell_price,
-                ))
-
-                closed_orders[id] = {
-                    'buy': buy_order,
-                    'sell': sell_order,
-                }
-                save_order(data_dir, buy_order)
-                direction = 'up' if sell_price > buy_order.price_amt else 'down'
-                print(
-                    f'[<] Sold {repr(buy_order.buy_amt)} @ {repr(sell_price)} {direction} '
-                    f'from {repr(buy_order.price_amt)} for a net profit of: {repr(net_profit(closed_orders[id]))}'
-                )
-                break
+        active_orders, closed_orders = journal.load() if journal else ({}, {})
+    return active_orders, closed_orders
+
+def sell_client_order_id(buy_id: str) -> str:
+    """the client_order_id of the sell that closes a buy, derived from the buy so a resent sell can be found"""
+    return f'{buy_id}-sell'
+
+class ThresholdBot:
+    """The example strategy's orders & logic for a single symbol, driven by price updates"""
+
+    def __init__(self, symbol: str, order_events: OrderEventDispatcher=None, ledger: PnLLedger=None,
+                       data_dir: str=None, use_order_events: bool=USE_ORDER_EVENTS,
+                       max_active_orders: int=MAX_ACTIVE_ORDERS) -> None:
+        self.symbol = symbol
+        self.data_dir = data_dir or os.path.join(DATA_DIR, symbol)
+        self.A, self.B = currency_pair_by_symbol[symbol]  # 'ethusd' => (ETH, USD)
+        self.active_orders: Dict[str, Order] = {}
+        self.closed_orders: Dict[str, dict] = {}
+        self.triggers = SellTriggers()                  # the active orders indexed by their sell prices
+        self.ledger = ledger or PnLLedger()     # can be shared between bots, P&L is kept per symbol
+        self.order_events = order_events        # pass one in to share it between bots, otherwise start() makes one
+        self.owns_order_events = order_events is None
+        self.use_order_events = use_order_events    # otherwise active orders are polled on each refresh
+        self.max_active_orders = max_active_orders
+        self.book: Optional[OrderBook] = None
+        self.journal = OrderJournal(self.data_dir)
+        self.client_orders = ClientOrderTable(self.data_dir)
+        self.prices = None
+        self.candles = None
+        self.volume_24h: Optional[Currency] = None      # the ticker's rolling 24h volume, when prices are polled
+        self.trades: Deque[Tuple[Decimal, Decimal, int]] = deque()     # streamed trades waiting for tick_trades()
+        self.indicators = default_indicators()      # updated from every price, checkpointed by save()
+        self.indicators_saved = time()
+        self.lock = threading.RLock()  # price updates, timers, and order events run on different threads
+
+    def start(self) -> 'ThresholdBot':
+        print_intro(self.symbol)
+        self.active_orders, self.closed_orders = load_orders(self.data_dir, self.journal)
+        self.ledger.load(self.symbol, self.closed_orders)
+        self.triggers = SellTriggers(self.active_orders.values())
+        self.client_orders.load()
+        load_indicators(self.data_dir, self.indicators)
+
+        self.prices = symbol_store(self.data_dir, self.symbol)
+        csv_path = os.path.join(self.data_dir, 'price-history.csv')
+        if not len(self.prices) and os.path.exists(csv_path):
+            print(f'[i] Importing {csv_path} into {self.prices.path}...')
+            import_csv(csv_path, self.prices)
+
+        # rebuild the open candles, and any that are missing, from the price history
+        self.candles = symbol_candles(self.data_dir, self.symbol)
+        self.candles.catch_up(self.prices)
+
+        # Keep active_orders up-to-date in the background over a single websocket
+        if self.order_events:
+            for order in self.active_orders.values():
+                self.order_events.track(order)
+        elif self.use_order_events:
+            self.order_events = OrderEventDispatcher(
+                self.active_orders,
+                on_event=lambda order, event: self.journal.updated(order),
+            ).start()
+        return self
+
+    def stop(self) -> None:
+        if self.order_events and self.owns_order_events:
+            self.order_events.stop()
+        self.journal.close()
+        self.client_orders.close()
+        save_indicators(self.data_dir, self.indicators)
+        if self.prices:
+            self.prices.close()
+        if self.candles:
+            self.candles.close()
+
+    @property
+    def net_gains(self) -> Currency:
+        return self.ledger.net_gains(self.symbol)
+
+    def tick(self, price: Currency, refresh: bool=True) -> bool:
+        """run the strategy once at the given price, returns False once it should stop trading"""
+        with self.lock, metrics.timer('tick_seconds', symbol=self.symbol):
+            if refresh:
+                with metrics.timer('tick_stage_seconds', symbol=self.symbol, stage='refresh'):
+                    self.refresh_orders()
+            with metrics.timer('tick_stage_seconds', symbol=self.symbol, stage='buys'):
+                self.buy(price)
+            with metrics.timer('tick_stage_seconds', symbol=self.symbol, stage='sells'):
+                self.sell(price)
+            with metrics.timer('tick_stage_seconds', symbol=self.symbol, stage='persistence'):
+                self.save()
+            return not self.hit_net_limit()
+
+    def queue_trade(self, last: Decimal, amount: Decimal, timestampms: int) -> None:
+        """queue a trade from the market data websocket, so its reader thread never waits on the strategy"""
+        self.trades.append((last, amount, timestampms))
+
+    def tick_trades(self) -> bool:
+        """record every queued trade, then run the strategy once at the latest price, returns False once it should stop"""
+        with self.lock:
+            price = None
+            while self.trades:
+                last, amount, timestampms = self.trades.popleft()
+                price = self.B(last)
+                self.record_price(timestampms, price, amount)
+            # order state is pushed by the order events websocket, or polled by the housekeeping if it's down
+            return price is None or self.tick(price, refresh=False)
+
+    def refresh_orders(self) -> None:
+        """update the status of all the active orders, unless they're being pushed to us"""
+        if not (self.order_events and self.order_events.connected.is_set()):
+            for id in api.refresh_orders(self.active_orders):
+                self.journal.updated(self.active_orders[id])
+
+    def limit_price(self, side: str, amt: Currency, price: Currency) -> Currency:
+        """price an order to fill from the live book depth if we have it, otherwise overpay by OVERPAY_RATIO"""
+        if PRICE_FROM_BOOK and self.book and self.book.synced:
+            fill_price = self.book.price_to_fill(side, amt)
+            if fill_price is not None:
+                return self.B(fill_price)
+        return add_percentage(price, OVERPAY_RATIO if side == 'buy' else -OVERPAY_RATIO)
+
+    def buy(self, price: Currency) -> None:
+        """top the active orders back up to max_active_orders with one concurrent batch of buys"""
+
+        # adopt any earlier buys & sells that gemini got, but whose responses were lost
+        sells = {sell_client_order_id(id): id for id in self.active_orders}
+        for status in self.client_orders.reconcile():
+            if status['side'] == 'buy' and str(status['order_id']) not in self.closed_orders:
+                self.opened(Order(status))
+            elif status['side'] == 'sell' and status.get('client_order_id') in sells:
+                self.sold(sells[status['client_order_id']], Order(status))
+
+        if not buy_allowed(self.indicators.values()):
+            return
+
+        orders = []
+        for _ in range(self.max_active_orders - len(self.active_orders)):
+            amt = self.A(random_order_amt() / price.amt)
+            orders.append({
+                'side': 'buy',
+                'symbol': self.symbol,
+                'amt': amt,
+                'price': self.limit_price('buy', amt, price),
+            })
+        if orders:
+            for status in self.client_orders.place(orders):
+                if status is not None:
+                    self.opened(Order(status))
+
+    def opened(self, buy_order: Order) -> None:
+        self.active_orders[buy_order.id] = buy_order
+        self.triggers.add(buy_order)
+        self.journal.opened(buy_order)
+        if self.order_events:
+            self.order_events.track(buy_order)
+        save_order(self.data_dir, buy_order)
+        print(f'[>] Bought {repr(buy_order.buy_amt)} @ {repr(buy_order.price_amt)}')
+
+    def sell(self, price: Currency) -> None:
+        """sell every order that's gained or lost enough at this price to hit its limit, in one concurrent batch"""
+        triggered = [id for id in self.triggers.pop_triggered(price) if id in self.active_orders]
+        if not triggered:
+            return
+
+        # placed through the client order table like the buys, so a sell whose response was lost is never sent twice
+        orders = []
+        for id in triggered:
+            amt = self.active_orders[id].buy_amt
+            orders.append({
+                'side': 'sell',
+                'symbol': self.symbol,
+                'amt': amt,
+                'price': self.limit_price('sell', amt, price),
+                'client_order_id': sell_client_order_id(id),
+            })
+        try:
+            statuses = self.client_orders.place(orders)
+        except Exception:
+            for id in triggered:
+                self.triggers.add(self.active_orders[id])
+            raise
+
+        for id, status in zip(triggered, statuses):
+            if status is None:
+                # keep watching the ones that didn't sell, so the next tick retries them
+                self.triggers.add(self.active_orders[id])
+            else:
+                self.sold(id, Order(status))
+
+    def sold(self, id: str, sell_order: Order) -> None:
+        buy_order = self.active_orders.pop(id)
+        if self.order_events:
+            self.order_events.untrack(id)
+
+        self.closed_orders[id] = {
+            'buy': buy_order,
+            'sell': sell_order,
+        }
+        self.journal.closed(buy_order, sell_order)
+        profit = self.ledger.record(self.symbol, self.closed_orders[id])
+        save_order(self.data_dir, buy_order)
+        sell_price = sell_order.price_amt
+        direction = 'up' if sell_price > buy_order.price_amt else 'down'
+        print(
+            f'[<] Sold {repr(buy_order.buy_amt)} @ {repr(sell_price)} {direction} '
+            f'from {repr(buy_order.price_amt)} for a net profit of: {repr(profit)}'
+        )
 
-        save_active_orders(data_dir, active_orders)
-        save_closed_orders(data_dir, closed_orders)
+    def record_price(self, timestamp_ms: int, price: Currency, volume: Decimal=Decimal(0)) -> None:
+        self.prices.append(timestamp_ms, price.amt, volume)
+        self.candles.append(timestamp_ms, price.amt, volume)
+        self.indicators.update(float(price.amt), float(volume))
 
-        # print(f'Buys:')
-        # print('\n'.join(f'{id}: {order}' for id, order in active_orders.items()))
-        # print(f'Sells:')
-        # print('\n'.join(f'{buy_id}: {pair["sell"]}' for buy_id, pair in closed_orders.items()))
+    def save(self) -> None:
+        """make the journaled order changes durable, compacting the journal once it's long, and checkpoint the indicators"""
+        self.journal.commit()
+        self.journal.compact(self.active_orders, self.closed_orders)
+        if time() - self.indicators_saved >= INDICATOR_CHECKPOINT_INTERVAL:
+            save_indicators(self.data_dir, self.indicators)
+            self.indicators_saved = time()
 
-        # Quit if total net gains or losses hit the limit
-        net_gains = sum(net_profit(pair) for pair in closed_orders.values())
-        if net_gains > USD_MAX_NET_GAINS:
+    def hit_net_limit(self) -> bool:
+        """check if total net gains or losses hit the limit"""
+        limit = net_limit_hit(self.net_gains)
+        if limit == 'gains':
             print('[√] Success! Stopping because net gains > USD_MAX_NET_GAINS')
-            break
-        elif net_gains < USD_MAX_NET_LOSS:
+        elif limit == 'loss':
             print('[X] Failed! Stopping because net gains < USD_MAX_NET_LOSS')
-            break
+        return limit is not None
 
-        # Sleep for the poll delay, optionally sending a heartbeat if it's long
-        if POLL_DELAY > 15:
-            sleep(15)
-            api.heartbeat()
-            sleep(POLL_DELAY - 15)
-        else:
-            sleep(POLL_DELAY)
+
+def poll_price(bot: ThresholdBot) -> Currency:
+    """fetch and record the current price of a bot's symbol from the ticker"""
+    now = round(datetime.now().timestamp())
+    with metrics.timer('tick_stage_seconds', symbol=bot.symbol, stage='ticker'):
+        ticker_status = api.ticker(bot.symbol)
+    price = bot.B(Decimal(ticker_status['last']))
+    volume = bot.B(Decimal(ticker_status['volume'][bot.B.symbol.upper()]))
+    # the ticker's volume is a rolling 24h total, not the size of a trade at this price, so the row's volume is 0
+    bot.volume_24h = bot.A(Decimal(ticker_status['volume'][bot.A.symbol.upper()]))
+    bot.record_price(now * 1000, price)
+    print(f'{now}   {bot.symbol}   Price: {repr(price)}   24h Volume: {repr(volume)}   Net Gains: {repr(bot.net_gains)}')
+    return price
+
+def runloop(symbol: str, poll_delay: float=POLL_DELAY, data_dir: str=None,
+                         use_order_events: bool=USE_ORDER_EVENTS, max_active_orders: int=MAX_ACTIVE_ORDERS):
+    """poll the ticker every poll_delay seconds and run the strategy at each price"""
+
+    bot = ThresholdBot(symbol, data_dir=data_dir, use_order_events=use_order_events,
+                       max_active_orders=max_active_orders).start()
+    heartbeat = api.Heartbeat()
+    heartbeat.start()
+    try:
+        while True:
+            if not bot.tick(poll_price(bot)):
+                break
+
+            sleep(poll_delay)
+    finally:
+        heartbeat.stop()
+        bot.stop()
+
+def streamloop(symbol: str, data_dir: str=None, use_order_events: bool=USE_ORDER_EVENTS,
+                            poll_delay: float=POLL_DELAY, stopped: threading.Event=None):
+    """run the strategy on every trade pushed over the market data websocket, as it happens
+
+    The orders are refreshed & saved every poll_delay seconds, until the strategy stops or `stopped` is set.
+    """
+
+    bot = ThresholdBot(symbol, data_dir=data_dir, use_order_events=use_order_events).start()
+    bot.book = OrderBook(symbol, resync=api.book)
+    stopped = stopped or threading.Event()
+
+    # ticks run on their own thread, so the websocket keeps being read while one waits on the API,
+    # and a strategy error is logged by the scheduler instead of dropping the market data connection
+    scheduler = FairScheduler(workers=1).start()
+
+    def tick() -> None:
+        if not bot.tick_trades():
+            scheduler.pause(symbol)
+            stopped.set()
+
+    def on_trade(last: Decimal, amount: Decimal, timestampms: int) -> None:
+        bot.queue_trade(last, amount, timestampms)
+        # a newer trade replaces a tick that hasn't started yet, so the bot catches up after a slow one
+        scheduler.submit(symbol, 'tick', tick)
+
+    feed = MarketDataFeed(symbol, on_trade=on_trade, on_update=bot.book.handle_update).start()
+    heartbeat = api.Heartbeat()
+    heartbeat.start()
+    try:
+        while not stopped.wait(poll_delay):
+            with bot.lock:
+                bot.refresh_orders()
+                bot.save()
+            now = round(datetime.now().timestamp())
+            price = feed.last_price and bot.B(feed.last_price)
+            print(
+                f'{now}   Price: {repr(price)}   Net Gains: {repr(bot.net_gains)}   '
+                f'Tick Latency: {scheduler.latency.get(symbol, 0) * 1000:.0f}ms'
+            )
+    finally:
+        feed.stop()
+        scheduler.stop()
+        heartbeat.stop()
+        bot.stop()
+
+
+def multiloop(symbols: List[str], data_dir: str=None, use_order_events: bool=USE_ORDER_EVENTS,
+                                  use_market_data: bool=USE_MARKET_DATA, poll_delay: float=POLL_DELAY,
+                                  stopped: threading.Event=None):
+    """trade several symbols in one process, sharing the API connections, nonces, rate limits & order events
+
+    Each bot keeps its files in data_dir/<symbol>, DATA_DIR/<symbol> by default.
+    """
+
+    # one order events websocket for every bot, each event is journaled by the bot that owns the order
+    order_events = OrderEventDispatcher(
+        on_event=lambda order, event: bots[order.symbol].journal.updated(order),
+    ) if use_order_events else None
+    ledger = PnLLedger()
+    bots = {
+        symbol: ThresholdBot(symbol, order_events, ledger, data_dir=data_dir and os.path.join(data_dir, symbol),
+                             use_order_events=use_order_events)
+        for symbol in symbols
+    }
+    for bot in bots.values():
+        bot.start()
+    if order_events:
+        order_events.start()
+
+    # every symbol gets its own lane, and signed requests only wait on each other to be signed & written
+    # (see gemini_api.OrderedSender), so a slow API call for one doesn't delay another's ticks
+    scheduler = FairScheduler(workers=len(symbols)).start()
+    trading = set(symbols)
+    stopped = stopped or threading.Event()
+
+    def tick(bot: ThresholdBot, streamed: bool=False) -> None:
+        if not (bot.tick_trades() if streamed else bot.tick(poll_price(bot))):
+            scheduler.pause(bot.symbol)
+            trading.discard(bot.symbol)
+            if not trading:
+                stopped.set()
+
+    def housekeeping(bot: ThresholdBot) -> None:
+        with bot.lock:
+            bot.refresh_orders()
+            bot.save()
+
+    def on_trade(bot: ThresholdBot):
+        def handle_trade(last: Decimal, amount: Decimal, timestampms: int) -> None:
+            bot.queue_trade(last, amount, timestampms)
+            # a newer trade replaces a tick that hasn't started yet, so a slow symbol catches up
+            scheduler.submit(bot.symbol, 'tick', lambda: tick(bot, streamed=True))
+        return handle_trade
+
+    feeds = []
+    if use_market_data:
+        for bot in bots.values():
+            bot.book = OrderBook(bot.symbol, resync=api.book)
+            feeds.append(MarketDataFeed(bot.symbol, on_trade=on_trade(bot), on_update=bot.book.handle_update).start())
+
+    heartbeat = api.Heartbeat()
+    heartbeat.start()
+    try:
+        while not stopped.is_set():
+            now = round(datetime.now().timestamp())
+            for symbol in list(trading):
+                bot = bots[symbol]
+                if use_market_data:
+                    scheduler.submit(symbol, 'housekeeping', lambda bot=bot: housekeeping(bot))
+                    print(
+                        f'{now}   {symbol}   Net Gains: {repr(bot.net_gains)}   '
+                        f'Tick Latency: {scheduler.latency.get(symbol, 0) * 1000:.0f}ms'
+                    )
+                else:
+                    scheduler.submit(symbol, 'tick', lambda bot=bot: tick(bot))
+            today_ms = now * 1000 - now * 1000 % DAY_MS
+            print(f'{now}   All   Net Gains: {repr(ledger.net_gains())}   Today: {repr(ledger.pnl(today_ms))}')
+            stopped.wait(poll_delay)
+    finally:
+        for feed in feeds:
+            feed.stop()
+        heartbeat.stop()
+        scheduler.stop()
+        if order_events:
+            order_events.stop()
+        for bot in bots.values():
+            bot.stop()
 
 
 if __name__ == '__main__':
-    # e.g. ethusd, btcusd
-    trading_pair_symbol = sys.argv[1] if len(sys.argv) > 1 else SYMBOL
+    # e.g. ethusd, btcusd, or all
+    symbols = sys.argv[1:] or [SYMBOL]
+    if symbols == ['all']:
+        symbols = list(currency_pair_by_symbol)
+    loop = 'multiloop' if len(symbols) > 1 else 'streamloop' if USE_MARKET_DATA else 'runloop'
+    api.claim_nonces()
+    exporter = start_exporter()
+    if RECORD_SESSION:
+        recording = os.path.join(DATA_DIR, 'recordings', f'{"-".join(symbols)}-{round(time())}.rec')
+        api.client.recorder = Recorder(recording)
+        api.client.recorder.record_session(
+            'example', loop, symbols, use_order_events=USE_ORDER_EVENTS, use_market_data=USE_MARKET_DATA,
+        )
+        print(f'[i] Recording API responses to {recording}')
     try:
-        runloop(trading_pair_symbol)
+        if loop == 'multiloop':
+            multiloop(symbols)
+        elif loop == 'streamloop':
+            streamloop(symbols[0])
+        else:
+            runloop(symbols[0])
     except (EOFError, KeyboardInterrupt):
-        print(f'\n[√] Saved active orders to {DATA_DIR}/{trading_pair_symbol}')
+        print(f'\n[√] Saved active orders to {", ".join(f"{DATA_DIR}/{symbol}" for symbol in symbols)}')
+    finally:
+        if exporter:
+            exporter.stop()
+        if api.client.recorder:
+            api.client.recorder.close()
+        api.close()
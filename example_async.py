@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Asyncio variant of example.py, it runs the same threshold strategy but
+refreshes all the active orders with one /orders call, alongside the ticker.
+
+Usage:
+    pip install -r requirements.txt
+    ./example_async.py ethusd
+"""
+
+import os
+import sys
+import asyncio
+
+from time import time, perf_counter
+from datetime import datetime
+from decimal import Decimal
+
+import gemini_api_async as api
+from symbols import USD, Order, currency_pair_by_symbol
+from data import (
+    save_price,
+    save_order,
+    save_indicators,
+    load_indicators,
+    ClientOrderTable,
+)
+from example import print_intro, load_orders, sell_client_order_id
+from strategy import add_percentage, random_order_amt, net_limit_hit, buy_allowed
+from indicators import default_indicators
+from triggers import SellTriggers
+from ledger import PnLLedger
+from snapshot import write_snapshot
+from metrics import metrics, start_exporter
+from recorder import Recorder
+from settings import (
+    POLL_DELAY,
+    RECORD_SESSION,
+    SYMBOL,
+    MAX_ACTIVE_ORDERS,
+    MAX_CONCURRENT_REQUESTS,
+    OVERPAY_RATIO,
+    DATA_DIR,
+)
+
+### Main
+
+async def refresh_orders(active_orders: dict, concurrency: int=MAX_CONCURRENT_REQUESTS) -> None:
+    """update all the unfilled active orders in place with a single /orders call
+
+    Orders missing from it were filled or cancelled since the last refresh, so
+    their statuses are fetched individually, with up to `concurrency` in flight.
+    """
+    unfilled_ids = [id for id, order in active_orders.items() if not order.is_filled]
+    if not unfilled_ids:
+        return
+    live = {str(status['order_id']): status for status in await api.live_orders()}
+    gone_ids = [id for id in unfilled_ids if str(active_orders[id].order_id) not in live]
+    gone = dict(zip(gone_ids, await api.order_statuses(gone_ids, concurrency=concurrency)))
+    for id in unfilled_ids:
+        active_orders[id] = Order(gone[id] if id in gone else live[str(active_orders[id].order_id)])
+
+async def timed(awaitable, symbol: str, stage: str):
+    """await something, timing it as one stage of the tick"""
+    with metrics.timer('tick_stage_seconds', symbol=symbol, stage=stage):
+        return await awaitable
+
+def lap(started: float, symbol: str, stage: str) -> float:
+    """record the time since `started` as one stage of the tick, returns the time now"""
+    now = perf_counter()
+    metrics.observe('tick_stage_seconds', now - started, symbol=symbol, stage=stage)
+    return now
+
+async def runloop(symbol: str, poll_delay: float=POLL_DELAY, data_dir: str=None):
+    """same as example.runloop, but a tick costs one round-trip for any number of active orders"""
+
+    print_intro(symbol)
+    data_dir = data_dir or os.path.join(DATA_DIR, symbol)
+    active_orders, closed_orders = load_orders(data_dir)
+
+    A, B = currency_pair_by_symbol[symbol]  # 'ethusd' => (ETH, USD)
+    ledger = PnLLedger()
+    ledger.load(symbol, closed_orders)
+    triggers = SellTriggers(active_orders.values())
+    client_orders = ClientOrderTable(data_dir).load()
+    indicators = load_indicators(data_dir, default_indicators())
+
+    while True:
+        now = round(datetime.now().timestamp())
+        tick_started = perf_counter()
+
+        # Fetch the price while the active orders are being refreshed
+        ticker_status, _ = await asyncio.gather(
+            timed(api.ticker(symbol), symbol, 'ticker'),
+            timed(refresh_orders(active_orders), symbol, 'refresh'),
+        )
+        price = B(Decimal(ticker_status['last']))
+        volume = USD(Decimal(ticker_status['volume']['USD']))
+        save_price(data_dir, price)
+        # the ticker only has the rolling 24h volume, not this price's trade size, so VWAP is left out when polling
+        indicators.update(float(price.amt), 0.0)
+        print(f'{now}   Price: {repr(price)}   24h Volume: {repr(volume)}   Net Gains: {repr(ledger.net_gains(symbol))}')
+
+        # Adopt any earlier buys & sells that gemini got, but whose responses were lost
+        started = perf_counter()
+        statuses = []
+        sells = {sell_client_order_id(id): id for id in active_orders}
+        sold = []
+        for client_order_id in list(client_orders.pending):
+            status = await api.find_order(client_order_id)
+            client_orders.resolve(client_order_id, status)
+            if status is None:
+                continue
+            if status['side'] == 'buy' and str(status['order_id']) not in closed_orders:
+                statuses.append(status)
+            elif status['side'] == 'sell' and client_order_id in sells:
+                sold.append((sells[client_order_id], status))
+
+        # Top the active orders back up with one concurrent batch of buys
+        orders = client_orders.record([
+            {
+                'side': 'buy',
+                'symbol': symbol,
+                'amt': A(random_order_amt() / price.amt),
+                'price': add_percentage(price, OVERPAY_RATIO),
+            }
+            for _ in range(MAX_ACTIVE_ORDERS - len(active_orders) - len(statuses))
+            if buy_allowed(indicators.values())
+        ])
+        for order, status in zip(orders, await api.new_orders(orders)):
+            client_order_id = order['client_order_id']
+            if isinstance(status, Exception):
+                # left pending, so the next tick looks it up before placing anything new
+                print(f'[!] Order {client_order_id} failed ({status}), it will be reconciled later')
+                continue
+            client_orders.resolve(client_order_id, status)
+            if 'order_id' in status:
+                statuses.append(status)
+            else:
+                print(f'[!] Order {client_order_id} was rejected: {status.get("message")}')
+
+        for status in statuses:
+            buy_order = Order(status)
+            active_orders[buy_order.id] = buy_order
+            triggers.add(buy_order)
+            save_order(data_dir, buy_order)
+            print(f'[>] Bought {repr(buy_order.buy_amt)} @ {repr(buy_order.price_amt)}')
+
+        # Sell every order that's gained or lost enough to hit its limit, through the client
+        # order table like the buys, so a sell whose response was lost is never sent twice
+        started = lap(started, symbol, 'buys')
+        sold_ids = {id for id, _ in sold}
+        triggered = [id for id in triggers.pop_triggered(price) if id in active_orders and id not in sold_ids]
+        orders = client_orders.record([
+            {
+                'side': 'sell',
+                'symbol': symbol,
+                'amt': active_orders[id].buy_amt,
+                'price': add_percentage(price, -OVERPAY_RATIO),
+                'client_order_id': sell_client_order_id(id),
+            }
+            for id in triggered
+        ])
+        for id, order, status in zip(triggered, orders, await api.new_orders(orders)):
+            client_order_id = order['client_order_id']
+            if isinstance(status, Exception):
+                print(f'[!] Order {client_order_id} failed ({status}), it will be reconciled later')
+            else:
+                client_orders.resolve(client_order_id, status)
+                if 'order_id' in status:
+                    sold.append((id, status))
+                    continue
+                print(f'[!] Order {client_order_id} was rejected: {status.get("message")}')
+            # keep watching the ones that didn't sell, so the next tick retries them
+            triggers.add(active_orders[id])
+
+        for id, status in sold:
+            buy_order = active_orders.pop(id)
+            sell_order = Order(status)
+            sell_price = sell_order.price_amt
+            closed_orders[id] = {
+                'buy': buy_order,
+                'sell': sell_order,
+            }
+            profit = ledger.record(symbol, closed_orders[id])
+            save_order(data_dir, buy_order)
+            direction = 'up' if sell_price > buy_order.price_amt else 'down'
+            print(
+                f'[<] Sold {repr(buy_order.buy_amt)} @ {repr(sell_price)} {direction} '
+                f'from {repr(buy_order.price_amt)} for a net profit of: {repr(profit)}'
+            )
+
+        started = lap(started, symbol, 'sells')
+        write_snapshot(data_dir, active_orders, closed_orders)
+        save_indicators(data_dir, indicators)
+        lap(started, symbol, 'persistence')
+        metrics.observe('tick_seconds', perf_counter() - tick_started, symbol=symbol)
+
+        # Quit if total net gains or losses hit the limit
+        limit = net_limit_hit(ledger.net_gains(symbol))
+        if limit == 'gains':
+            print('[√] Success! Stopping because net gains > USD_MAX_NET_GAINS')
+            break
+        elif limit == 'loss':
+            print('[X] Failed! Stopping because net gains < USD_MAX_NET_LOSS')
+            break
+
+        # Sleep for the poll delay, optionally sending a heartbeat if it's long
+        if poll_delay > 15:
+            await asyncio.sleep(15)
+            await api.heartbeat()
+            await asyncio.sleep(poll_delay - 15)
+        else:
+            await asyncio.sleep(poll_delay)
+
+
+async def main(symbol: str):
+    api.claim_nonces()
+    exporter = start_exporter()
+    if RECORD_SESSION:
+        recording = os.path.join(DATA_DIR, 'recordings', f'{symbol}-{round(time())}.rec')
+        api.client.recorder = Recorder(recording)
+        api.client.recorder.record_session('example_async', 'runloop', [symbol])
+        print(f'[i] Recording API responses to {recording}')
+    try:
+        await runloop(symbol)
+    finally:
+        if exporter:
+            exporter.stop()
+        await api.close()
+        if api.client.recorder:
+            api.client.recorder.close()
+
+
+if __name__ == '__main__':
+    # e.g. ethusd, btcusd
+    trading_pair_symbol = sys.argv[1] if len(sys.argv) > 1 else SYMBOL
+    try:
+        asyncio.run(main(trading_pair_symbol))
+    except (EOFError, KeyboardInterrupt):
+        print(f'\n[√] Saved active orders to {DATA_DIR}/{trading_pair_symbol}')
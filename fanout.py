@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+"""
+Market data fan-out to many strategy worker processes over shared memory
+
+Instead of every bot process polling the ticker and signing its own requests,
+one process of each kind does the shared work:
+
+    feed handler    streams the market data websockets and writes each trade &
+                    top of book change into a shared memory ring buffer
+    gateway         sends every REST request on behalf of the workers, so one
+                    process owns the nonce file & the rate limits
+    workers         any number of strategy processes (e.g. ThresholdBots with
+                    their own data dirs), each reading the ring at its own pace
+
+The ring has one writer and no locks: each slot holds a fixed-size record
+stamped with its sequence number, written last, so a reader can tell a slot
+it's waiting for from one that's been overwritten.  A worker that falls more
+than FANOUT_RING_SIZE updates behind skips ahead to the newest updates and
+counts what it missed, rather than slowing down the feed, e.g.:
+
+    reader = RingReader(ring_name)
+    for update in reader:
+        print(update.symbol, update.price, update.bid, update.ask, reader.missed)
+
+Workers point gemini_api at a GatewayClient, so all the API bindings (and
+everything built on them) go through the gateway unchanged.
+
+Usage:
+    ./fanout.py ethusd                  # FANOUT_WORKERS threshold bots trading ethusd
+    ./fanout.py ethusd btcusd --workers 4
+"""
+
+import os
+import sys
+import signal
+import struct
+import itertools
+import threading
+import multiprocessing as mp
+
+from time import sleep, time
+from uuid import uuid4
+from decimal import Decimal
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from multiprocessing import shared_memory
+
+from metrics import metrics
+from settings import (
+    SYMBOL,
+    DATA_DIR,
+    POLL_DELAY,
+    HTTP_POOL_SIZE,
+    FANOUT_RING_SIZE,
+    FANOUT_WORKERS,
+    FANOUT_POLL_INTERVAL,
+    FANOUT_GATEWAY_TIMEOUT,
+)
+
+MAGIC = b'MDRING01'
+HEADER = struct.Struct('<8sqqq')        # magic, capacity, next sequence number, closed
+SEQ = struct.Struct('<q')
+BODY = struct.Struct('<qB15sqqqq')      # timestamp_ms, kind, symbol, price, amount, bid, ask
+SLOT_SIZE = SEQ.size + BODY.size
+SCALE = 8                               # prices & amounts are stored as ints of 1e-8
+WRITING = -1                            # sequence number of a slot that's being written
+
+# kinds of updates
+TRADE = 1       # price & amount of a trade, with the top of book at the time
+QUOTE = 2       # the best bid or ask changed, with the last trade price
+
+
+class Update(NamedTuple):
+    seq: int
+    timestamp_ms: int
+    kind: int
+    symbol: str
+    price: Optional[Decimal]
+    amount: Optional[Decimal]
+    bid: Optional[Decimal]
+    ask: Optional[Decimal]
+
+
+def to_units(value: Optional[Decimal]) -> int:
+    return 0 if value is None else round(Decimal(value).scaleb(SCALE))
+
+def from_units(units: int) -> Optional[Decimal]:
+    return Decimal(units).scaleb(-SCALE) if units else None
+
+
+### Shared Memory Ring
+
+def create_ring(capacity: int=FANOUT_RING_SIZE) -> shared_memory.SharedMemory:
+    """allocate an empty ring, the process that creates it has to unlink() it once everyone's done"""
+    # named here, SharedMemory's random names come from the stdlib secrets module that secrets.py shadows
+    name = f'mdring-{os.getpid()}-{uuid4().hex[:8]}'
+    shm = shared_memory.SharedMemory(name=name, create=True, size=HEADER.size + capacity * SLOT_SIZE)
+    HEADER.pack_into(shm.buf, 0, MAGIC, capacity, 0, 0)
+    for slot in range(capacity):
+        SEQ.pack_into(shm.buf, HEADER.size + slot * SLOT_SIZE, WRITING)
+    return shm
+
+def attach_ring(name: str) -> Tuple[shared_memory.SharedMemory, int]:
+    """open a ring created by another process, returns it and its capacity"""
+    # processes started by run() share its resource tracker, so the ring is only unlinked by its creator
+    shm = shared_memory.SharedMemory(name=name)
+    magic, capacity, _, _ = HEADER.unpack_from(shm.buf, 0)
+    if magic != MAGIC:
+        shm.close()
+        raise ValueError(f'{name} is not a market data ring')
+    return shm, capacity
+
+
+class RingWriter:
+    """The single writer of a shared memory ring of market data updates"""
+
+    def __init__(self, name: str) -> None:
+        self.shm, self.capacity = attach_ring(name)
+        self.buf = self.shm.buf
+        self.next_seq = struct.unpack_from('<q', self.buf, 16)[0]
+
+    def publish(self, kind: int, symbol: str, timestamp_ms: int, price: Decimal=None, amount: Decimal=None,
+                      bid: Decimal=None, ask: Decimal=None) -> int:
+        """write an update into the next slot, overwriting the oldest one, returns its sequence number"""
+        seq = self.next_seq
+        offset = HEADER.size + (seq % self.capacity) * SLOT_SIZE
+        # readers that see WRITING, or a different seq after reading the body, know the slot changed under them
+        SEQ.pack_into(self.buf, offset, WRITING)
+        BODY.pack_into(
+            self.buf, offset + SEQ.size,
+            timestamp_ms or 0, kind, symbol.encode(),
+            to_units(price), to_units(amount), to_units(bid), to_units(ask),
+        )
+        SEQ.pack_into(self.buf, offset, seq)
+        self.next_seq = seq + 1
+        struct.pack_into('<q', self.buf, 16, self.next_seq)
+        return seq
+
+    def close(self) -> None:
+        """tell the readers no more updates are coming"""
+        struct.pack_into('<q', self.buf, 24, 1)
+        del self.buf
+        self.shm.close()
+
+
+class RingReader:
+    """One reader's position in a shared memory ring, with slow consumer detection"""
+
+    def __init__(self, name: str, poll_interval: float=FANOUT_POLL_INTERVAL, from_start: bool=False) -> None:
+        self.shm, self.capacity = attach_ring(name)
+        self.buf = self.shm.buf
+        self.poll_interval = poll_interval
+        self.next_seq = 0 if from_start else self.head  # the next update this reader wants
+        self.missed = 0                                 # updates overwritten before this reader got to them
+
+    @property
+    def head(self) -> int:
+        return struct.unpack_from('<q', self.buf, 16)[0]
+
+    @property
+    def closed(self) -> bool:
+        return bool(struct.unpack_from('<q', self.buf, 24)[0])
+
+    @property
+    def lag(self) -> int:
+        """updates written that this reader hasn't read yet"""
+        return self.head - self.next_seq
+
+    def skip_ahead(self, head: int) -> None:
+        """jump past updates that were overwritten, to halfway through the ring so there's room to catch up"""
+        new_seq = head - self.capacity // 2
+        missed = new_seq - self.next_seq
+        self.missed += missed
+        metrics.inc('fanout_missed_total', missed)
+        print(f'[!] Market data reader fell {head - self.next_seq} updates behind, skipped {missed}')
+        self.next_seq = new_seq
+
+    def poll(self, max_updates: int=1024) -> List[Update]:
+        """the updates written since the last poll (up to max_updates), without blocking"""
+        updates: List[Update] = []
+        head = self.head
+        if head - self.next_seq > self.capacity:
+            self.skip_ahead(head)
+
+        while self.next_seq < head and len(updates) < max_updates:
+            offset = HEADER.size + (self.next_seq % self.capacity) * SLOT_SIZE
+            seq = SEQ.unpack_from(self.buf, offset)[0]
+            body = BODY.unpack_from(self.buf, offset + SEQ.size)
+            if seq != self.next_seq or SEQ.unpack_from(self.buf, offset)[0] != seq:
+                # the writer lapped us while we were reading
+                self.skip_ahead(self.head)
+                continue
+            timestamp_ms, kind, symbol, price, amount, bid, ask = body
+            updates.append(Update(
+                seq, timestamp_ms, kind, symbol.rstrip(b'\0').decode(),
+                from_units(price), from_units(amount), from_units(bid), from_units(ask),
+            ))
+            self.next_seq += 1
+        return updates
+
+    def __iter__(self) -> Iterator[Update]:
+        """yield updates as they arrive until the writer closes the ring"""
+        while True:
+            updates = self.poll()
+            yield from updates
+            if not updates:
+                if self.closed:
+                    return
+                sleep(self.poll_interval)
+
+    def close(self) -> None:
+        del self.buf
+        self.shm.close()
+
+
+### Feed Handler
+
+def feed_handler_main(ring_name: str, symbols: List[str], stopped: 'mp.Event') -> None:
+    """stream every symbol's market data into the ring until stopped (runs in its own process)"""
+    from orderbook import OrderBook
+    from market_data import MarketDataFeed
+
+    ring = RingWriter(ring_name)
+    lock = threading.Lock()     # each symbol's feed calls back from its own thread
+    feeds = []
+
+    def handlers(symbol: str):
+        book = OrderBook(symbol)
+        feed = MarketDataFeed(symbol)
+        quote = [None, None]
+
+        def on_trade(price: Decimal, amount: Decimal, timestamp_ms: int) -> None:
+            with lock:
+                ring.publish(TRADE, symbol, timestamp_ms, price, amount, book.best_bid, book.best_ask)
+
+        def on_update(msg: dict) -> None:
+            book.handle_update(msg)
+            best = [book.best_bid, book.best_ask]
+            if best != quote:
+                quote[:] = best
+                with lock:
+                    ring.publish(QUOTE, symbol, msg.get('timestampms') or round(time() * 1000), feed.last_price, None, *best)
+
+        feed.on_trade, feed.on_update = on_trade, on_update
+        return feed
+
+    try:
+        for symbol in symbols:
+            feeds.append(handlers(symbol).start())
+        stopped.wait()
+    finally:
+        for feed in feeds:
+            feed.stop()
+        ring.close()
+
+
+### Order Gateway
+
+class RemoteError(Exception):
+    """an exception raised by a request in the gateway process"""
+
+GATEWAY_EXITED = -1     # request id of the response that tells a worker the gateway is gone
+GATEWAY_EXITED_RESPONSE = (GATEWAY_EXITED, False, ('RemoteError', 'Gateway exited', None))
+
+
+def gateway_main(requests: 'mp.Queue', responses: Dict[int, 'mp.Queue'], concurrency: int=HTTP_POOL_SIZE) -> None:
+    """send the workers' API requests until a None request arrives (runs in its own process)
+
+    This process is the only one that signs requests, so it owns the nonce
+    file and the shared rate limiters for all the workers.  Requests run
+    `concurrency` at a time, and GeminiClient writes the private ones to the
+    wire in nonce order.
+    """
+    import gemini_api as api
+
+    client = api.client     # the gateway's own, even if something in this process reroutes api.client later
+    api.claim_nonces()
+    heartbeat = api.Heartbeat()
+    heartbeat.start()
+
+    def handle(worker_id: int, request_id: int, args: tuple) -> None:
+        try:
+            response = (request_id, True, client.request(*args))
+        except Exception as e:
+            response = (request_id, False, (type(e).__name__, str(e), getattr(e, 'retry_after', None)))
+        responses[worker_id].put(response)
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            while True:
+                request = requests.get()
+                if request is None:
+                    break
+                pool.submit(handle, *request)
+    finally:
+        # fail whatever the workers are still waiting on, rather than leave them hanging
+        for queue in responses.values():
+            queue.put(GATEWAY_EXITED_RESPONSE)
+        heartbeat.stop()
+        client.close()
+
+
+class GatewayClient:
+    """Drop-in for gemini_api.client in a worker, it sends each request to the gateway process instead"""
+
+    def __init__(self, worker_id: int, requests: 'mp.Queue', responses: 'mp.Queue',
+                       timeout: float=FANOUT_GATEWAY_TIMEOUT) -> None:
+        from settings import API_WS_URL
+
+        self.worker_id = worker_id
+        self.requests = requests
+        self.responses = responses
+        self.ws_url = API_WS_URL
+        self.timeout = timeout
+        self.ids = itertools.count()
+        self.pending: Dict[int, Future] = {}
+        self.gateway_exited = False
+        self.lock = threading.Lock()
+        # the bots make requests from several threads at once, responses are matched up by id
+        self.receiver = threading.Thread(target=self.receive, name='gateway-responses', daemon=True)
+        self.receiver.start()
+
+    def request(self, url: str, request_json: dict=None, method='POST', public: bool=False) -> dict:
+        future: Future = Future()
+        with self.lock:
+            if self.gateway_exited:
+                raise RemoteError('Gateway exited')
+            request_id = next(self.ids)
+            self.pending[request_id] = future
+        self.requests.put((self.worker_id, request_id, (url, request_json, method, public)))
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            with self.lock:
+                self.pending.pop(request_id, None)
+            raise RemoteError(f'Gateway didn\'t answer {method} {url} within {self.timeout}s')
+
+    def receive(self) -> None:
+        from gemini_api import RateLimitExceeded
+
+        while True:
+            response = self.responses.get()
+            if response is None:
+                return
+            request_id, ok, result = response
+            if request_id == GATEWAY_EXITED:
+                with self.lock:
+                    self.gateway_exited = True
+                    pending, self.pending = self.pending, {}
+                for future in pending.values():
+                    future.set_exception(RemoteError('Gateway exited'))
+                continue
+            with self.lock:
+                future = self.pending.pop(request_id, None)
+            if future is None:
+                continue    # it already timed out
+            if ok:
+                future.set_result(result)
+            else:
+                name, message, retry_after = result
+                if name == 'RateLimitExceeded':
+                    future.set_exception(RateLimitExceeded(retry_after))
+                else:
+                    future.set_exception(RemoteError(f'{name}: {message}'))
+
+    def close(self) -> None:
+        self.responses.put(None)
+        self.receiver.join()
+
+
+### Workers
+
+def worker_main(worker_id: int, symbol: str, ring_name: str, requests: 'mp.Queue', responses: 'mp.Queue') -> None:
+    """run a ThresholdBot with its own data dir on the ring's trades (runs in its own process)"""
+    import gemini_api as api
+    from example import ThresholdBot
+
+    api.client = GatewayClient(worker_id, requests, responses)
+    reader = RingReader(ring_name)
+    # orders are polled through the gateway, a private websocket would need its own nonces
+    bot = ThresholdBot(
+        symbol,
+        data_dir=os.path.join(DATA_DIR, symbol, f'worker-{worker_id}'),
+        use_order_events=False,
+    ).start()
+    last_refresh = 0.0
+    try:
+        for update in reader:
+            if update.symbol != symbol or update.kind != TRADE:
+                continue
+            price = bot.B(update.price)
+            bot.record_price(update.timestamp_ms, price, update.amount)
+            refresh = time() - last_refresh >= POLL_DELAY
+            if refresh:
+                last_refresh = time()
+            if not bot.tick(price, refresh=refresh):
+                break
+    finally:
+        bot.stop()
+        reader.close()
+        api.client.close()
+
+
+def run(symbols: List[str], workers: int=FANOUT_WORKERS) -> None:
+    """start the feed handler, the gateway, and `workers` bots spread across the symbols, until interrupted"""
+
+    ctx = mp.get_context('spawn')
+    stopped = ctx.Event()
+    requests = ctx.Queue()
+    responses = {worker_id: ctx.Queue() for worker_id in range(workers)}
+    # a plain kill would skip the cleanup below and leak the ring, so SIGTERM exits through it too
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+    ring = create_ring()
+
+    feed_handler = ctx.Process(target=feed_handler_main, args=(ring.name, symbols, stopped), name='feed-handler')
+    gateway = ctx.Process(target=gateway_main, args=(requests, responses), name='gateway')
+    bots = [
+        ctx.Process(
+            target=worker_main,
+            args=(worker_id, symbols[worker_id % len(symbols)], ring.name, requests, responses[worker_id]),
+            name=f'worker-{worker_id}',
+        )
+        for worker_id in range(workers)
+    ]
+
+    try:
+        feed_handler.start()
+        gateway.start()
+        for bot in bots:
+            bot.start()
+        print(f'[i] Fanning out {", ".join(symbols)} market data to {workers} workers over {ring.name}')
+
+        while any(bot.is_alive() for bot in bots):
+            gateway.join(timeout=1)
+            if not gateway.is_alive():
+                # it died without running its cleanup, so tell the workers it's gone
+                print(f'[X] Gateway exited with code {gateway.exitcode}, stopping the workers')
+                for queue in responses.values():
+                    queue.put(GATEWAY_EXITED_RESPONSE)
+                break
+        for bot in bots:
+            bot.join()
+    finally:
+        try:
+            stopped.set()
+            if feed_handler.pid is not None:
+                feed_handler.join()
+            requests.put(None)
+            if gateway.pid is not None:
+                gateway.join()
+        finally:
+            # the segment outlives every process attached to it unless it's unlinked
+            ring.close()
+            ring.unlink()
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    workers = FANOUT_WORKERS
+    if '--workers' in args:
+        i = args.index('--workers')
+        workers = int(args[i + 1])
+        del args[i:i + 2]
+    try:
+        run(args or [SYMBOL], workers)
+    except (EOFError, KeyboardInterrupt):
+        print('\n[√] Stopped the feed handler, gateway, and workers')
@@ -4,26 +4,52 @@ Gemini API Bindings
     REST API: https://docs.gemini.com/rest-api/#requests
         public:
             /ticker
+            /book
         private:
             /heartbeat
             /order/new
             /order/status
+            /orders
+
+    Orders are placed with a client_order_id, so a new_order() that fails
+    ambiguously (e.g. a timeout after Gemini got it) is looked up by that id
+    before being sent again, and retries never place the same order twice.
+
+    Private requests are signed one at a time, then written to the wire in
+    nonce order by a single sender thread over a pool of keep-alive
+    connections.  The sender doesn't wait for a response before writing the
+    next request, so concurrent requests (e.g. new_orders) share a round trip.
 
     WebSocket API: https://docs.gemini.com/websocket-api/#websocket-request
+        public:
+            /marketdata
         private:
             /order/events
 """
 
-import os
 import base64
 import hmac
 import json
+import queue
+import select
+import ssl
+import threading
+import http.client
 import requests
+import requests.adapters
+import requests.certs
 
 from time import sleep
+from uuid import uuid4
+from typing import List, Dict, NamedTuple, Optional
+from urllib.parse import urlsplit
+from concurrent.futures import Future, ThreadPoolExecutor
 from hashlib import sha384
 
 from symbols import Order, Currency, currency_by_symbol
+from nonces import allocator as nonce_allocator, NonceFileInUse
+from rate_limit import limiter_for, priority, backoff, parse_retry_after
+from metrics import metrics, endpoint
 from settings import (
     API_VERSION,
     API_URL,
@@ -31,44 +57,47 @@ from settings import (
     API_KEY,
     API_SECRET,
     STARTING_NONCE,
-    DATA_DIR,
+    HTTP_POOL_SIZE,
+    HTTP_TIMEOUT,
+    MAX_CONCURRENT_REQUESTS,
+    HEARTBEAT_INTERVAL,
+    MAX_RETRIES,
+    RETRY_BASE_DELAY,
 )
 
 
 class RateLimitExceeded(Exception):
-    pass
+    def __init__(self, retry_after: float=None) -> None:
+        super().__init__(f'Rate limit exceeded, retry after {retry_after}s' if retry_after else 'Rate limit exceeded')
+        self.retry_after = retry_after
 
 
 def retry_if_exception(func):
+    """retry failed requests up to MAX_RETRIES times, with exponential backoff & jitter"""
     def wrapped(*args, **kwargs):
-        try:
-            return func(*args, **kwargs)
-        except RateLimitExceeded:
-            print(f'Rate limit exceeded! Retrying in 10 seconds...')
-            sleep(10)
-            return func(*args, **kwargs)
-        except Exception as e:
-            print(f'{func} raised {e}! Retrying one more time in 2 seconds...')
-            sleep(2)
-            return func(*args, **kwargs)
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if attempt == MAX_RETRIES:
+                    raise
+                delay = backoff(attempt, getattr(e, 'retry_after', None))
+                print(f'{func.__name__} raised {e}! Retrying in {delay:.1f} seconds...')
+                metrics.inc('api_retries_total', function=func.__name__)
+                sleep(delay)
     return wrapped
 
 def get_nonce(min_nonce: int=STARTING_NONCE) -> int:
-    """nonce must always monotonically increase, so we track it in a file"""
-    last = min_nonce
-    try:
-        with open(os.path.join(DATA_DIR, '.last_nonce.txt'), 'r') as f:
-            last = int(f.read().strip())
-    except Exception:
-        pass
-
-    last = last if last > min_nonce else min_nonce
-
-    with open(os.path.join(DATA_DIR, '.last_nonce.txt'), 'w') as f:
-        last += 1
-        f.write(str(last))
+    """nonce must always monotonically increase, so we reserve blocks of them in a file"""
+    return nonce_allocator.allocate(min_nonce)
 
-    return last
+def claim_nonces() -> None:
+    """exit with an error if another process is already signing requests with this API key's nonce file"""
+    try:
+        nonce_allocator.claim()
+    except NonceFileInUse as e:
+        print(f'[X] {e}')
+        raise SystemExit(1)
 
 
 ### API Base Methods
@@ -77,10 +106,12 @@ def base_headers(url: str, request_json: dict=None) -> dict:
     """basic auth & content headers shared by the REST and WS API"""
     request_json = request_json or {}
     request_json['request'] = f'/v{API_VERSION}{url}'
-    request_json['nonce'] = get_nonce()
-    
-    base_64 = base64.b64encode(json.dumps(request_json).encode())
-    signature = hmac.new(API_SECRET.encode(), base_64, sha384).hexdigest()
+    with metrics.timer('api_stage_seconds', endpoint=endpoint(url), stage='nonce'):
+        request_json['nonce'] = get_nonce()
+
+    with metrics.timer('api_stage_seconds', endpoint=endpoint(url), stage='sign'):
+        base_64 = base64.b64encode(json.dumps(request_json).encode())
+        signature = hmac.new(API_SECRET.encode(), base_64, sha384).hexdigest()
 
     return {
         'X-GEMINI-APIKEY': API_KEY,
@@ -88,9 +119,151 @@ def base_headers(url: str, request_json: dict=None) -> dict:
         'X-GEMINI-SIGNATURE': signature,
     }
 
-@retry_if_exception
-def request(url: str, request_json: dict=None, method='POST', public: bool=False) -> dict:
-    """Make an HTTP request to the Gemini API, public=True disables auth headers"""
+class SignedResponse(NamedTuple):
+    """the parts of a response that GeminiClient.request reads, like a requests.Response's"""
+    status_code: int
+    headers: http.client.HTTPMessage
+    content: bytes
+
+    @property
+    def text(self) -> str:
+        return self.content.decode('utf-8', 'replace')
+
+
+class OrderedSender:
+    """Writes signed requests to the wire in the order they're submitted, with their round trips overlapping
+
+    One thread writes each request on a free keep-alive connection, then hands
+    the connection to a pool of threads that wait for the responses, so a
+    request is never written before one submitted ahead of it, but never waits
+    on its response either.  Each API key needs its own sender, since Gemini
+    only orders nonces per key.
+    """
+
+    def __init__(self, api_url: str, headers: dict, pool_size: int=HTTP_POOL_SIZE, timeout=HTTP_TIMEOUT) -> None:
+        url = urlsplit(api_url)
+        self.https = url.scheme == 'https'
+        self.host = url.hostname
+        self.port = url.port or (443 if self.https else 80)
+        self.base_path = url.path.rstrip('/')
+        self.headers = headers
+        self.connect_timeout, self.read_timeout = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        self.ssl_context = ssl.create_default_context(cafile=requests.certs.where()) if self.https else None
+        self.pool_size = pool_size
+        self.queue: 'queue.Queue[Optional[tuple]]' = queue.Queue()
+        self.idle: 'queue.LifoQueue[http.client.HTTPConnection]' = queue.LifoQueue()
+        self.connections = threading.BoundedSemaphore(pool_size)    # open connections, idle or in use
+        self.receivers: Optional[ThreadPoolExecutor] = None
+        self.thread: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+
+    def submit(self, method: str, path: str, headers: dict) -> Future:
+        """queue a request to be written after every one submitted before it, returns a future of its SignedResponse"""
+        with self.lock:
+            if self.thread is None:
+                # started on first use, and again after close()
+                self.receivers = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix='gemini-responses')
+                self.thread = threading.Thread(target=self.run, args=(self.receivers,), name='gemini-sender', daemon=True)
+                self.thread.start()
+        future: Future = Future()
+        self.queue.put((method, path, headers, future))
+        return future
+
+    def written(self) -> Future:
+        """a future that's done once every request submitted so far has been written"""
+        return self.submit('', '', {})
+
+    def flush(self) -> None:
+        """wait until every request submitted so far has been written"""
+        self.written().result()
+
+    def connection(self) -> http.client.HTTPConnection:
+        """a free keep-alive connection, or a new one if fewer than pool_size are open, waiting for one otherwise"""
+        while True:
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                if self.connections.acquire(blocking=False):
+                    break
+                try:
+                    # every connection is waiting on a response, the first one back gets this request
+                    conn = self.idle.get(timeout=0.01)
+                except queue.Empty:
+                    continue    # or one was closed, which makes room for a new one
+            # a connection the server closed while idle reads as ready, since it's at EOF
+            if conn.sock is not None and not select.select([conn.sock], [], [], 0)[0]:
+                return conn
+            conn.close()
+            self.connections.release()
+
+        if self.https:
+            conn = http.client.HTTPSConnection(self.host, self.port, timeout=self.connect_timeout, context=self.ssl_context)
+        else:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.connect_timeout)
+        try:
+            conn.connect()
+        except BaseException:
+            self.connections.release()
+            raise
+        conn.sock.settimeout(self.read_timeout)
+        return conn
+
+    def discard(self, conn: http.client.HTTPConnection) -> None:
+        conn.close()
+        self.connections.release()
+
+    def run(self, receivers: ThreadPoolExecutor) -> None:
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            method, path, headers, future = item
+            if not method:
+                future.set_result(None)     # a flush() marker, everything before it has been written
+                continue
+            conn = None
+            try:
+                conn = self.connection()
+                conn.request(method, f'{self.base_path}{path}', headers={**self.headers, **headers})
+            except Exception as e:
+                if conn is not None:
+                    self.discard(conn)
+                future.set_exception(e)
+                continue
+            receivers.submit(self.receive, conn, future)
+
+    def receive(self, conn: http.client.HTTPConnection, future: Future) -> None:
+        try:
+            response = conn.getresponse()
+            result = SignedResponse(response.status, response.headers, response.read())
+        except Exception as e:
+            self.discard(conn)
+            future.set_exception(e)
+            return
+        if response.will_close:
+            self.discard(conn)
+        else:
+            self.idle.put(conn)
+        future.set_result(result)
+
+    def close(self) -> None:
+        """write whatever's queued, wait for the responses, then close every connection"""
+        with self.lock:
+            thread, self.thread = self.thread, None
+            receivers, self.receivers = self.receivers, None
+        if thread is not None:
+            self.queue.put(None)
+            thread.join()
+            receivers.shutdown(wait=True)
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class GeminiClient:
+    """HTTP client that holds a pool of keep-alive connections open to the API"""
 
     http_headers = {
         'Content-Type': "text/plain",
@@ -98,41 +271,125 @@ def request(url: str, request_json: dict=None, method='POST', public: bool=False
         'Cache-Control': "no-cache",
     }
 
-    response = requests.request(
-        method,
-        f'{API_URL}/v{API_VERSION}{url}',
-        headers={
-            **http_headers,
-            **({} if public else base_headers(url, request_json)),
-        },
-    )
-
-    if response.status_code == 429:
-        raise RateLimitExceeded
+    def __init__(self, api_url: str=API_URL, pool_size: int=HTTP_POOL_SIZE, timeout=HTTP_TIMEOUT,
+                       ws_url: str=API_WS_URL, rate_limit: bool=True) -> None:
+        self.api_url = api_url
+        self.ws_url = ws_url
+        self.timeout = timeout
+        self.rate_limit = rate_limit    # wait for the shared rate limiters before each request
+        self.recorder = None            # a recorder.Recorder to journal every response & websocket message to
+        self.private_lock = threading.Lock()    # held while a request takes its nonce, is signed & queued to send
+        self.sender = OrderedSender(api_url, self.http_headers, pool_size, timeout)
+        self.session = requests.Session()
+        self.session.headers.update(self.http_headers)
+
+        # one pool per host, each holding up to pool_size reusable connections
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def __enter__(self) -> 'GeminiClient':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def request(self, url: str, request_json: dict=None, method='POST', public: bool=False) -> dict:
+        """Make an HTTP request to the Gemini API, public=True disables auth headers"""
+
+        limiter = limiter_for(public)
+        if self.rate_limit:
+            # wait before taking the private lock, so a request short of tokens never holds up the others
+            with metrics.timer('api_stage_seconds', endpoint=endpoint(url), stage='rate_limit'):
+                limiter.acquire(priority(url))
+
+        if public:
+            response = self.send(url, method, {})
+        else:
+            # Gemini rejects any nonce lower than one it's already seen, so requests are queued in the
+            # order they took their nonces, and the sender writes them in that order
+            with self.private_lock:
+                sent = self.sender.submit(method, f'/v{API_VERSION}{url}', base_headers(url, request_json))
+            metrics.inc('api_requests_total', endpoint=endpoint(url))
+            with metrics.timer('api_stage_seconds', endpoint=endpoint(url), stage='network'):
+                response = sent.result()
+
+        if self.recorder is not None:
+            self.recorder.record(f'{method} {url}', response.content, response.status_code)
+
+        if response.status_code == 429:
+            metrics.inc('api_rate_limited_total', endpoint=endpoint(url))
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            # pause every thread sharing the limiter, not just this request
+            limiter.throttle(retry_after or RETRY_BASE_DELAY)
+            raise RateLimitExceeded(retry_after)
 
-    try:
-        return json.loads(response.text)
-    except json.decoder.JSONDecodeError:
-        print(response.text)
-        raise
+        try:
+            with metrics.timer('api_stage_seconds', endpoint=endpoint(url), stage='decode'):
+                return json.loads(response.text)
+        except json.decoder.JSONDecodeError:
+            print(response.text)
+            raise
+
+    def send(self, url: str, method: str, headers: dict) -> requests.Response:
+        metrics.inc('api_requests_total', endpoint=endpoint(url))
+        with metrics.timer('api_stage_seconds', endpoint=endpoint(url), stage='network'):
+            return self.session.request(
+                method,
+                f'{self.api_url}/v{API_VERSION}{url}',
+                headers=headers,
+                timeout=self.timeout,
+            )
+
+    def websocket(self, url: str, request_json: dict=None, public: bool=False):
+        """open a websocket connection to the API, public=True disables auth headers"""
+        try:
+            from websocket import create_connection
+        except ImportError:
+            print('The package websocket-client is required to use the WS api:')
+            print('    pip install websocket-client')
+            raise SystemExit(1)
+
+        def connect(headers: dict):
+            # websocket-client takes the handshake headers as header=, with str values
+            headers = {key: value.decode() if isinstance(value, bytes) else value for key, value in headers.items()}
+            return create_connection(f'{self.ws_url}/v{API_VERSION}{url}', header=headers)
+
+        if public:
+            ws = connect({})
+        else:
+            # the handshake is a signed request too, so it goes out after everything signed before it,
+            # and nothing signed after it goes out until it's done
+            with self.private_lock:
+                headers = base_headers(url, request_json)
+                self.sender.flush()
+                ws = connect(headers)
+        if self.recorder is not None:
+            ws = self.recorder.wrap_websocket(f'WS {url}', ws)
+        return ws
+
+    def close(self) -> None:
+        """close all the pooled connections, the client can't be used after this"""
+        self.sender.close()
+        self.session.close()
+
+
+# default client shared by the module-level API functions below
+client = GeminiClient()
+
+def close() -> None:
+    """shut down the default client's connection pool"""
+    client.close()
 
 @retry_if_exception
-def websocket_request(url, request_json: dict=None):
-    """Subscribe to websocket messages from a Gemini API endpoint"""
-
-    try:
-        from websocket import create_connection
-    except ImportError:
-        print('The package websocket-client is required to use the WS api:')
-        print('    pip install websocket-client')
-        raise SystemExit(1)
-
-    headers = base_headers(url, request_json)
+def request(url: str, request_json: dict=None, method='POST', public: bool=False) -> dict:
+    """Make an HTTP request to the Gemini API, public=True disables auth headers"""
+    return client.request(url, request_json, method=method, public=public)
 
-    return create_connection(
-        f'{API_WS_URL}/v{API_VERSION}{url}',
-        headers=headers,
-    )
+@retry_if_exception
+def websocket_request(url, request_json: dict=None, public: bool=False):
+    """Subscribe to websocket messages from a Gemini API endpoint, public=True disables auth headers"""
+    return client.websocket(url, request_json, public=public)
 
 
 ### API REST Methods
@@ -144,27 +401,118 @@ def heartbeat() -> None:
     if not response['result']:
         raise Exception('Heartbeat request failed!')
 
+class Heartbeat(threading.Thread):
+    """send heartbeats from a background thread so they never block the caller"""
+
+    def __init__(self, interval: float=HEARTBEAT_INTERVAL) -> None:
+        super().__init__(name='heartbeat', daemon=True)
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            try:
+                heartbeat()
+            except Exception as e:
+                print(f'[!] Heartbeat failed: {e}')
+
+    def stop(self) -> None:
+        self.stopped.set()
+
 def ticker(symbol: str) -> dict:
     """fetch the current price and volume for a given symbol"""
     return request(f'/pubticker/{symbol}', method='GET', public=True)
 
-def new_order(side: str, symbol: str, amt: Currency, price: Currency) -> dict:
-    """create a new buy or sell order for a given symbol, amt, and price"""
+def book(symbol: str) -> dict:
+    """fetch a full snapshot of the current order book for a given symbol"""
+    # https://docs.gemini.com/rest-api/#current-order-book
+    return request(f'/book/{symbol}?limit_bids=0&limit_asks=0', method='GET', public=True)
+
+def new_client_order_id() -> str:
+    return uuid4().hex
 
-    return request('/order/new', {
-        # "client_order_id": client_order_id,
-        "symbol": symbol,
-        "amount": str(amt),
-        "price": str(price),
-        "side": side,
-        "type": "exchange limit",
-    })
+def new_order(side: str, symbol: str, amt: Currency, price: Currency, client_order_id: str=None) -> dict:
+    """create a new buy or sell order for a given symbol, amt, and price, retrying without ever duplicating it"""
+
+    client_order_id = client_order_id or new_client_order_id()
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            return client.request('/order/new', {
+                "client_order_id": client_order_id,
+                "symbol": symbol,
+                "amount": str(amt),
+                "price": str(price),
+                "side": side,
+                "type": "exchange limit",
+            })
+        except Exception as e:
+            if attempt == MAX_RETRIES:
+                raise
+            delay = backoff(attempt, getattr(e, 'retry_after', None))
+            print(f'new_order raised {e}! Retrying in {delay:.1f} seconds...')
+            metrics.inc('api_retries_total', function='new_order')
+            sleep(delay)
+            if not isinstance(e, RateLimitExceeded):
+                # the request may have reached gemini before failing, only resend it if it didn't
+                placed = find_order(client_order_id)
+                if placed is not None:
+                    return placed
+
+def new_orders(orders: List[dict], concurrency: int=MAX_CONCURRENT_REQUESTS) -> List[dict]:
+    """place many orders at once, each a dict of new_order() kwargs, from up to `concurrency` threads
+
+    The requests are written in nonce order without waiting on each other's responses
+    (see OrderedSender), so a batch of up to `concurrency` orders takes about one round trip.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(orders)))) as pool:
+        return list(pool.map(lambda order: new_order(**order), orders))
 
 def order_status(order_id: str) -> dict:
     """fetch the up-to-date order object for a given order id"""
     # https://docs.gemini.com/rest-api/#order-status
     return request('/order/status', {'order_id': order_id})
 
+@retry_if_exception
+def find_order(client_order_id: str) -> Optional[dict]:
+    """fetch the order object placed with a given client_order_id, or None if gemini never got it"""
+    status = client.request('/order/status', {'client_order_id': client_order_id})
+    if isinstance(status, list):
+        # gemini returns every order placed with the id, which is only ever one of ours
+        return status[0] if status else None
+    if status.get('result') == 'error':
+        if status.get('reason') == 'OrderNotFound':
+            return None
+        raise Exception(f'Order status for {client_order_id} failed: {status.get("message")}')
+    return status
+
+def live_orders() -> List[dict]:
+    """fetch the up-to-date order objects for all of the account's live orders"""
+    # https://docs.gemini.com/rest-api/#get-active-orders
+    return request('/orders')
+
+def refresh_orders(orders: Dict[str, Order]) -> List[str]:
+    """update the Orders in a dict of {id: Order} in place with a single /orders call, returns the ids that changed"""
+
+    pending = {
+        id: order for id, order in list(orders.items())
+        if not (order.is_filled or order.data.get('is_cancelled'))
+    }
+    if not pending:
+        return []
+
+    live = {str(status['order_id']): status for status in live_orders()}
+
+    changed = []
+    for id, order in pending.items():
+        status = live.get(str(order.order_id))
+        if status is None:
+            # no longer live, so it was filled or cancelled since the last refresh
+            status = order_status(order.id)
+        if status != order.data:
+            order.update(status)
+            changed.append(id)
+    return changed
+
 
 ### API WebSocket Methods
 
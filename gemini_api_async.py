@@ -0,0 +1,332 @@
+"""
+Asyncio Gemini API Bindings
+
+    Same endpoints, signing, and return values as gemini_api, but awaitable so
+    many tasks can share one client, e.g.:
+
+        statuses = await api.order_statuses(['44375901', '44375902'])
+
+    Public requests & websockets go over aiohttp.  Signed requests are written
+    in nonce order by the same gemini_api.OrderedSender the threaded client
+    uses, and their responses are awaited without blocking the event loop, so
+    a batch of them takes about one round trip.
+
+    REST API: https://docs.gemini.com/rest-api/#requests
+        public:
+            /ticker
+        private:
+            /heartbeat
+            /order/new
+            /order/status
+            /orders
+
+    WebSocket API: https://docs.gemini.com/websocket-api/#websocket-request
+        private:
+            /order/events
+"""
+
+import json
+import asyncio
+
+from typing import List, Optional, Tuple, Union, AsyncGenerator
+from concurrent.futures import Future
+
+from symbols import Currency
+from gemini_api import base_headers, claim_nonces, new_client_order_id, OrderedSender, RateLimitExceeded
+from rate_limit import limiter_for, priority, backoff, parse_retry_after
+from metrics import metrics, endpoint
+from settings import (
+    API_VERSION,
+    API_URL,
+    API_WS_URL,
+    HTTP_POOL_SIZE,
+    HTTP_TIMEOUT,
+    MAX_CONCURRENT_REQUESTS,
+    MAX_RETRIES,
+    RETRY_BASE_DELAY,
+)
+
+try:
+    import aiohttp
+except ImportError:
+    print('The package aiohttp is required to use the asyncio api:')
+    print('    pip install aiohttp')
+    raise SystemExit(1)
+
+
+def retry_if_exception(func):
+    """retry failed requests up to MAX_RETRIES times, with exponential backoff & jitter"""
+    async def wrapped(*args, **kwargs):
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                if attempt == MAX_RETRIES:
+                    raise
+                delay = backoff(attempt, getattr(e, 'retry_after', None))
+                print(f'{func.__name__} raised {e}! Retrying in {delay:.1f} seconds...')
+                metrics.inc('api_retries_total', function=func.__name__)
+                await asyncio.sleep(delay)
+    return wrapped
+
+def signed_headers(url: str, request_json: dict=None) -> dict:
+    """base_headers() with the payload decoded to str, which aiohttp requires"""
+    return {
+        key: value.decode() if isinstance(value, bytes) else value
+        for key, value in base_headers(url, request_json).items()
+    }
+
+
+### API Base Methods
+
+class AsyncGeminiClient:
+    """asyncio HTTP client that holds pools of keep-alive connections open to the API"""
+
+    http_headers = {
+        'Content-Type': "text/plain",
+        'Content-Length': "0",
+        'Cache-Control': "no-cache",
+    }
+
+    def __init__(self, api_url: str=API_URL, ws_url: str=API_WS_URL,
+                       pool_size: int=HTTP_POOL_SIZE, timeout=HTTP_TIMEOUT, rate_limit: bool=True) -> None:
+        self.api_url = api_url
+        self.ws_url = ws_url
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.rate_limit = rate_limit    # wait for the shared rate limiters before each request
+        self.recorder = None            # a recorder.Recorder to journal every response to
+        self.sender = OrderedSender(api_url, self.http_headers, pool_size, timeout)
+        self._session = None
+        self._private_lock = None
+        self._private_lock_loop = None
+
+    @property
+    def session(self) -> 'aiohttp.ClientSession':
+        # aiohttp sessions have to be created from inside a running event loop
+        if self._session is None or self._session.closed:
+            connect_timeout, read_timeout = self.timeout
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout),
+                headers=self.http_headers,
+            )
+        return self._session
+
+    @property
+    def private_lock(self) -> asyncio.Lock:
+        """held while a request takes its nonce, is signed & queued to send, one per event loop"""
+        loop = asyncio.get_running_loop()
+        if self._private_lock is None or self._private_lock_loop is not loop:
+            self._private_lock, self._private_lock_loop = asyncio.Lock(), loop
+        return self._private_lock
+
+    async def __aenter__(self) -> 'AsyncGeminiClient':
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def request(self, url: str, request_json: dict=None, method='POST', public: bool=False) -> dict:
+        """Make an HTTP request to the Gemini API, public=True disables auth headers"""
+
+        limiter = limiter_for(public)
+        if self.rate_limit:
+            # wait before taking the private lock, so a request short of tokens never holds up the others
+            with metrics.timer('api_stage_seconds', endpoint=endpoint(url), stage='rate_limit'):
+                await limiter.acquire_async(priority(url))
+
+        if public:
+            status, retry_after, text = await self.send(url, method, {})
+        else:
+            # Gemini rejects any nonce lower than one it's already seen, so requests are queued in the
+            # order they took their nonces, and the sender writes them in that order
+            async with self.private_lock:
+                sent = self.sender.submit(method, f'/v{API_VERSION}{url}', base_headers(url, request_json))
+            status, retry_after, text = await self.receive(url, method, sent)
+
+        if status == 429:
+            metrics.inc('api_rate_limited_total', endpoint=endpoint(url))
+            # pause every task & thread sharing the limiter, not just this request
+            limiter.throttle(retry_after or RETRY_BASE_DELAY)
+            raise RateLimitExceeded(retry_after)
+
+        try:
+            with metrics.timer('api_stage_seconds', endpoint=endpoint(url), stage='decode'):
+                return json.loads(text)
+        except json.decoder.JSONDecodeError:
+            print(text)
+            raise
+
+    async def send(self, url: str, method: str, headers: dict) -> Tuple[int, Optional[float], str]:
+        """(status, Retry-After seconds, body) of one request"""
+        metrics.inc('api_requests_total', endpoint=endpoint(url))
+        # concurrent requests overlap, so this is each request's own round-trip, not time the loop was blocked
+        with metrics.timer('api_stage_seconds', endpoint=endpoint(url), stage='network'):
+            async with self.session.request(
+                method,
+                f'{self.api_url}/v{API_VERSION}{url}',
+                headers=headers,
+            ) as response:
+                if self.recorder is not None:
+                    self.recorder.record(f'{method} {url}', await response.read(), response.status)
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                return response.status, retry_after, await response.text()
+
+    async def receive(self, url: str, method: str, sent: 'Future') -> Tuple[int, Optional[float], str]:
+        """(status, Retry-After seconds, body) of a signed request handed to the sender"""
+        metrics.inc('api_requests_total', endpoint=endpoint(url))
+        with metrics.timer('api_stage_seconds', endpoint=endpoint(url), stage='network'):
+            response = await asyncio.wrap_future(sent)
+        if self.recorder is not None:
+            self.recorder.record(f'{method} {url}', response.content, response.status_code)
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        return response.status_code, retry_after, response.text
+
+    async def websocket_request(self, url: str, request_json: dict=None) -> 'aiohttp.ClientWebSocketResponse':
+        """Subscribe to websocket messages from a Gemini API endpoint"""
+        # the handshake is a signed request too, so it goes out after everything signed before it,
+        # and nothing signed after it goes out until it's done
+        async with self.private_lock:
+            headers = signed_headers(url, request_json)
+            await asyncio.wrap_future(self.sender.written())
+            return await self.session.ws_connect(
+                f'{self.ws_url}/v{API_VERSION}{url}',
+                headers=headers,
+            )
+
+    async def close(self) -> None:
+        """close all the pooled connections, the client can be reused afterwards"""
+        # the sender waits for any responses still in flight, so it's closed off the event loop
+        await asyncio.get_running_loop().run_in_executor(None, self.sender.close)
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+# default client shared by the module-level API functions below
+client = AsyncGeminiClient()
+
+async def close() -> None:
+    """shut down the default client's connection pool"""
+    await client.close()
+
+@retry_if_exception
+async def request(url: str, request_json: dict=None, method='POST', public: bool=False) -> dict:
+    """Make an HTTP request to the Gemini API, public=True disables auth headers"""
+    return await client.request(url, request_json, method=method, public=public)
+
+@retry_if_exception
+async def websocket_request(url: str, request_json: dict=None) -> 'aiohttp.ClientWebSocketResponse':
+    """Subscribe to websocket messages from a Gemini API endpoint"""
+    return await client.websocket_request(url, request_json)
+
+
+### API REST Methods
+
+async def heartbeat() -> None:
+    """send a keep-alive heartbeat ping to the Gemini API"""
+
+    response = await request('/heartbeat')
+    if not response['result']:
+        raise Exception('Heartbeat request failed!')
+
+async def ticker(symbol: str) -> dict:
+    """fetch the current price and volume for a given symbol"""
+    return await request(f'/pubticker/{symbol}', method='GET', public=True)
+
+async def new_order(side: str, symbol: str, amt: Currency, price: Currency, client_order_id: str=None) -> dict:
+    """create a new buy or sell order for a given symbol, amt, and price, retrying without ever duplicating it"""
+
+    client_order_id = client_order_id or new_client_order_id()
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            return await client.request('/order/new', {
+                "client_order_id": client_order_id,
+                "symbol": symbol,
+                "amount": str(amt),
+                "price": str(price),
+                "side": side,
+                "type": "exchange limit",
+            })
+        except Exception as e:
+            if attempt == MAX_RETRIES:
+                raise
+            delay = backoff(attempt, getattr(e, 'retry_after', None))
+            print(f'new_order raised {e}! Retrying in {delay:.1f} seconds...')
+            metrics.inc('api_retries_total', function='new_order')
+            await asyncio.sleep(delay)
+            if not isinstance(e, RateLimitExceeded):
+                # the request may have reached gemini before failing, only resend it if it didn't
+                placed = await find_order(client_order_id)
+                if placed is not None:
+                    return placed
+
+async def new_orders(orders: List[dict], concurrency: int=MAX_CONCURRENT_REQUESTS) -> List[Union[dict, Exception]]:
+    """place many orders at once, each a dict of new_order() kwargs, with up to `concurrency` in flight
+
+    The signed requests are written in nonce order without waiting on each other's responses
+    (see AsyncGeminiClient.request), so a batch takes about one round trip.  Returns each order's
+    response, or the exception it failed with, so one failure doesn't lose the other orders' responses.
+    """
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded_new_order(order: dict) -> dict:
+        async with semaphore:
+            return await new_order(**order)
+
+    results = await asyncio.gather(*(bounded_new_order(order) for order in orders), return_exceptions=True)
+    for result in results:
+        if not isinstance(result, Exception) and isinstance(result, BaseException):
+            raise result    # only errors are handed back, not e.g. the end of a replay
+    return results
+
+async def order_status(order_id: str) -> dict:
+    """fetch the up-to-date order object for a given order id"""
+    # https://docs.gemini.com/rest-api/#order-status
+    return await request('/order/status', {'order_id': order_id})
+
+@retry_if_exception
+async def find_order(client_order_id: str) -> Optional[dict]:
+    """fetch the order object placed with a given client_order_id, or None if gemini never got it"""
+    status = await client.request('/order/status', {'client_order_id': client_order_id})
+    if isinstance(status, list):
+        # gemini returns every order placed with the id, which is only ever one of ours
+        return status[0] if status else None
+    if status.get('result') == 'error':
+        if status.get('reason') == 'OrderNotFound':
+            return None
+        raise Exception(f'Order status for {client_order_id} failed: {status.get("message")}')
+    return status
+
+async def order_statuses(order_ids: List[str], concurrency: int=MAX_CONCURRENT_REQUESTS) -> List[dict]:
+    """fetch the status of many orders with up to `concurrency` in flight, the signed requests go out in nonce order"""
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded_order_status(order_id: str) -> dict:
+        async with semaphore:
+            return await order_status(order_id)
+
+    return await asyncio.gather(*(bounded_order_status(order_id) for order_id in order_ids))
+
+async def live_orders() -> List[dict]:
+    """fetch the up-to-date order objects for all of the account's live orders"""
+    # https://docs.gemini.com/rest-api/#get-active-orders
+    return await request('/orders')
+
+
+### API WebSocket Methods
+
+async def order_events(order_id: str) -> AsyncGenerator[dict, None]:
+    """subscibe to event updates for a given order id"""
+    ws = await websocket_request('/order/events', {'order_id': order_id})
+    try:
+        async for msg in ws:
+            if msg.type == aiohttp.WSMsgType.TEXT:
+                yield json.loads(msg.data)
+            elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                break
+    finally:
+        await ws.close()
@@ -0,0 +1,266 @@
+"""
+Streaming indicators computed incrementally from the price feed
+
+Every price update (from the ticker or the market data websocket) is pushed
+through a pipeline of indicators, each updated in O(1) amortized time with a
+fixed amount of state, so the strategy can use them on every tick without
+re-reading the price history, e.g.:
+
+    indicators = default_indicators()
+    indicators.update(915.39, 0.25)
+    indicators.values()     # {'ema': 915.39, 'vwap': 915.39, 'volatility': None, 'low': 915.39, ...}
+
+    ema           exponential moving average of the price over ~`span` updates
+    vwap          volume weighted average price over the last `window` updates, None without trade sizes
+    stddev        standard deviation of the price over the last `window` updates
+    volatility    standard deviation of the log returns over the last `window` updates
+    low / high    min / max price over the last `window` updates, from a monotonic deque
+
+Windows are counted in price updates, not seconds, so each indicator's state
+fits in a ring buffer of `window` slots.  The whole pipeline's state can be
+checkpointed with state() and restore()d after a restart, so the indicators
+don't need to warm up again (see data.save_indicators).
+
+Polled prices are pushed with a volume of 0, since the ticker only has the
+rolling 24h volume and not the size of a trade, so VWAP only weighs the
+trades streamed from the market data websocket.
+"""
+
+import threading
+
+from math import log, sqrt
+from array import array
+from collections import deque
+from typing import Dict, Optional
+
+from settings import INDICATOR_WINDOW
+
+
+class Indicator:
+    """base class of a streaming indicator, updated with one (price, volume) at a time"""
+
+    __slots__ = ()
+
+    def update(self, price: float, volume: float) -> None:
+        raise NotImplementedError
+
+    @property
+    def value(self) -> Optional[float]:
+        raise NotImplementedError
+
+    @property
+    def size(self) -> int:
+        """the window or span it was configured with"""
+        return self.window
+
+    def slots(self):
+        return [name for cls in type(self).__mro__ for name in getattr(cls, '__slots__', ())]
+
+    def state(self) -> dict:
+        return {name: getattr(self, name) for name in self.slots()}
+
+    def restore(self, state: dict) -> None:
+        for name in self.slots():
+            setattr(self, name, state[name])
+
+
+class EMA(Indicator):
+    """exponential moving average, weighting each price by 2 / (span + 1)"""
+
+    __slots__ = ('span', 'alpha', 'ema')
+
+    def __init__(self, span: int=INDICATOR_WINDOW) -> None:
+        self.span = span
+        self.alpha = 2 / (span + 1)
+        self.ema: Optional[float] = None
+
+    def update(self, price: float, volume: float=0.0) -> None:
+        self.ema = price if self.ema is None else self.ema + self.alpha * (price - self.ema)
+
+    @property
+    def value(self) -> Optional[float]:
+        return self.ema
+
+    @property
+    def size(self) -> int:
+        return self.span
+
+
+class RingSums(Indicator):
+    """running sums of the last `window` values of a few series, kept in fixed-size ring buffers
+
+    The sums are recomputed from the buffers each time they wrap around, so
+    float error can't build up over a long run (O(1) amortized per update).
+    """
+
+    __slots__ = ('window', 'count', 'pos', 'buffers', 'sums')
+
+    def __init__(self, window: int, series: int) -> None:
+        self.window = window
+        self.count = 0          # values in the buffers, up to window
+        self.pos = 0            # slot the next value goes in
+        self.buffers = [array('d', bytes(8 * window)) for _ in range(series)]
+        self.sums = [0.0] * series
+
+    def push(self, *values: float) -> None:
+        for i, value in enumerate(values):
+            buffer = self.buffers[i]
+            self.sums[i] += value - buffer[self.pos]
+            buffer[self.pos] = value
+        self.pos = (self.pos + 1) % self.window
+        if self.pos == 0:
+            self.sums = [sum(buffer) for buffer in self.buffers]
+        self.count = min(self.count + 1, self.window)
+
+    def state(self) -> dict:
+        return {**super().state(), 'buffers': [buffer.tolist() for buffer in self.buffers]}
+
+    def restore(self, state: dict) -> None:
+        super().restore(state)
+        self.buffers = [array('d', buffer) for buffer in state['buffers']]
+
+
+class RollingVWAP(RingSums):
+    """volume weighted average price over the last `window` updates"""
+
+    __slots__ = ()
+
+    def __init__(self, window: int=INDICATOR_WINDOW) -> None:
+        super().__init__(window, series=2)     # price * volume, volume
+
+    def update(self, price: float, volume: float) -> None:
+        self.push(price * volume, volume)
+
+    @property
+    def value(self) -> Optional[float]:
+        notional, volume = self.sums
+        return notional / volume if volume > 0 else None
+
+
+class RollingStd(RingSums):
+    """sample standard deviation of the price over the last `window` updates"""
+
+    __slots__ = ()
+
+    def __init__(self, window: int=INDICATOR_WINDOW) -> None:
+        super().__init__(window, series=2)     # x, x²
+
+    def update(self, price: float, volume: float=0.0) -> None:
+        self.push(price, price * price)
+
+    @property
+    def value(self) -> Optional[float]:
+        if self.count < 2:
+            return None
+        total, squares = self.sums
+        variance = (squares - total * total / self.count) / (self.count - 1)
+        return sqrt(max(variance, 0.0))
+
+
+class Volatility(RollingStd):
+    """standard deviation of the log returns between updates, over the last `window` of them"""
+
+    __slots__ = ('last',)
+
+    def __init__(self, window: int=INDICATOR_WINDOW) -> None:
+        super().__init__(window)
+        self.last: Optional[float] = None
+
+    def update(self, price: float, volume: float=0.0) -> None:
+        if self.last is not None and self.last > 0 and price > 0:
+            change = log(price / self.last)
+            self.push(change, change * change)
+        self.last = price
+
+
+class RollingMax(Indicator):
+    """max price over the last `window` updates, from a deque of (update number, price) with decreasing prices"""
+
+    __slots__ = ('window', 'seen', 'candidates')
+
+    sign = 1
+
+    def __init__(self, window: int=INDICATOR_WINDOW) -> None:
+        self.window = window
+        self.seen = 0
+        self.candidates: deque = deque()
+
+    def update(self, price: float, volume: float=0.0) -> None:
+        key = price * self.sign
+        # anything in the window that's not above the new price can never be the max again
+        while self.candidates and self.candidates[-1][1] * self.sign <= key:
+            self.candidates.pop()
+        self.candidates.append((self.seen, price))
+        if self.candidates[0][0] <= self.seen - self.window:
+            self.candidates.popleft()
+        self.seen += 1
+
+    @property
+    def value(self) -> Optional[float]:
+        return self.candidates[0][1] if self.candidates else None
+
+    def state(self) -> dict:
+        return {**super().state(), 'candidates': [list(candidate) for candidate in self.candidates]}
+
+    def restore(self, state: dict) -> None:
+        super().restore(state)
+        self.candidates = deque(tuple(candidate) for candidate in state['candidates'])
+
+
+class RollingMin(RollingMax):
+    """min price over the last `window` updates"""
+
+    __slots__ = ()
+
+    sign = -1
+
+
+class Indicators:
+    """Thread-safe set of named indicators all fed from the same price updates"""
+
+    def __init__(self, **indicators: Indicator) -> None:
+        self.indicators: Dict[str, Indicator] = indicators
+        self.updates = 0
+        self.lock = threading.Lock()    # prices arrive on the feed's thread, ticks read them on another
+
+    def __getitem__(self, name: str) -> Optional[float]:
+        with self.lock:
+            return self.indicators[name].value
+
+    def update(self, price: float, volume: float=0.0) -> None:
+        with self.lock:
+            for indicator in self.indicators.values():
+                indicator.update(price, volume)
+            self.updates += 1
+
+    def values(self) -> Dict[str, Optional[float]]:
+        with self.lock:
+            return {name: indicator.value for name, indicator in self.indicators.items()}
+
+    def state(self) -> dict:
+        with self.lock:
+            return {
+                'updates': self.updates,
+                'indicators': {name: indicator.state() for name, indicator in self.indicators.items()},
+            }
+
+    def restore(self, state: dict) -> None:
+        """load a checkpoint from state(), skipping indicators that were added or reconfigured since"""
+        with self.lock:
+            for name, indicator_state in state.get('indicators', {}).items():
+                indicator = self.indicators.get(name)
+                if indicator is not None and indicator_state.get('window', indicator_state.get('span')) == indicator.size:
+                    indicator.restore(indicator_state)
+            self.updates = state.get('updates', 0)
+
+
+def default_indicators(window: int=INDICATOR_WINDOW) -> Indicators:
+    """the indicators the example bots keep up-to-date for the strategy"""
+    return Indicators(
+        ema=EMA(window),
+        vwap=RollingVWAP(window),
+        stddev=RollingStd(window),
+        volatility=Volatility(window),
+        low=RollingMin(window),
+        high=RollingMax(window),
+    )
@@ -0,0 +1,169 @@
+"""
+Running realized P&L, so net gains never have to be re-summed from every closed order
+
+Each buy/sell pair's profit is added once, when it closes (or once at startup
+for the pairs loaded from disk), to a running total plus hourly & daily
+buckets, per symbol and overall, e.g.:
+
+    ledger = PnLLedger()
+    ledger.load('ethusd', closed_orders)
+    ledger.record('ethusd', {'buy': buy_order, 'sell': sell_order})
+    ledger.net_gains()                                      # O(1)
+    ledger.pnl(start_ms, end_ms, symbol='ethusd')           # O(log hours)
+    ledger.daily(start_ms, end_ms)                          # [(day_start_ms, USD), ...]
+
+Buckets are keyed by the sell order's timestamp, in UTC.  Amounts are kept as
+integer USD units (see symbols.Currency) so the totals never drift.
+"""
+
+import threading
+
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+from symbols import USD
+from strategy import net_profit
+from snapshot import ClosedOrders, HOUR_MS
+
+DAY_MS = 24 * HOUR_MS
+
+
+class Buckets:
+    """Sorted {bucket_start_ms: units} with prefix sums, for O(log n) range totals"""
+
+    def __init__(self, size_ms: int) -> None:
+        self.size_ms = size_ms
+        self.keys: List[int] = []
+        self.values: List[int] = []
+        self.prefix: List[int] = [0]    # prefix[i] == sum(values[:i]), valid up to self.valid
+        self.valid = 0
+
+    def add(self, timestamp_ms: int, units: int) -> None:
+        key = timestamp_ms - timestamp_ms % self.size_ms
+        if self.keys and key == self.keys[-1]:
+            # the common case: another trade in the latest bucket
+            self.values[-1] += units
+            if self.valid == len(self.keys):
+                self.prefix[-1] += units
+            return
+
+        i = bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            self.values[i] += units
+        else:
+            self.keys.insert(i, key)
+            self.values.insert(i, units)
+        if i == len(self.keys) - 1 and self.valid == i:
+            self.prefix.append(self.prefix[-1] + units)
+            self.valid = len(self.keys)
+        else:
+            # an older bucket changed, the prefix sums after it are rebuilt on the next query
+            self.valid = min(self.valid, i)
+
+    def rebuild_prefix(self) -> None:
+        del self.prefix[self.valid + 1:]
+        for value in self.values[self.valid:]:
+            self.prefix.append(self.prefix[-1] + value)
+        self.valid = len(self.keys)
+
+    def total(self, start_ms: int=None, end_ms: int=None) -> int:
+        """sum of the buckets that start in [start_ms, end_ms)"""
+        if self.valid < len(self.keys):
+            self.rebuild_prefix()
+        start = 0 if start_ms is None else bisect_left(self.keys, start_ms - start_ms % self.size_ms)
+        end = len(self.keys) if end_ms is None else bisect_left(self.keys, end_ms)
+        return self.prefix[end] - self.prefix[start] if end > start else 0
+
+    def items(self, start_ms: int=None, end_ms: int=None) -> List[Tuple[int, int]]:
+        start = 0 if start_ms is None else bisect_left(self.keys, start_ms - start_ms % self.size_ms)
+        end = len(self.keys) if end_ms is None else bisect_left(self.keys, end_ms)
+        return list(zip(self.keys[start:end], self.values[start:end]))
+
+
+class Account:
+    """realized P&L totals & buckets for one symbol, or for all of them"""
+
+    def __init__(self) -> None:
+        self.units = 0
+        self.trades = 0
+        self.hours = Buckets(HOUR_MS)
+        self.days = Buckets(DAY_MS)
+
+    def add(self, timestamp_ms: int, units: int) -> None:
+        self.units += units
+        self.trades += 1
+        self.hours.add(timestamp_ms, units)
+        self.days.add(timestamp_ms, units)
+
+    def add_hours(self, hours: Dict[int, int], trades: int) -> None:
+        """add many trades at once, already summed into {hour_start_ms: units}"""
+        for hour, units in hours.items():
+            self.hours.add(hour, units)
+            self.days.add(hour, units)
+        self.units += sum(hours.values())
+        self.trades += trades
+
+
+class PnLLedger:
+    """Thread-safe running totals of realized profit, bucketed by hour, day & symbol"""
+
+    def __init__(self) -> None:
+        self.all = Account()
+        self.symbols: Dict[str, Account] = {}
+        self.lock = threading.Lock()
+
+    def account(self, symbol: Optional[str]) -> Account:
+        if symbol is None:
+            return self.all
+        return self.symbols.setdefault(symbol, Account())
+
+    ### Updates
+
+    def record(self, symbol: str, pair: dict) -> USD:
+        """add the profit of a newly closed {'buy': Order, 'sell': Order} pair, returns the profit"""
+        profit = net_profit(pair)
+        timestamp_ms = pair['sell'].timestamp_ms
+        with self.lock:
+            self.all.add(timestamp_ms, profit.units)
+            self.account(symbol).add(timestamp_ms, profit.units)
+        return profit
+
+    def load(self, symbol: str, closed_orders: Dict[str, dict]) -> None:
+        """add all of a symbol's closed pairs loaded from disk, e.g. at startup"""
+        if isinstance(closed_orders, ClosedOrders):
+            # from the snapshot's hourly summary, without parsing its orders
+            hours, trades = closed_orders.profit_by_hour()
+        else:
+            hours, trades = {}, len(closed_orders)
+            for pair in closed_orders.values():
+                hour = pair['sell'].timestamp_ms - pair['sell'].timestamp_ms % HOUR_MS
+                hours[hour] = hours.get(hour, 0) + net_profit(pair).units
+        with self.lock:
+            self.all.add_hours(hours, trades)
+            self.account(symbol).add_hours(hours, trades)
+
+    ### Queries
+
+    def net_gains(self, symbol: str=None) -> USD:
+        """total realized profit, overall or for one symbol"""
+        with self.lock:
+            return USD.from_units(self.account(symbol).units)
+
+    def trades(self, symbol: str=None) -> int:
+        with self.lock:
+            return self.account(symbol).trades
+
+    def pnl(self, start_ms: int=None, end_ms: int=None, symbol: str=None) -> USD:
+        """realized profit of the pairs closed in [start_ms, end_ms), to the hour"""
+        with self.lock:
+            return USD.from_units(self.account(symbol).hours.total(start_ms, end_ms))
+
+    def hourly(self, start_ms: int=None, end_ms: int=None, symbol: str=None) -> List[Tuple[int, USD]]:
+        """[(hour_start_ms, profit)] for every hour in the range with a closed pair"""
+        with self.lock:
+            return [(hour, USD.from_units(units)) for hour, units in self.account(symbol).hours.items(start_ms, end_ms)]
+
+    def daily(self, start_ms: int=None, end_ms: int=None, symbol: str=None) -> List[Tuple[int, USD]]:
+        """[(day_start_ms, profit)] for every UTC day in the range with a closed pair"""
+        with self.lock:
+            return [(day, USD.from_units(units)) for day, units in self.account(symbol).days.items(start_ms, end_ms)]
@@ -0,0 +1,105 @@
+"""
+Streaming public market data from the Gemini WebSocket API
+
+    https://docs.gemini.com/websocket-api/#market-data
+
+Instead of polling /pubticker, one connection per symbol pushes every trade to
+the strategy the moment it happens, e.g.:
+
+    feed = MarketDataFeed('ethusd', on_trade=lambda price, amount, ts: print(price))
+    feed.start()
+"""
+
+import json
+import threading
+
+from time import sleep
+from decimal import Decimal
+from typing import Callable, Optional
+
+import gemini_api as api
+from metrics import metrics
+from settings import MARKET_DATA_TIMEOUT
+
+TradeCallback = Callable[[Decimal, Decimal, int], None]     # (price, amount, timestampms)
+UpdateCallback = Callable[[dict], None]                     # raw 'update' or 'heartbeat' message
+
+
+class MarketDataFeed:
+    """Background thread that streams the public trades & book changes for one symbol"""
+
+    def __init__(self, symbol: str, on_trade: TradeCallback=None, on_update: UpdateCallback=None,
+                       timeout: float=MARKET_DATA_TIMEOUT, max_reconnect_delay: float=30) -> None:
+        self.symbol = symbol
+        self.on_trade = on_trade
+        self.on_update = on_update
+        self.timeout = timeout
+        self.max_reconnect_delay = max_reconnect_delay
+        self.last_price: Optional[Decimal] = None
+        self.connected = threading.Event()
+        self.running = False
+        self.thread: Optional[threading.Thread] = None
+        self.ws = None
+
+    @property
+    def url(self) -> str:
+        return f'/marketdata/{self.symbol}?heartbeat=true&auctions=false'
+
+    ### Lifecycle
+
+    def start(self) -> 'MarketDataFeed':
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name=f'marketdata-{self.symbol}', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.running = False
+        if self.ws is not None:
+            self.ws.close()  # unblocks the recv() in the background thread
+        if self.thread is not None:
+            self.thread.join()
+
+    def run(self) -> None:
+        """connect and dispatch messages until stopped, reconnecting on any error"""
+
+        reconnect_delay = 1
+        while self.running:
+            try:
+                self.ws = api.websocket_request(self.url, public=True)
+                self.ws.settimeout(self.timeout)
+                self.connected.set()
+                reconnect_delay = 1
+
+                while self.running:
+                    msg = json.loads(self.ws.recv())
+                    metrics.inc('ws_messages_total', stream='marketdata', symbol=self.symbol)
+                    self.handle_message(msg)
+            except Exception as e:
+                if self.running:
+                    metrics.inc('ws_reconnects_total', stream='marketdata', symbol=self.symbol)
+                    print(f'[!] {self.symbol} market data connection lost ({e}), reconnecting in {reconnect_delay}s...')
+            finally:
+                self.connected.clear()
+                if self.ws is not None:
+                    self.ws.close()
+
+            if self.running:
+                sleep(reconnect_delay)
+                reconnect_delay = min(reconnect_delay * 2, self.max_reconnect_delay)
+
+    ### Message Handling
+
+    def handle_message(self, msg: dict) -> None:
+        # heartbeats are passed on too, they carry the socket_sequence used to detect gaps
+        if self.on_update:
+            self.on_update(msg)
+
+        if msg.get('type') != 'update':
+            return  # heartbeat
+
+        for event in msg['events']:
+            if event['type'] == 'trade':
+                self.last_price = Decimal(event['price'])
+                if self.on_trade:
+                    self.on_trade(self.last_price, Decimal(event['amount']), msg.get('timestampms'))
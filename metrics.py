@@ -0,0 +1,249 @@
+"""
+Latency & throughput metrics for the API pipeline and the bot's ticks
+
+Every API request is timed per endpoint in stages: waiting for the rate
+limiter, reserving a nonce, signing the payload (json + base64 + HMAC-SHA384),
+the network round-trip, and decoding the response json.  Retries, 429s and
+websocket messages are counted, and each tick of the bot is broken down into
+ticker, status refresh, buys, sells, and persistence, e.g.:
+
+    with metrics.timer('tick_stage_seconds', symbol='ethusd', stage='buys'):
+        bot.buy(price)
+    metrics.inc('ws_messages_total', stream='marketdata')
+
+Exporter writes everything to DATA_DIR/metrics.prom in the Prometheus text
+format (e.g. for node_exporter's textfile collector) and prints a summary
+every METRICS_INTERVAL seconds.  With METRICS_ENABLED = False, timer() hands
+back a shared no-op and inc() returns right away, so the instrumentation
+costs about one attribute check per call.
+"""
+
+import os
+import threading
+
+from bisect import bisect_left
+from time import perf_counter, monotonic
+from typing import Dict, List, Optional, Tuple
+
+from settings import METRICS_ENABLED, METRICS_FILE, METRICS_INTERVAL
+
+# histogram bucket upper bounds in seconds, from 50us nonce reservations to 10s+ timeouts
+BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """counts of observations per bucket, plus their total & sum, like a Prometheus histogram"""
+
+    __slots__ = ('counts', 'count', 'sum')
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)     # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q: float) -> float:
+        """upper bound of the bucket holding the q-th quantile, e.g. 0.99"""
+        rank, seen = q * self.count, 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class Timer:
+    """context manager that adds the seconds spent inside it to a histogram"""
+
+    __slots__ = ('metrics', 'key', 'started')
+
+    def __init__(self, metrics: 'Metrics', key: Tuple[str, Labels]) -> None:
+        self.metrics = metrics
+        self.key = key
+
+    def __enter__(self) -> 'Timer':
+        self.started = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.metrics.observe_key(self.key, perf_counter() - self.started)
+
+
+class NullTimer:
+    """timer() while metrics are disabled"""
+
+    def __enter__(self) -> 'NullTimer':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+NULL_TIMER = NullTimer()
+
+
+class Metrics:
+    """Thread-safe registry of labeled histograms & counters"""
+
+    def __init__(self, enabled: bool=METRICS_ENABLED) -> None:
+        self.enabled = enabled
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(name: str, labels: dict) -> Tuple[str, Labels]:
+        return name, tuple(sorted(labels.items()))
+
+    ### Recording
+
+    def timer(self, name: str, **labels: str):
+        """time a block of code into the histogram `name`, e.g. with metrics.timer('api_stage_seconds', ...):"""
+        if not self.enabled:
+            return NULL_TIMER
+        return Timer(self, self.key(name, labels))
+
+    def observe(self, name: str, seconds: float, **labels: str) -> None:
+        if self.enabled:
+            self.observe_key(self.key(name, labels), seconds)
+
+    def observe_key(self, key: Tuple[str, Labels], seconds: float) -> None:
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name: str, amount: float=1, **labels: str) -> None:
+        if not self.enabled:
+            return
+        key = self.key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def reset(self) -> None:
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    ### Exporting
+
+    def prometheus(self) -> str:
+        """all the metrics in the Prometheus text exposition format"""
+        with self.lock:
+            histograms = {key: (list(h.counts), h.count, h.sum) for key, h in self.histograms.items()}
+            counters = dict(self.counters)
+
+        lines: List[str] = []
+        typed = set()
+        for (name, labels), (counts, count, total) in sorted(histograms.items()):
+            if name not in typed:
+                lines.append(f'# TYPE {name} histogram')
+                typed.add(name)
+            cumulative = 0
+            for bound, bucket_count in zip((*BUCKETS, '+Inf'), counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{format_labels(labels, le=bound)} {cumulative}')
+            lines.append(f'{name}_sum{format_labels(labels)} {total:.6f}')
+            lines.append(f'{name}_count{format_labels(labels)} {count}')
+        for (name, labels), value in sorted(counters.items()):
+            if name not in typed:
+                lines.append(f'# TYPE {name} counter')
+                typed.add(name)
+            lines.append(f'{name}{format_labels(labels)} {value:g}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str=METRICS_FILE) -> None:
+        """atomically replace a Prometheus textfile, so a scrape never reads it half-written"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus())
+        os.replace(tmp_path, path)
+
+    def summary(self, last_counters: Dict[Tuple[str, Labels], float]=None, seconds: float=None) -> List[str]:
+        """a line per histogram (count, mean, p50, p99) and counter (total, and its rate since last_counters)"""
+        with self.lock:
+            histograms = {key: (h.count, h.sum, h.quantile(0.5), h.quantile(0.99)) for key, h in self.histograms.items()}
+            counters = dict(self.counters)
+
+        lines = []
+        for (name, labels), (count, total, p50, p99) in sorted(histograms.items()):
+            lines.append(
+                f'{name}{format_labels(labels)}   n={count}   mean={total / count * 1000:.2f}ms   '
+                f'p50<={p50 * 1000:g}ms   p99<={p99 * 1000:g}ms'
+            )
+        for key, value in sorted(counters.items()):
+            name, labels = key
+            line = f'{name}{format_labels(labels)}   {value:g}'
+            if last_counters is not None and seconds:
+                line += f'   {(value - last_counters.get(key, 0)) / seconds:.2f}/s'
+            lines.append(line)
+        return lines
+
+
+def format_labels(labels: Labels, le=None) -> str:
+    pairs = [f'{name}="{value}"' for name, value in labels]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def endpoint(url: str) -> str:
+    """an API url without its query string, used as the endpoint label"""
+    return url.split('?', 1)[0]
+
+
+class Exporter(threading.Thread):
+    """write the metrics textfile and print a summary from a background thread every `interval` seconds"""
+
+    def __init__(self, metrics: Metrics, path: str=METRICS_FILE, interval: float=METRICS_INTERVAL) -> None:
+        super().__init__(name='metrics', daemon=True)
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.last_counters: Optional[Dict[Tuple[str, Labels], float]] = None
+        self.last_export = monotonic()
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self.export()
+
+    def export(self) -> None:
+        try:
+            self.metrics.write(self.path)
+        except OSError as e:
+            print(f'[!] Failed to write metrics to {self.path}: {e}')
+        now = monotonic()
+        with self.metrics.lock:
+            counters = dict(self.metrics.counters)
+        lines = self.metrics.summary(self.last_counters or {}, now - self.last_export)
+        self.last_counters, self.last_export = counters, now
+        if lines:
+            print('[i] Metrics:\n    ' + '\n    '.join(lines))
+
+    def stop(self) -> None:
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
+            self.export()
+
+
+# default registry shared by the API bindings & the bots
+metrics = Metrics()
+
+def start_exporter(path: str=METRICS_FILE, interval: float=METRICS_INTERVAL) -> Optional[Exporter]:
+    """start exporting the default registry, or return None if metrics are disabled"""
+    if not metrics.enabled:
+        return None
+    exporter = Exporter(metrics, path, interval)
+    exporter.start()
+    return exporter
@@ -0,0 +1,810 @@
+#!/usr/bin/env python3
+"""
+Local mock of the Gemini exchange, for testing & benchmarking offline
+
+Serves the subset of the API the bots use, with the same request signing:
+
+    REST API:
+        public:
+            /pubticker/<symbol>
+            /book/<symbol>
+        private:
+            /heartbeat
+            /order/new
+            /order/status
+            /order/cancel
+            /orders
+
+    WebSocket API:
+        public:
+            /marketdata/<symbol>
+        private:
+            /order/events
+
+Private requests are checked the same way Gemini checks them: the API key,
+the HMAC-SHA384 signature of the payload, the signed request path, and that
+the nonce increased.  Orders are matched by a price-time priority engine
+against a price feed (random, or replayed from a PriceStore), and latency,
+429s, dropped connections, and lost responses can be injected to test how the bots cope.
+
+The order book served over /book and /marketdata is the account's resting
+orders, plus the rest of the market quoting market_depth at the ticker's bid
+& ask around the last price.  Every trade in the price feed is streamed as a
+market data trade event, along with the book changes it caused.
+
+Usage:
+    ./mock_exchange.py                                  # ethusd on http://127.0.0.1:8080, random walk prices
+    ./mock_exchange.py ethusd --replay data/ethusd      # replay recorded price history instead
+    ./mock_exchange.py --latency 0.05 --jitter 0.05 --rate-limit 10 --disconnect 0.01
+
+Then point the bots at it in settings.py:
+    API_URL = 'http://127.0.0.1:8080'
+    API_WS_URL = 'ws://127.0.0.1:8080'
+
+Or from Python, e.g. in a benchmark:
+    exchange = MockExchange('ethusd').start()
+    api.client = api.GeminiClient(exchange.url, ws_url=exchange.ws_url)
+    exchange.trade(Decimal('915.39'))
+"""
+
+import sys
+import hmac
+import json
+import base64
+import asyncio
+import argparse
+import binascii
+import threading
+
+from time import time
+from heapq import heappush, heappop
+from random import Random
+from decimal import Decimal, InvalidOperation
+from hashlib import sha384
+from itertools import count
+from collections import Counter
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from symbols import currency_pair_by_symbol
+from price_store import PriceStore, symbol_store
+from settings import API_VERSION, API_KEY, API_SECRET, SYMBOL
+
+try:
+    from aiohttp import web
+except ImportError:
+    print('The package aiohttp is required to run the mock exchange:')
+    print('    pip install aiohttp')
+    raise SystemExit(1)
+
+Tick = Tuple[int, Decimal, Decimal]                 # (timestamp_ms, price, volume), volume 0 if unknown
+EventListener = Callable[[List[dict]], None]
+MarketListener = Callable[[str, Optional[Tick]], None]     # (reason: 'place', 'cancel' or 'trade', the trade if any)
+Levels = Dict[str, Dict[Decimal, Decimal]]          # {'bid' / 'ask': {price: amount}}
+
+BID, ASK = 'bid', 'ask'
+
+
+class Faults(NamedTuple):
+    """failures to inject into every response"""
+    latency: float = 0.0                # seconds to wait before handling each request
+    jitter: float = 0.0                 # up to this many extra random seconds on top of latency
+    rate_limit: int = 0                 # max requests per second per API key before 429s, 0 for unlimited
+    disconnect_ratio: float = 0.0       # chance of dropping the connection instead of responding
+    lost_response_ratio: float = 0.0    # chance of handling a request, then dropping the connection before responding
+    seed: int = 0
+
+
+class ApiError(Exception):
+    """an error response in Gemini's format, e.g. {'result': 'error', 'reason': 'InvalidNonce'}"""
+
+    def __init__(self, reason: str, message: str, status: int=400) -> None:
+        super().__init__(message)
+        self.reason = reason
+        self.message = message
+        self.status = status
+
+    def response(self) -> 'web.Response':
+        return web.json_response(
+            {'result': 'error', 'reason': self.reason, 'message': self.message},
+            status=self.status,
+        )
+
+
+### Matching Engine
+
+class MockOrder:
+    """the engine's state for one of the account's orders"""
+
+    __slots__ = (
+        'id', 'side', 'price', 'original', 'executed', 'notional',
+        'timestampms', 'is_cancelled', 'client_order_id',
+    )
+
+    def __init__(self, id: str, side: str, price: Decimal, amount: Decimal, client_order_id: str=None) -> None:
+        self.id = id
+        self.side = side
+        self.price = price
+        self.original = amount
+        self.executed = Decimal(0)
+        self.notional = Decimal(0)        # sum of price * amount over all the fills
+        self.timestampms = int(time() * 1000)
+        self.is_cancelled = False
+        self.client_order_id = client_order_id
+
+    @property
+    def remaining(self) -> Decimal:
+        return self.original - self.executed
+
+    @property
+    def is_live(self) -> bool:
+        return not self.is_cancelled and self.remaining > 0
+
+
+class MatchingEngine:
+    """Price-time priority book of the account's limit orders, filled by the trades in a price feed
+
+    A new order that crosses the last traded price fills immediately at that
+    price.  Otherwise it rests in the book, and each trade from the feed fills
+    the resting orders it crosses at their limit prices: best price first, then
+    oldest first, until the trade's volume is used up (trades with a volume of 0
+    have unlimited volume).
+    """
+
+    def __init__(self, symbol: str=SYMBOL, first_order_id: int=44375901) -> None:
+        base, quote = currency_pair_by_symbol[symbol]
+        self.symbol = symbol
+        self.base, self.quote = base, quote
+        self.orders: Dict[str, MockOrder] = {}
+        self.live: Dict[str, MockOrder] = {}                # the orders that are still open
+        self.client_orders: Dict[str, MockOrder] = {}       # {client_order_id: order}
+        self.bids: List[Tuple[Decimal, int, str]] = []      # heap of (-price, seq, order_id)
+        self.asks: List[Tuple[Decimal, int, str]] = []      # heap of (price, seq, order_id)
+        self.listeners: List[EventListener] = []
+        self.market_listeners: List[MarketListener] = []   # called after anything that can change the book
+        self.last_price: Optional[Decimal] = None
+        self.last_timestamp_ms = 0
+        self.volume = Decimal(0)                            # in the base currency, e.g. ETH
+        self.quote_volume = Decimal(0)                      # in the quote currency, e.g. USD
+        self.seq = count()
+        self.order_ids = count(first_order_id)
+        self.trade_ids = count(first_order_id * 10)
+
+    ### Orders
+
+    def new_order(self, side: str, amount: Decimal, price: Decimal, client_order_id: str=None) -> MockOrder:
+        order = MockOrder(str(next(self.order_ids)), side, price, amount, client_order_id)
+        self.orders[order.id] = order
+        if client_order_id is not None:
+            self.client_orders[client_order_id] = order
+        events = [self.event(order, 'accepted')]
+
+        crosses = self.last_price is not None and (
+            price >= self.last_price if side == 'buy' else price <= self.last_price
+        )
+        if crosses:
+            events += self.fill(order, amount, self.last_price, 'Taker')
+        else:
+            book, key = (self.bids, -price) if side == 'buy' else (self.asks, price)
+            heappush(book, (key, next(self.seq), order.id))
+            events.append(self.event(order, 'booked'))
+
+        if order.is_live:
+            self.live[order.id] = order
+        self.emit(events)
+        self.emit_market('place')
+        return order
+
+    def cancel(self, order_id: str) -> MockOrder:
+        """cancel an order, it's lazily dropped from the book the next time it reaches the top"""
+        order = self.orders[order_id]
+        if order.is_live:
+            order.is_cancelled = True
+            self.live.pop(order.id, None)
+            self.emit([self.event(order, 'cancelled'), self.event(order, 'closed')])
+            self.emit_market('cancel')
+        return order
+
+    def levels(self) -> Levels:
+        """the total remaining amount of the live orders at each price, on each side of the book"""
+        levels: Levels = {BID: {}, ASK: {}}
+        for order in self.live.values():
+            side = levels[BID if order.side == 'buy' else ASK]
+            side[order.price] = side.get(order.price, Decimal(0)) + order.remaining
+        return levels
+
+    ### Price Feed
+
+    def trade(self, price: Decimal, amount: Decimal=Decimal(0), timestamp_ms: int=None) -> None:
+        """apply one trade from the price feed, filling any resting orders it crosses"""
+        self.last_price = price
+        self.last_timestamp_ms = timestamp_ms or int(time() * 1000)
+        self.volume += amount
+        self.quote_volume += amount * price
+
+        volume = amount if amount > 0 else None
+        events: List[dict] = []
+        for book, side in ((self.bids, 'buy'), (self.asks, 'sell')):
+            while book and (volume is None or volume > 0):
+                order = self.orders[book[0][2]]
+                if not order.is_live:
+                    heappop(book)
+                    continue
+                if (order.price < price) if side == 'buy' else (order.price > price):
+                    break
+                fill_amt = order.remaining if volume is None else min(volume, order.remaining)
+                events += self.fill(order, fill_amt, order.price, 'Maker')
+                if volume is not None:
+                    volume -= fill_amt
+                if not order.is_live:
+                    heappop(book)
+        if events:
+            self.emit(events)
+        self.emit_market('trade', (self.last_timestamp_ms, price, amount))
+
+    def replay(self, ticks: Iterable[Tick]) -> None:
+        for timestamp_ms, price, volume in ticks:
+            self.trade(price, volume, timestamp_ms)
+
+    ### Events
+
+    def fill(self, order: MockOrder, amount: Decimal, price: Decimal, liquidity: str) -> List[dict]:
+        order.executed += amount
+        order.notional += amount * price
+        events = [self.event(order, 'fill', fill={
+            'trade_id': str(next(self.trade_ids)),
+            'liquidity': liquidity,
+            'price': self.format_price(price),
+            'amount': self.format_amount(amount),
+            'fee': '0',
+            'fee_currency': self.quote.symbol.upper(),
+        })]
+        if not order.is_live:
+            self.live.pop(order.id, None)
+            events.append(self.event(order, 'closed'))
+        return events
+
+    def emit(self, events: List[dict]) -> None:
+        for listener in self.listeners:
+            listener(events)
+
+    def emit_market(self, reason: str, trade: Tick=None) -> None:
+        for listener in self.market_listeners:
+            listener(reason, trade)
+
+    def format_price(self, price: Decimal) -> str:
+        return str(price.quantize(self.quote._quantum))
+
+    def format_amount(self, amount: Decimal) -> str:
+        return format(amount.quantize(self.base._quantum).normalize(), 'f')
+
+    def status(self, order: MockOrder) -> dict:
+        """an order's json, exactly as /order/status returns it"""
+        avg_price = order.notional / order.executed if order.executed else Decimal(0)
+        status = {
+            'order_id': order.id,
+            'id': order.id,
+            'symbol': self.symbol,
+            'exchange': 'gemini',
+            'avg_execution_price': self.format_price(avg_price),
+            'side': order.side,
+            'type': 'exchange limit',
+            'timestamp': str(order.timestampms // 1000),
+            'timestampms': order.timestampms,
+            'is_live': order.is_live,
+            'is_cancelled': order.is_cancelled,
+            'is_hidden': False,
+            'was_forced': False,
+            'executed_amount': self.format_amount(order.executed),
+            'remaining_amount': self.format_amount(order.remaining),
+            'options': [],
+            'price': self.format_price(order.price),
+            'original_amount': self.format_amount(order.original),
+        }
+        if order.client_order_id is not None:
+            status['client_order_id'] = order.client_order_id
+        return status
+
+    def event(self, order: MockOrder, event_type: str, **extra) -> dict:
+        """an order's json as an /order/events event, which uses 'type' for the event type"""
+        event = self.status(order)
+        del event['id']
+        event['order_type'] = event.pop('type')
+        return {'type': event_type, **event, **extra}
+
+
+### Price Feeds
+
+def store_ticks(store: PriceStore, start_ms: int=None, end_ms: int=None) -> Iterator[Tick]:
+    """the rows of a PriceStore as ticks, e.g. to replay recorded price history"""
+    timestamps, prices, volumes = store.read(start_ms, end_ms)
+    for timestamp_ms, price, volume in zip(timestamps.tolist(), prices.tolist(), volumes.tolist()):
+        yield timestamp_ms, Decimal(price).scaleb(-store.price_decimals), Decimal(volume).scaleb(-store.volume_decimals)
+
+def random_walk_ticks(price: Decimal=Decimal(900), volatility: float=0.001,
+                      interval_ms: int=1000, seed: int=0) -> Iterator[Tick]:
+    """an endless feed of prices that move by a random percentage every tick"""
+    rng = Random(seed)
+    value = float(price)
+    timestamp_ms = int(time() * 1000)
+    while True:
+        value *= 1 + rng.gauss(0, volatility)
+        yield timestamp_ms, Decimal(f'{value:.2f}'), Decimal(0)
+        timestamp_ms += interval_ms
+
+
+### Server
+
+class MockExchange:
+    """aiohttp server exposing a MatchingEngine through Gemini's REST & WebSocket API"""
+
+    def __init__(self, symbol: str=SYMBOL, faults: Faults=Faults(),
+                       api_key: str=API_KEY, api_secret: str=API_SECRET,
+                       nonce_window: int=0, heartbeat_interval: float=5.0,
+                       spread: Decimal=Decimal('0.0002'), market_depth: Decimal=Decimal(100)) -> None:
+        self.engine = MatchingEngine(symbol)
+        self.engine.market_listeners.append(self.publish_market_data)
+        self.faults = faults
+        self.random = Random(faults.seed)
+        self.api_key = api_key
+        self.api_secret = api_secret.encode()
+        self.nonce_window = nonce_window                # how far below the highest nonce an unseen nonce can be, 0 for strictly increasing
+        self.heartbeat_interval = heartbeat_interval    # seconds between heartbeats on quiet websockets, like gemini
+        self.spread = spread                            # ratio between the ticker's bid & ask around the last price
+        self.market_depth = market_depth                # amount the rest of the market quotes at the ticker's bid & ask
+        self.market_book: Levels = {BID: {}, ASK: {}}   # the book as last published over /marketdata
+        self.market_queues: List[asyncio.Queue] = []    # one per /marketdata socket
+        self.market_event_ids = count(1)
+        self.highest_nonces: Dict[str, int] = {}
+        self.recent_nonces: Dict[str, set] = {}
+        self.rate_windows: Dict[str, List[int]] = {}   # {api_key: [second, request_count]}
+        self.stats: Counter = Counter()                 # requests, rate_limited, disconnects, lost_responses, errors
+        self.sockets: set = set()
+        self.app = self.build_app()
+        self.runner: Optional[web.AppRunner] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread: Optional[threading.Thread] = None
+        self.url = ''
+        self.ws_url = ''
+
+    def build_app(self) -> 'web.Application':
+        app = web.Application(middlewares=[self.inject_faults])
+        prefix = f'/v{API_VERSION}'
+        app.router.add_get(f'{prefix}/pubticker/{{symbol}}', self.pubticker)
+        app.router.add_get(f'{prefix}/book/{{symbol}}', self.book)
+        app.router.add_post(f'{prefix}/heartbeat', self.heartbeat)
+        app.router.add_post(f'{prefix}/order/new', self.new_order)
+        app.router.add_post(f'{prefix}/order/status', self.order_status)
+        app.router.add_post(f'{prefix}/order/cancel', self.cancel_order)
+        app.router.add_post(f'{prefix}/orders', self.live_orders)
+        app.router.add_get(f'{prefix}/order/events', self.order_events)
+        app.router.add_get(f'{prefix}/marketdata/{{symbol}}', self.market_data)
+        app.on_shutdown.append(self.close_sockets)
+        return app
+
+    ### Lifecycle
+
+    async def serve(self, host: str='127.0.0.1', port: int=8080) -> None:
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+        host, port = self.runner.addresses[0][:2]
+        self.url, self.ws_url = f'http://{host}:{port}', f'ws://{host}:{port}'
+
+    async def feed(self, ticks: Iterable[Tick], interval: float=1.0) -> None:
+        """replay a price feed into the engine, one tick every interval seconds"""
+        for timestamp_ms, price, volume in ticks:
+            self.engine.trade(price, volume, timestamp_ms)
+            await asyncio.sleep(interval)
+
+    def run(self, host: str='127.0.0.1', port: int=8080, ticks: Iterable[Tick]=None, interval: float=1.0) -> None:
+        """serve in the foreground until interrupted"""
+        async def main():
+            await self.serve(host, port)
+            print(f'[√] Mock Gemini exchange for {self.engine.symbol} listening on {self.url}')
+            if ticks is not None:
+                await self.feed(ticks, interval)
+            await asyncio.Event().wait()
+        asyncio.run(main())
+
+    def start(self, host: str='127.0.0.1', port: int=0, ticks: Iterable[Tick]=None, interval: float=1.0) -> 'MockExchange':
+        """serve from a background thread (on a free port by default), returns once it's listening"""
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='mock-exchange', daemon=True)
+        self.thread.start()
+        self.call(self.serve(host, port))
+        if ticks is not None:
+            asyncio.run_coroutine_threadsafe(self.feed(ticks, interval), self.loop)
+        return self
+
+    def stop(self) -> None:
+        self.call(self.runner.cleanup())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    def call(self, coro):
+        """run a coroutine on the background server's loop and wait for its result"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def trade(self, price: Decimal, amount: Decimal=Decimal(0), timestamp_ms: int=None) -> None:
+        """push one trade into the price feed of a started exchange, safe to call from any thread"""
+        async def push():
+            self.engine.trade(price, amount, timestamp_ms)
+        self.call(push())
+
+    async def close_sockets(self, app: 'web.Application') -> None:
+        for ws in list(self.sockets):
+            await ws.close()
+
+    ### Validation
+
+    @web.middleware
+    async def inject_faults(self, request: 'web.Request', handler) -> 'web.StreamResponse':
+        self.stats['requests'] += 1
+        faults = self.faults
+        if faults.latency or faults.jitter:
+            await asyncio.sleep(faults.latency + self.random.random() * faults.jitter)
+
+        if faults.rate_limit and self.rate_limited(request.headers.get('X-GEMINI-APIKEY', request.remote)):
+            self.stats['rate_limited'] += 1
+            response = ApiError('RateLimit', 'Requests were made too frequently', status=429).response()
+            response.headers['Retry-After'] = '1'
+            return response
+
+        if faults.disconnect_ratio and self.random.random() < faults.disconnect_ratio:
+            self.stats['disconnects'] += 1
+            request.transport.abort()
+            return web.Response(status=503)  # never sent, the connection is already gone
+
+        try:
+            response = await handler(request)
+        except ApiError as e:
+            self.stats['errors'] += 1
+            response = e.response()
+
+        if faults.lost_response_ratio and self.random.random() < faults.lost_response_ratio:
+            # the request took effect, but the client never finds out, e.g. a read timeout
+            self.stats['lost_responses'] += 1
+            request.transport.abort()
+            return web.Response(status=503)
+        return response
+
+    def rate_limited(self, key: str) -> bool:
+        second = int(time())
+        window = self.rate_windows.setdefault(key, [second, 0])
+        if window[0] != second:
+            window[0], window[1] = second, 0
+        window[1] += 1
+        return window[1] > self.faults.rate_limit
+
+    def authenticate(self, request: 'web.Request') -> dict:
+        """check a private request's headers the way gemini does, returns the signed payload"""
+        api_key = request.headers.get('X-GEMINI-APIKEY')
+        payload_b64 = request.headers.get('X-GEMINI-PAYLOAD')
+        signature = request.headers.get('X-GEMINI-SIGNATURE')
+        if not (api_key and payload_b64 and signature):
+            raise ApiError('MissingHeaders', 'Private requests need the X-GEMINI-APIKEY, -PAYLOAD and -SIGNATURE headers')
+        if not hmac.compare_digest(api_key, self.api_key):
+            raise ApiError('InvalidApiKey', 'Unknown API key', status=403)
+
+        expected = hmac.new(self.api_secret, payload_b64.encode(), sha384).hexdigest()
+        if not hmac.compare_digest(expected, signature):
+            raise ApiError('InvalidSignature', 'The payload signature does not match the API secret')
+
+        try:
+            payload = json.loads(base64.b64decode(payload_b64))
+        except (ValueError, binascii.Error):
+            raise ApiError('InvalidJson', 'The payload is not base64 encoded JSON')
+        if payload.get('request') != request.path:
+            raise ApiError('InvalidRequestURL', f'Payload request {payload.get("request")} does not match {request.path}')
+        if not self.accept_nonce(api_key, payload.get('nonce')):
+            raise ApiError('InvalidNonce', f'Nonce {payload.get("nonce")} has already been used or is too old')
+        return payload
+
+    def accept_nonce(self, api_key: str, nonce) -> bool:
+        if not isinstance(nonce, int):
+            return False
+        highest = self.highest_nonces.get(api_key, 0)
+        if nonce > highest:
+            self.highest_nonces[api_key] = nonce
+        elif nonce <= highest - self.nonce_window:
+            return False
+
+        if self.nonce_window:
+            recent = self.recent_nonces.setdefault(api_key, set())
+            if nonce in recent:
+                return False
+            recent.add(nonce)
+            if len(recent) > 2 * self.nonce_window:
+                floor = self.highest_nonces[api_key] - self.nonce_window
+                self.recent_nonces[api_key] = {n for n in recent if n > floor}
+        return True
+
+    def find_order(self, payload: dict) -> MockOrder:
+        if 'client_order_id' in payload:
+            order = self.engine.client_orders.get(str(payload['client_order_id']))
+        else:
+            order = self.engine.orders.get(str(payload.get('order_id')))
+        if order is None:
+            order_id = payload.get('order_id', payload.get('client_order_id'))
+            raise ApiError('OrderNotFound', f'Order {order_id} not found')
+        return order
+
+    @staticmethod
+    def parse_amount(payload: dict, field: str, reason: str) -> Decimal:
+        try:
+            amount = Decimal(str(payload.get(field)))
+        except InvalidOperation:
+            raise ApiError(reason, f'Invalid {field} {payload.get(field)}')
+        if not amount.is_finite() or amount <= 0:
+            raise ApiError(reason, f'Invalid {field} {payload.get(field)}')
+        return amount
+
+    def check_symbol(self, request: 'web.Request') -> None:
+        if request.match_info['symbol'] != self.engine.symbol:
+            raise ApiError('InvalidSymbol', f'Unknown symbol {request.match_info["symbol"]}')
+
+    ### Order Book
+
+    def bid_ask(self) -> Tuple[Decimal, Decimal]:
+        """the ticker's bid & ask, spread around the last price"""
+        last = self.engine.last_price or Decimal(0)
+        quantum = self.engine.quote._quantum
+        return (last - last * self.spread / 2).quantize(quantum), (last + last * self.spread / 2).quantize(quantum)
+
+    def book_levels(self) -> Levels:
+        """the account's resting orders, plus the rest of the market's quotes at the ticker's bid & ask"""
+        levels = self.engine.levels()
+        if self.engine.last_price and self.market_depth:
+            for side, price in zip((BID, ASK), self.bid_ask()):
+                levels[side][price] = levels[side].get(price, Decimal(0)) + self.market_depth
+        return levels
+
+    def book_changes(self, old: Levels, new: Levels, reason: str) -> List[dict]:
+        """market data change events for every level that differs between two books"""
+        engine = self.engine
+        changes = []
+        for side in (BID, ASK):
+            for price in sorted(old[side].keys() | new[side].keys()):
+                remaining = new[side].get(price, Decimal(0))
+                delta = remaining - old[side].get(price, Decimal(0))
+                if delta:
+                    changes.append({
+                        'type': 'change',
+                        'side': side,
+                        'price': engine.format_price(price),
+                        'remaining': engine.format_amount(remaining),
+                        'delta': engine.format_amount(delta),
+                        'reason': reason,
+                    })
+        return changes
+
+    def publish_market_data(self, reason: str, trade: Tick=None) -> None:
+        """send a trade and the book changes it caused (or just the changes of a new or cancelled order) to /marketdata"""
+        book = self.book_levels()
+        events = self.book_changes(self.market_book, book, reason)
+        self.market_book = book
+        timestamp_ms = trade[0] if trade else int(time() * 1000)
+        if trade is not None:
+            _, price, amount = trade
+            bid, _ = self.bid_ask()
+            events.append({
+                'type': 'trade',
+                'tid': next(self.engine.trade_ids),
+                'price': self.engine.format_price(price),
+                'amount': self.engine.format_amount(amount),
+                'makerSide': BID if price <= bid else ASK,
+            })
+        if events:
+            for queue in self.market_queues:
+                queue.put_nowait(self.market_update(events, timestamp_ms))
+
+    def market_update(self, events: List[dict], timestamp_ms: int=None) -> dict:
+        update = {'type': 'update', 'eventId': next(self.market_event_ids)}
+        if timestamp_ms is not None:
+            update.update(timestamp=timestamp_ms // 1000, timestampms=timestamp_ms)
+        return {**update, 'events': events}
+
+    ### REST Endpoints
+
+    async def pubticker(self, request: 'web.Request') -> 'web.Response':
+        self.check_symbol(request)
+        engine = self.engine
+        last = engine.last_price or Decimal(0)
+        bid, ask = self.bid_ask()
+        return web.json_response({
+            'bid': engine.format_price(bid),
+            'ask': engine.format_price(ask),
+            'volume': {
+                engine.base.symbol.upper(): engine.format_amount(engine.volume),
+                engine.quote.symbol.upper(): engine.format_price(engine.quote_volume),
+                'timestamp': engine.last_timestamp_ms,
+            },
+            'last': engine.format_price(last),
+        })
+
+    async def book(self, request: 'web.Request') -> 'web.Response':
+        self.check_symbol(request)
+        try:
+            limit_bids = int(request.query.get('limit_bids', 50))
+            limit_asks = int(request.query.get('limit_asks', 50))
+        except ValueError:
+            raise ApiError('InvalidParameter', 'limit_bids & limit_asks must be integers')
+
+        levels, timestamp = self.book_levels(), str(int(time()))
+        def side(side: str, limit: int) -> List[dict]:
+            # best first, a limit of 0 returns every level
+            prices = sorted(levels[side], reverse=side == BID)
+            return [
+                {'price': self.engine.format_price(price), 'amount': self.engine.format_amount(levels[side][price]), 'timestamp': timestamp}
+                for price in (prices[:limit] if limit else prices)
+            ]
+        return web.json_response({'bids': side(BID, limit_bids), 'asks': side(ASK, limit_asks)})
+
+    async def heartbeat(self, request: 'web.Request') -> 'web.Response':
+        self.authenticate(request)
+        return web.json_response({'result': 'ok'})
+
+    async def new_order(self, request: 'web.Request') -> 'web.Response':
+        payload = self.authenticate(request)
+        if payload.get('symbol') != self.engine.symbol:
+            raise ApiError('InvalidSymbol', f'Unknown symbol {payload.get("symbol")}')
+        if payload.get('side') not in ('buy', 'sell'):
+            raise ApiError('InvalidSide', f'Invalid side {payload.get("side")}')
+        if payload.get('type') != 'exchange limit':
+            raise ApiError('InvalidOrderType', f'Only exchange limit orders are supported')
+
+        order = self.engine.new_order(
+            payload['side'],
+            self.parse_amount(payload, 'amount', 'InvalidQuantity'),
+            self.parse_amount(payload, 'price', 'InvalidPrice'),
+            payload.get('client_order_id'),
+        )
+        return web.json_response(self.engine.status(order))
+
+    async def order_status(self, request: 'web.Request') -> 'web.Response':
+        order = self.find_order(self.authenticate(request))
+        return web.json_response(self.engine.status(order))
+
+    async def cancel_order(self, request: 'web.Request') -> 'web.Response':
+        order = self.engine.cancel(self.find_order(self.authenticate(request)).id)
+        return web.json_response(self.engine.status(order))
+
+    async def live_orders(self, request: 'web.Request') -> 'web.Response':
+        self.authenticate(request)
+        return web.json_response([self.engine.status(order) for order in self.engine.live.values()])
+
+    ### WebSocket Endpoints
+
+    async def order_events(self, request: 'web.Request') -> 'web.WebSocketResponse':
+        payload = self.authenticate(request)
+        order_id = payload.get('order_id')
+        only = (lambda events: [event for event in events if event['order_id'] == str(order_id)]) if order_id else None
+
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        queue: asyncio.Queue = asyncio.Queue()
+        socket_sequence = count()
+
+        async def send(message) -> None:
+            if isinstance(message, list):
+                sequence = next(socket_sequence)
+                message = [{**event, 'socket_sequence': sequence} for event in message]
+            else:
+                message['socket_sequence'] = next(socket_sequence)
+            await ws.send_json(message)
+
+        async def send_events(events: List[dict]) -> None:
+            events = only(events) if only else events
+            if events:
+                await send(events)
+
+        self.engine.listeners.append(queue.put_nowait)
+        try:
+            await send({
+                'type': 'subscription_ack',
+                'accountId': 1,
+                'subscriptionId': f'ws-order-events-{id(ws)}',
+                'symbolFilter': [],
+                'apiSessionFilter': [],
+                'eventTypeFilter': [],
+            })
+            await send_events([self.engine.event(order, 'initial') for order in self.engine.live.values()])
+            await self.stream(ws, queue, send_events, lambda: send({'type': 'heartbeat', 'timestampms': int(time() * 1000)}))
+        except ConnectionError:
+            pass  # the client went away
+        finally:
+            self.engine.listeners.remove(queue.put_nowait)
+        return ws
+
+    async def market_data(self, request: 'web.Request') -> 'web.WebSocketResponse':
+        self.check_symbol(request)
+        heartbeats = request.query.get('heartbeat', 'false') == 'true'
+
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        queue: asyncio.Queue = asyncio.Queue()
+        socket_sequence = count()
+
+        async def send(message: dict) -> None:
+            await ws.send_json({**message, 'socket_sequence': next(socket_sequence)})
+
+        async def heartbeat() -> None:
+            if heartbeats:
+                await send({'type': 'heartbeat'})
+
+        # the first update is the whole book, as 'initial' changes without a timestamp
+        self.market_queues.append(queue)
+        try:
+            empty: Levels = {BID: {}, ASK: {}}
+            await send(self.market_update(self.book_changes(empty, self.market_book, 'initial')))
+            await self.stream(ws, queue, send, heartbeat)
+        except ConnectionError:
+            pass  # the client went away
+        finally:
+            self.market_queues.remove(queue)
+        return ws
+
+    async def stream(self, ws: 'web.WebSocketResponse', queue: asyncio.Queue, send, heartbeat) -> None:
+        """send everything put on queue until the client goes away, with a heartbeat whenever it's quiet"""
+        self.sockets.add(ws)
+        reader = asyncio.ensure_future(self.drain(ws))
+        getter: Optional[asyncio.Future] = None
+        try:
+            while not ws.closed:
+                # wake up for new messages, the client closing, or the next heartbeat
+                getter = getter or asyncio.ensure_future(queue.get())
+                await asyncio.wait((getter, reader), timeout=self.heartbeat_interval, return_when=asyncio.FIRST_COMPLETED)
+                if reader.done():
+                    break
+                if not getter.done():
+                    await heartbeat()
+                    continue
+
+                message, getter = getter.result(), None
+                await send(message)
+                if self.faults.disconnect_ratio and self.random.random() < self.faults.disconnect_ratio:
+                    self.stats['disconnects'] += 1
+                    await ws.close()
+        finally:
+            self.sockets.discard(ws)
+            reader.cancel()
+            if getter is not None:
+                getter.cancel()
+
+    @staticmethod
+    async def drain(ws: 'web.WebSocketResponse') -> None:
+        """read (and ignore) client messages, so closes & pings are handled"""
+        async for _ in ws:
+            pass
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local mock of the Gemini exchange')
+    parser.add_argument('symbol', nargs='?', default=SYMBOL)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--replay', metavar='DATA_DIR', help='replay the price history in e.g. data/ethusd')
+    parser.add_argument('--interval', type=float, default=1.0, help='seconds between price feed ticks')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds to wait before every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='up to this many extra random seconds of latency')
+    parser.add_argument('--rate-limit', type=int, default=0, help='requests per second per API key before 429s')
+    parser.add_argument('--disconnect', type=float, default=0.0, help='chance of dropping a connection')
+    parser.add_argument('--lost-response', type=float, default=0.0, help='chance of dropping a connection after handling its request')
+    parser.add_argument('--nonce-window', type=int, default=0, help='accept unseen nonces this far below the highest')
+    parser.add_argument('--market-depth', type=Decimal, default=Decimal(100), help="amount the rest of the market quotes at the ticker's bid & ask")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.replay:
+        ticks: Iterable[Tick] = store_ticks(symbol_store(args.replay, args.symbol))
+    else:
+        ticks = random_walk_ticks(seed=args.seed)
+
+    faults = Faults(args.latency, args.jitter, args.rate_limit, args.disconnect, args.lost_response, args.seed)
+    exchange = MockExchange(args.symbol, faults=faults, nonce_window=args.nonce_window, market_depth=args.market_depth)
+    try:
+        exchange.run(args.host, args.port, ticks, args.interval)
+    except KeyboardInterrupt:
+        print(f'[i] Served {exchange.stats["requests"]} requests, {len(exchange.engine.orders)} orders')
+        sys.exit(0)
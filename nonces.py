@@ -0,0 +1,134 @@
+"""
+Nonce allocation for signed Gemini API requests
+
+    https://docs.gemini.com/rest-api/#private-api-invocation
+
+Every private request needs a nonce greater than the last one Gemini saw for
+the API key, including across restarts.  Rather than rewriting the nonce file
+on every request, blocks of nonces are reserved on disk with one durable write
+and then handed out from memory.  A crash just skips the unused part of a
+block, which is fine since nonces only have to increase, never be contiguous.
+
+Only one process can sign with a nonce file at a time.  Two processes sharing
+an API key would hand out interleaved blocks, and Gemini rejects every request
+signed from a lower block once it's seen one from a higher block, so the first
+allocation takes an exclusive lock on the file for the life of the process and
+a second process raises NonceFileInUse instead.  Symbols that share an API key
+should run in one process (e.g. ./example.py ethusd btcusd), or each process
+needs its own API key and DATA_DIR.  Processes with separate DATA_DIRs can't
+see each other, so they must never share a key.
+"""
+
+import os
+import fcntl
+import threading
+
+from settings import STARTING_NONCE, DATA_DIR, NONCE_BLOCK_SIZE
+
+
+class NonceFileInUse(Exception):
+    """another process is already signing requests with the nonces in this file"""
+
+
+class NonceAllocator:
+    """Thread-safe source of monotonically increasing nonces, for one process at a time"""
+
+    def __init__(self, path: str=os.path.join(DATA_DIR, '.last_nonce.txt'),
+                       block_size: int=NONCE_BLOCK_SIZE,
+                       min_nonce: int=STARTING_NONCE) -> None:
+        self.path = path
+        self.block_size = block_size
+        self.min_nonce = min_nonce
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.owner_fd = None    # held open, and flocked, while this process owns the nonce file
+        self.next = 0           # next nonce to hand out from the reserved block
+        self.limit = -1         # last nonce in the reserved block
+
+    def claim(self) -> None:
+        """take the nonce file for this process, raises NonceFileInUse if another process has it"""
+        with self.lock:
+            self._check_pid()
+            self._claim()
+
+    def _claim(self) -> None:
+        if self.owner_fd is not None:
+            return
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        fd = os.open(f'{self.path}.owner', os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            owner = os.read(fd, 32).decode().strip() or 'another process'
+            os.close(fd)
+            raise NonceFileInUse(
+                f'{self.path} is already in use by process {owner}, which is signing requests with the same '
+                f'API key.  Trade several symbols from one process instead (e.g. ./example.py ethusd btcusd), '
+                f'or give each process its own API key and DATA_DIR.'
+            ) from None
+
+        # note who owns it for the error above, the lock itself is released when the process exits
+        os.ftruncate(fd, 0)
+        os.pwrite(fd, str(os.getpid()).encode(), 0)
+        self.owner_fd = fd
+
+    def _check_pid(self) -> None:
+        if os.getpid() != self.pid:
+            # forked children must not reuse the parent's in-memory block, or its claim on the file
+            if self.owner_fd is not None:
+                os.close(self.owner_fd)
+            self.pid, self.owner_fd, self.next, self.limit = os.getpid(), None, 0, -1
+
+    def reserve(self, min_nonce: int) -> None:
+        """claim the next block of nonces, the file stores the highest nonce ever reserved"""
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+
+        # the lock lives in a separate file so the nonce file can be replaced atomically
+        lock_fd = os.open(f'{self.path}.lock', os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+
+            last = 0
+            try:
+                with open(self.path, 'r') as f:
+                    last = int(f.read().strip())
+            except (FileNotFoundError, ValueError):
+                pass
+
+            start = max(last, min_nonce, self.limit) + 1
+            limit = start + self.block_size - 1
+
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'w') as f:
+                f.write(str(limit))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        finally:
+            os.close(lock_fd)  # closing the fd releases the flock
+
+        self.next, self.limit = start, limit
+
+    def allocate(self, min_nonce: int=None) -> int:
+        """return a nonce greater than any previously handed out, claiming the nonce file on first use"""
+
+        min_nonce = self.min_nonce if min_nonce is None else min_nonce
+
+        with self.lock:
+            self._check_pid()
+            self._claim()
+
+            if self.next > self.limit or self.next <= min_nonce:
+                self.reserve(min_nonce)
+
+            nonce = self.next
+            self.next += 1
+            return nonce
+
+    __call__ = allocate
+
+
+# default allocator shared by every signed request in this process
+allocator = NonceAllocator()
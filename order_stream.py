@@ -0,0 +1,175 @@
+"""
+Order state pushed over a single Gemini WebSocket
+
+    https://docs.gemini.com/websocket-api/#order-events
+
+Instead of opening one /order/events socket per order (or polling
+/order/status), one long-lived connection subscribes to all of the account's
+orders.  Events are demultiplexed by order_id: the tracked Order objects are
+updated in place, then handed to any per-order callbacks or queues, e.g.:
+
+    events = OrderEventDispatcher(active_orders).start()
+    fills = events.subscribe(buy_order.id)
+    print(fills.get())
+"""
+
+import json
+import threading
+
+from time import sleep
+from queue import Queue
+from typing import Callable, Dict, List, Optional
+from collections import defaultdict, OrderedDict
+
+import gemini_api as api
+from metrics import metrics
+from symbols import Order
+from settings import ORDER_EVENTS_TIMEOUT
+
+# order fields that can be copied from an event straight onto the Order data,
+# events use 'type' for the event type and 'order_type' for the order's type
+ORDER_FIELDS = set(Order._schema) - {'type'}
+
+OrderCallback = Callable[[Order, dict], None]
+
+# how many unknown order ids to hold early events for, e.g. orders placed by other bots
+MAX_UNTRACKED_ORDERS = 1000
+
+
+class OrderEventDispatcher:
+    """Background thread that keeps a dict of {id: Order} up-to-date from one websocket"""
+
+    def __init__(self, orders: Dict[str, Order]=None, on_event: OrderCallback=None,
+                       timeout: float=ORDER_EVENTS_TIMEOUT, max_reconnect_delay: float=30) -> None:
+        self.orders = {} if orders is None else orders     # {order_id: Order}, shared with the caller
+        self.on_event = on_event                           # called for every change to any tracked order
+        self.timeout = timeout                             # gemini sends a heartbeat every 5s
+        self.max_reconnect_delay = max_reconnect_delay
+        self.callbacks: Dict[str, List[OrderCallback]] = defaultdict(list)
+        self.queues: Dict[str, Queue] = {}
+        self.untracked_events: OrderedDict = OrderedDict()   # {order_id: [event]} seen before track()
+        self.lock = threading.RLock()
+        self.connected = threading.Event()
+        self.running = False
+        self.thread: Optional[threading.Thread] = None
+        self.ws = None
+
+    ### Subscriptions
+
+    def track(self, order: Order) -> None:
+        """start applying events to a new order, including any that raced ahead of it"""
+        with self.lock:
+            self.orders[order.id] = order
+            early_events = self.untracked_events.pop(order.id, [])
+        for event in early_events:
+            self.dispatch(event)
+
+    def untrack(self, order_id: str) -> None:
+        """stop applying events to an order, e.g. once it's been sold"""
+        with self.lock:
+            self.orders.pop(order_id, None)
+
+    def subscribe(self, order_id: str, callback: OrderCallback=None) -> Optional[Queue]:
+        """call callback(order, event) for each event on order_id, or return a Queue of events"""
+        with self.lock:
+            if callback is not None:
+                self.callbacks[order_id].append(callback)
+                return None
+            return self.queues.setdefault(order_id, Queue())
+
+    def unsubscribe(self, order_id: str) -> None:
+        with self.lock:
+            self.callbacks.pop(order_id, None)
+            self.queues.pop(order_id, None)
+
+    ### Lifecycle
+
+    def start(self) -> 'OrderEventDispatcher':
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='order-events', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.running = False
+        if self.ws is not None:
+            self.ws.close()  # unblocks the recv() in the background thread
+        if self.thread is not None:
+            self.thread.join()
+
+    def run(self) -> None:
+        """connect, resync, and dispatch events until stopped, reconnecting on any error"""
+
+        reconnect_delay = 1
+        while self.running:
+            try:
+                self.ws = api.websocket_request('/order/events')
+                self.ws.settimeout(self.timeout)
+                # catch up on anything that happened while we weren't connected
+                self.resync()
+                self.connected.set()
+                reconnect_delay = 1
+
+                while self.running:
+                    msg = json.loads(self.ws.recv())
+                    metrics.inc('ws_messages_total', stream='order_events')
+                    self.handle_message(msg)
+            except Exception as e:
+                if self.running:
+                    metrics.inc('ws_reconnects_total', stream='order_events')
+                    print(f'[!] Order events connection lost ({e}), reconnecting in {reconnect_delay}s...')
+            finally:
+                self.connected.clear()
+                if self.ws is not None:
+                    self.ws.close()
+
+            if self.running:
+                sleep(reconnect_delay)
+                reconnect_delay = min(reconnect_delay * 2, self.max_reconnect_delay)
+
+    ### Event Handling
+
+    def resync(self) -> None:
+        """refresh all the tracked orders over REST and notify subscribers of any changes"""
+        for order_id in api.refresh_orders(self.orders):
+            order = self.orders.get(order_id)
+            if order is not None:
+                self.notify(order, {'type': 'resync', 'order_id': order_id})
+
+    def handle_message(self, msg) -> None:
+        # heartbeats & subscription acks are single objects, order events come in lists
+        if isinstance(msg, dict):
+            return
+        for event in msg:
+            self.dispatch(event)
+
+    def dispatch(self, event: dict) -> None:
+        """apply an order event to its tracked Order, then pass it on to subscribers"""
+
+        order_id = str(event.get('order_id'))
+        with self.lock:
+            order = self.orders.get(order_id)
+            if order is None:
+                # events for a new order can arrive before new_order() has returned
+                self.untracked_events.setdefault(order_id, []).append(event)
+                while len(self.untracked_events) > MAX_UNTRACKED_ORDERS:
+                    self.untracked_events.popitem(last=False)
+                return
+
+        order.update({
+            **order.data,
+            **{key: value for key, value in event.items() if key in ORDER_FIELDS},
+        })
+        self.notify(order, event)
+
+    def notify(self, order: Order, event: dict) -> None:
+        with self.lock:
+            callbacks = list(self.callbacks.get(order.id, ()))
+            queue = self.queues.get(order.id)
+
+        if self.on_event:
+            self.on_event(order, event)
+        for callback in callbacks:
+            callback(order, event)
+        if queue is not None:
+            queue.put(event)
@@ -0,0 +1,196 @@
+"""
+L2 order book maintained from the Gemini market data WebSocket
+
+    https://docs.gemini.com/websocket-api/#market-data
+    https://docs.gemini.com/rest-api/#current-order-book
+
+Each 'change' event carries the new total amount remaining at a price level,
+so the book is a {price: amount} dict per side plus a sorted list of prices
+for ordered access.  When an update is missed, a REST snapshot is fetched on
+a background thread, so the websocket keeps being read in the meantime, and
+the changes that arrive before it lands are replayed on top of it.  Prices are kept so the best level of each side sits at
+the tail of its list, which is where almost all updates land, e.g.:
+
+    book = OrderBook('ethusd', resync=api.book)
+    feed = MarketDataFeed('ethusd', on_update=book.handle_update).start()
+    print(book.best_bid, book.best_ask, book.price_to_fill('buy', ETH(2)))
+"""
+
+import threading
+
+from bisect import bisect_left
+from decimal import Decimal
+from typing import Callable, Dict, List, Optional, Tuple
+
+from symbols import Currency
+
+BID, ASK = 'bid', 'ask'
+
+
+class OrderBook:
+    """In-memory L2 book for one symbol with sequence-gap detection"""
+
+    def __init__(self, symbol: str, resync: Callable[[str], dict]=None) -> None:
+        self.symbol = symbol
+        self.resync = resync        # fetches a REST /book snapshot when we miss an update
+        self.levels: Dict[str, Dict[Decimal, Decimal]] = {BID: {}, ASK: {}}
+        # sorted sort keys for each side, bids by price and asks by -price,
+        # so the best level on each side is always the last item
+        self.keys: Dict[str, List[Decimal]] = {BID: [], ASK: []}
+        self.sequence = -1
+        self.synced = False
+        self.resyncing = False      # a snapshot is being fetched, changes are buffered until it's loaded
+        self.buffered: List[dict] = []
+        self.gaps = 0               # missed updates seen, so a snapshot fetched before the latest gap is fetched again
+        self.generation = 0         # bumped by each new connection, whose initial book replaces any pending snapshot
+        self.lock = threading.Lock()
+
+    ### Queries
+
+    @property
+    def best_bid(self) -> Optional[Decimal]:
+        keys = self.keys[BID]
+        return keys[-1] if keys else None
+
+    @property
+    def best_ask(self) -> Optional[Decimal]:
+        keys = self.keys[ASK]
+        return -keys[-1] if keys else None
+
+    @property
+    def spread(self) -> Optional[Decimal]:
+        bid, ask = self.best_bid, self.best_ask
+        return None if bid is None or ask is None else ask - bid
+
+    def depth(self, side: str, n: int=10) -> List[Tuple[Decimal, Decimal]]:
+        """the best n (price, amount) levels on one side of the book"""
+        levels, keys = self.levels[side], self.keys[side]
+        prices = (key if side == BID else -key for key in reversed(keys[-n:]))
+        return [(price, levels[price]) for price in prices]
+
+    def depth_to_fill(self, side: str, amount: Currency) -> Optional[Tuple[Decimal, Decimal]]:
+        """(average price, worst price) to buy or sell amount right now, None if the book is too thin"""
+
+        # buys take liquidity from the asks, sells from the bids
+        book_side = ASK if side == 'buy' else BID
+        levels, keys = self.levels[book_side], self.keys[book_side]
+
+        with self.lock:
+            remaining, cost = Decimal(amount.amt), Decimal(0)
+            for key in reversed(keys):
+                price = key if book_side == BID else -key
+                filled = min(remaining, levels[price])
+                cost += filled * price
+                remaining -= filled
+                if not remaining:
+                    return cost / Decimal(amount.amt), price
+        return None
+
+    def price_to_fill(self, side: str, amount: Currency) -> Optional[Decimal]:
+        """the limit price needed for an order of amount to fill completely right now"""
+        fill = self.depth_to_fill(side, amount)
+        return fill and fill[1]
+
+    ### Updates
+
+    def set_level(self, side: str, price: Decimal, amount: Decimal) -> None:
+        """set the total amount at a price level, O(log n) plus a short shift near the top of book"""
+        levels, keys = self.levels[side], self.keys[side]
+        key = price if side == BID else -price
+
+        if amount:
+            if price not in levels:
+                keys.insert(bisect_left(keys, key), key)
+            levels[price] = amount
+        elif price in levels:
+            del levels[price]
+            del keys[bisect_left(keys, key)]
+
+    def clear(self) -> None:
+        for side in (BID, ASK):
+            self.levels[side].clear()
+            self.keys[side].clear()
+
+    def load_levels(self, book_json: dict) -> None:
+        self.clear()
+        for side, key in ((BID, 'bids'), (ASK, 'asks')):
+            for level in book_json[key]:
+                self.set_level(side, Decimal(level['price']), Decimal(level['amount']))
+
+    def load_snapshot(self, book_json: dict) -> None:
+        """replace the book with a REST /book response"""
+        with self.lock:
+            self.load_levels(book_json)
+            self.synced = True
+
+    def handle_update(self, msg: dict) -> None:
+        """apply a market data message, resyncing from a snapshot if any were missed"""
+
+        sequence = msg.get('socket_sequence')
+        if sequence is not None:
+            if sequence == 0:
+                # new connection, its first update is an 'initial' snapshot of the whole book
+                with self.lock:
+                    self.clear()
+                    self.synced = True
+                    self.resyncing = False
+                    self.buffered = []
+                    self.generation += 1
+            elif sequence != self.sequence + 1:
+                print(f'[!] {self.symbol} order book missed {sequence - self.sequence - 1} updates, resyncing...')
+                with self.lock:
+                    self.synced = False
+                    self.gaps += 1
+            self.sequence = sequence
+
+        with self.lock:
+            if not self.synced and self.resync and not self.resyncing:
+                self.start_resync()
+
+            if msg.get('type') != 'update':
+                return  # heartbeat
+
+            changes = [event for event in msg['events'] if event['type'] == 'change']
+            if self.resyncing:
+                self.buffered.extend(changes)
+            else:
+                for event in changes:
+                    self.set_level(event['side'], Decimal(event['price']), Decimal(event['remaining']))
+
+    def start_resync(self) -> None:
+        """fetch a snapshot on a background thread, buffering the changes until it's loaded (call with the lock held)"""
+        self.resyncing = True
+        self.buffered = []
+        thread = threading.Thread(
+            target=self.finish_resync,
+            args=(self.generation, self.gaps),
+            name=f'orderbook-resync-{self.symbol}',
+            daemon=True,
+        )
+        thread.start()
+
+    def finish_resync(self, generation: int, gaps: int) -> None:
+        try:
+            book_json = self.resync(self.symbol)
+        except Exception as e:
+            print(f'[!] {self.symbol} order book resync failed ({e}), retrying on the next update')
+            with self.lock:
+                if generation == self.generation:
+                    self.resyncing = False
+                    self.buffered = []
+            return
+
+        with self.lock:
+            if generation != self.generation:
+                return  # a reconnect's initial book already replaced it
+
+            # the changes carry absolute amounts, so replaying the ones that arrived meanwhile is exact
+            self.load_levels(book_json)
+            for event in self.buffered:
+                self.set_level(event['side'], Decimal(event['price']), Decimal(event['remaining']))
+            self.buffered = []
+            if gaps != self.gaps:
+                self.start_resync()     # another update was missed after this snapshot was requested
+            else:
+                self.resyncing = False
+                self.synced = True
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Columnar, memory-mapped price history
+
+Each column is a flat file of little-endian int64s in DATA_DIR/<symbol>/prices/:
+
+    timestamp.i64   milliseconds since the epoch, always increasing
+    price.i64       price in units of the quote currency (e.g. cents for USD)
+    volume.i64      volume in units of the base currency (e.g. ETH for ethusd), 0 if unknown
+
+Rows are buffered in memory and appended in chunks.  Readers map the columns
+as NumPy arrays and find time ranges by binary search, without parsing, e.g.:
+
+    ts, price, volume = PriceStore('data/ethusd/prices').read(start_ms, end_ms)
+
+Usage:
+    ./price_store.py import data/ethusd    # import an existing price-history.csv
+"""
+
+import os
+import sys
+import json
+
+from time import time
+from array import array
+from decimal import Decimal
+from typing import Optional, Tuple
+
+from symbols import currency_pair_by_symbol
+from settings import PRICE_STORE_CHUNK_SIZE, PRICE_STORE_FLUSH_INTERVAL
+
+COLUMNS = ('timestamp', 'price', 'volume')
+ITEM_SIZE = 8
+
+
+class PriceStore:
+    """Append-only int64 columns of (timestamp_ms, price_units, volume_units)"""
+
+    def __init__(self, path: str, price_decimals: int=2, volume_decimals: int=2,
+                       chunk_size: int=PRICE_STORE_CHUNK_SIZE,
+                       flush_interval: float=PRICE_STORE_FLUSH_INTERVAL) -> None:
+        self.path = path
+        self.chunk_size = chunk_size
+        self.flush_interval = flush_interval
+        self.last_flush = time()
+        self.buffers = {column: array('q') for column in COLUMNS}
+        self.last_timestamp = -1
+        os.makedirs(path, exist_ok=True)
+
+        # the scale of the stored ints is fixed when the store is first created
+        meta_path = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        else:
+            meta = {'price_decimals': price_decimals, 'volume_decimals': volume_decimals}
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+        self.price_decimals = meta['price_decimals']
+        self.volume_decimals = meta['volume_decimals']
+
+        self.repair()
+
+    def column_path(self, column: str) -> str:
+        return os.path.join(self.path, f'{column}.i64')
+
+    def repair(self) -> None:
+        """truncate all the columns to the same number of complete rows, e.g. after a crash mid-flush"""
+        sizes = [
+            os.path.getsize(self.column_path(column)) if os.path.exists(self.column_path(column)) else 0
+            for column in COLUMNS
+        ]
+        rows = min(sizes) // ITEM_SIZE
+        for column, size in zip(COLUMNS, sizes):
+            if size != rows * ITEM_SIZE:
+                with open(self.column_path(column), 'ab') as f:
+                    f.truncate(rows * ITEM_SIZE)
+
+        if rows:
+            with open(self.column_path('timestamp'), 'rb') as f:
+                f.seek((rows - 1) * ITEM_SIZE)
+                last = array('q')
+                last.frombytes(f.read(ITEM_SIZE))
+                if sys.byteorder != 'little':
+                    last.byteswap()
+                self.last_timestamp = last[0]
+
+    def __len__(self) -> int:
+        stored = os.path.getsize(self.column_path('timestamp')) // ITEM_SIZE if os.path.exists(self.column_path('timestamp')) else 0
+        return stored + len(self.buffers['timestamp'])
+
+    ### Writing
+
+    def append(self, timestamp_ms: int, price: Decimal, volume: Decimal=Decimal(0)) -> None:
+        """add a row, rows with a timestamp older than the last one are dropped"""
+        if timestamp_ms < self.last_timestamp:
+            return
+        self.last_timestamp = timestamp_ms
+        self.buffers['timestamp'].append(timestamp_ms)
+        self.buffers['price'].append(round(Decimal(price).scaleb(self.price_decimals)))
+        self.buffers['volume'].append(round(Decimal(volume).scaleb(self.volume_decimals)))
+        if len(self.buffers['timestamp']) >= self.chunk_size or time() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        """append all the buffered rows to the column files"""
+        self.last_flush = time()
+        if not self.buffers['timestamp']:
+            return
+        for column, buffer in self.buffers.items():
+            if sys.byteorder != 'little':
+                buffer.byteswap()
+            with open(self.column_path(column), 'ab') as f:
+                buffer.tofile(f)
+            del buffer[:]
+
+    def close(self) -> None:
+        self.flush()
+
+    ### Reading
+
+    def columns(self) -> Tuple['np.ndarray', 'np.ndarray', 'np.ndarray']:
+        """memory-map all the flushed rows as read-only (timestamp, price, volume) int64 arrays"""
+        try:
+            import numpy as np
+        except ImportError:
+            print('The package numpy is required to read the price store:')
+            print('    pip install numpy')
+            raise SystemExit(1)
+
+        rows = min(
+            os.path.getsize(self.column_path(column)) // ITEM_SIZE if os.path.exists(self.column_path(column)) else 0
+            for column in COLUMNS
+        )
+        if not rows:
+            return tuple(np.empty(0, dtype='<i8') for _ in COLUMNS)  # type: ignore
+        return tuple(  # type: ignore
+            np.memmap(self.column_path(column), dtype='<i8', mode='r', shape=(rows,))
+            for column in COLUMNS
+        )
+
+    def read(self, start_ms: Optional[int]=None, end_ms: Optional[int]=None):
+        """(timestamp, price, volume) array views of the rows with start_ms <= timestamp < end_ms"""
+        timestamps, prices, volumes = self.columns()
+        start = 0 if start_ms is None else timestamps.searchsorted(start_ms, side='left')
+        end = len(timestamps) if end_ms is None else timestamps.searchsorted(end_ms, side='left')
+        return timestamps[start:end], prices[start:end], volumes[start:end]
+
+    def prices(self, start_ms: Optional[int]=None, end_ms: Optional[int]=None):
+        """(timestamp, price) arrays with the prices converted to float64, handy for analysis"""
+        timestamps, prices, _ = self.read(start_ms, end_ms)
+        return timestamps, prices / 10 ** self.price_decimals
+
+
+def symbol_store(data_dir: str, symbol: str) -> PriceStore:
+    """the price store in a symbol's data dir, scaled to its currencies' decimal places"""
+    A, B = currency_pair_by_symbol[symbol]  # 'ethusd' => (ETH, USD)
+    return PriceStore(os.path.join(data_dir, 'prices'), B.decimal_places, A.decimal_places)
+
+def import_csv(csv_path: str, store: PriceStore) -> int:
+    """append the rows of an old price-history.csv (timestamp_s,price) to a store, returns the count"""
+    count = 0
+    with open(csv_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            ts, price = line.strip().split(',', 1)
+            store.append(int(ts) * 1000, Decimal(price))
+            count += 1
+    store.flush()
+    return count
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3 or sys.argv[1] != 'import':
+        print(__doc__)
+        raise SystemExit(1)
+
+    data_dir = sys.argv[2]
+    store = symbol_store(data_dir, os.path.basename(os.path.normpath(data_dir)))
+    count = import_csv(os.path.join(data_dir, 'price-history.csv'), store)
+    print(f'[√] Imported {count} prices into {store.path}')
@@ -0,0 +1,136 @@
+"""
+Client-side rate limiting for the Gemini API
+
+    https://docs.gemini.com/rest-api/#rate-limits
+
+Gemini allows 120 public requests/minute (1/s recommended) and 600 private
+requests/minute (5/s recommended) per API key, and answers anything over that
+with a 429.  Instead of sleeping after being throttled, every request takes a
+token from a shared bucket first, so the whole process stays under the limit:
+
+    limiter_for(public=False).acquire(priority('/order/new'))    # or: await ...acquire_async()
+
+Requests have priorities: order placement, cancellation & heartbeats go first,
+status polls & tickers wait.  Lower priority requests also can't spend the
+last few tokens in a bucket, so there's always headroom left for orders.
+"""
+
+import asyncio
+import threading
+
+from time import monotonic, sleep
+from random import uniform
+from typing import Dict, Optional
+
+from settings import (
+    PUBLIC_RATE_LIMIT,
+    PUBLIC_RATE_BURST,
+    PRIVATE_RATE_LIMIT,
+    PRIVATE_RATE_BURST,
+    PRIVATE_ORDER_RESERVE,
+    RETRY_BASE_DELAY,
+    RETRY_MAX_DELAY,
+)
+
+# priority lanes, lower numbers go first
+ORDERS = 0      # /order/new, /order/cancel, /heartbeat
+STATUS = 1      # /order/status, /orders, /pubticker, /book, ...
+
+ORDER_URLS = ('/order/new', '/order/cancel', '/heartbeat')
+
+
+class RateLimiter:
+    """Token bucket with priority lanes, shared by all the threads & asyncio tasks in a process"""
+
+    def __init__(self, rate: float, burst: int, reserve: Dict[int, float]=None) -> None:
+        self.rate = rate                        # tokens added per second
+        self.burst = burst                      # max tokens the bucket holds
+        self.reserve = reserve or {}            # {priority: tokens that lane has to leave in the bucket}
+        self.tokens = float(burst)
+        self.updated = monotonic()
+        self.paused_until = 0.0
+        self.waiting: Dict[int, int] = {}       # {priority: number of requests waiting}
+        self.lock = threading.Lock()
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, priority: int=STATUS) -> float:
+        """take a token if one is free for this priority, returns 0 or the seconds to wait before trying again"""
+        with self.lock:
+            now = monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+
+            self.refill(now)
+            # tokens that have to be left for the requests waiting in higher priority lanes
+            held_back = self.reserve.get(priority, 0) + sum(
+                count for lane, count in self.waiting.items() if lane < priority
+            )
+            if self.tokens - 1 >= held_back:
+                self.tokens -= 1
+                return 0.0
+            return (held_back + 1 - self.tokens) / self.rate
+
+    def acquire(self, priority: int=STATUS) -> None:
+        """block the calling thread until a token is free"""
+        delay = self.try_acquire(priority)
+        if not delay:
+            return
+        self.wait(priority, +1)
+        try:
+            while delay:
+                sleep(delay)
+                delay = self.try_acquire(priority)
+        finally:
+            self.wait(priority, -1)
+
+    async def acquire_async(self, priority: int=STATUS) -> None:
+        """wait without blocking the event loop until a token is free"""
+        delay = self.try_acquire(priority)
+        if not delay:
+            return
+        self.wait(priority, +1)
+        try:
+            while delay:
+                await asyncio.sleep(delay)
+                delay = self.try_acquire(priority)
+        finally:
+            self.wait(priority, -1)
+
+    def wait(self, priority: int, change: int) -> None:
+        with self.lock:
+            self.waiting[priority] = self.waiting.get(priority, 0) + change
+
+    def throttle(self, seconds: float) -> None:
+        """stop handing out tokens for a while, e.g. after the server sent a 429 with Retry-After"""
+        with self.lock:
+            now = monotonic()
+            self.paused_until = max(self.paused_until, now + seconds)
+            self.tokens = 0.0
+            self.updated = max(self.updated, self.paused_until)
+
+
+# shared by gemini_api & gemini_api_async, so both stay under the same budgets
+public_limiter = RateLimiter(PUBLIC_RATE_LIMIT, PUBLIC_RATE_BURST)
+private_limiter = RateLimiter(PRIVATE_RATE_LIMIT, PRIVATE_RATE_BURST, reserve={STATUS: PRIVATE_ORDER_RESERVE})
+
+def limiter_for(public: bool) -> RateLimiter:
+    return public_limiter if public else private_limiter
+
+def priority(url: str) -> int:
+    return ORDERS if url.startswith(ORDER_URLS) else STATUS
+
+def backoff(attempt: int, retry_after: Optional[float]=None,
+            base: float=RETRY_BASE_DELAY, cap: float=RETRY_MAX_DELAY) -> float:
+    """seconds to wait before retry number `attempt` (from 0): exponential with full jitter, at least retry_after"""
+    delay = uniform(0, min(cap, base * 2 ** attempt))
+    return max(delay, retry_after or 0)
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """seconds from a Retry-After header, None if it's missing or an HTTP date"""
+    try:
+        return max(float(value), 0.0) if value else None
+    except ValueError:
+        return None
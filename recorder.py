@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+"""
+Record every API response & websocket message, and replay them deterministically
+
+Recording journals each payload the bot receives, exactly as it arrived, with
+a monotonic receive timestamp, into a memory-mapped append-only log:
+
+    api.client.recorder = Recorder('data/recordings/ethusd.rec')
+
+The log starts with MAGIC, then each record is a header and the raw payload:
+
+    recv_ns   int64   time.monotonic_ns() when it was received, DEFINE for a channel definition
+    length    uint32  payload bytes
+    channel   uint16  which endpoint it came from, e.g. 'GET /pubticker/ethusd' or 'WS /order/events'
+    status    uint16  HTTP status code, 0 for websocket messages
+
+Channels are named once, by a DEFINE record whose payload is the name, so
+each record only costs 16 bytes on top of its payload.  The file grows in
+RECORDER_CHUNK_SIZE steps and is trimmed on close().  After a crash, readers
+stop at the first all-zero header.
+
+The bots also record how the session was run, the script, loop & symbols,
+on the SESSION channel:
+
+    api.client.recorder.record_session('example', 'streamloop', ['ethusd'], use_order_events=True)
+
+Replaying swaps the API client for a ReplayClient, and runs the loop the
+session was recorded with, so the bot makes the same calls and gets back the
+recorded responses, in order per endpoint.  Recordings without a session
+record are replayed with the loop their channels point to: streamloop or
+multiloop for market data, runloop or multiloop for polled tickers.
+
+Websocket messages are released on the recorded timeline: in real time, or as
+soon as the bot has consumed the REST responses recorded before them.  If the
+bot stops asking for those (because it's diverged from the recording), they're
+skipped after REPLAY_STALL_TIMEOUT.  A replay ends when the bot asks for a
+response the recording doesn't have, or the market data runs out.
+
+Usage:
+    ./recorder.py replay data/recordings/ethusd.rec                 # as fast as possible
+    ./recorder.py replay data/recordings/ethusd.rec --realtime
+    ./recorder.py replay data/recordings/ethusd.rec ethusd          # check the recording traded ethusd
+    ./recorder.py show data/recordings/ethusd.rec                   # message counts per channel
+"""
+
+import os
+import sys
+import json
+import mmap
+import struct
+import tempfile
+import threading
+
+from time import monotonic_ns, sleep, perf_counter
+from itertools import islice
+from collections import deque, Counter
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from settings import MAX_CONCURRENT_REQUESTS, POLL_DELAY, RECORDER_CHUNK_SIZE, REPLAY_STALL_TIMEOUT
+
+MAGIC = b'APIREC01'
+RECORD = struct.Struct('<qIHH')     # recv_ns, length, channel, status
+DEFINE = -1                         # recv_ns of a record that names a channel
+SESSION = 'SESSION'                 # channel of the record describing how the session was run
+
+Payload = Union[bytes, str]
+
+
+class Recorder:
+    """Thread-safe, memory-mapped, append-only log of received payloads"""
+
+    def __init__(self, path: str, chunk_size: int=RECORDER_CHUNK_SIZE) -> None:
+        self.path = path
+        self.chunk_size = chunk_size
+        self.channels: Dict[str, int] = {}
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.file = open(path, 'w+b')
+        self.file.truncate(chunk_size)
+        self.map = mmap.mmap(self.file.fileno(), chunk_size)
+        self.map[:len(MAGIC)] = MAGIC
+        self.pos = len(MAGIC)
+
+    def record(self, channel: str, payload: Payload, status: int=0) -> None:
+        """journal a payload received from a channel (e.g. 'POST /order/new'), timestamped now"""
+        recv_ns = monotonic_ns()
+        if isinstance(payload, str):
+            payload = payload.encode()
+        with self.lock:
+            channel_id = self.channels.get(channel)
+            if channel_id is None:
+                channel_id = self.channels[channel] = len(self.channels)
+                self.write(DEFINE, channel_id, 0, channel.encode())
+            self.write(recv_ns, channel_id, status, payload)
+
+    def record_session(self, script: str, loop: str, symbols: List[str], **options) -> None:
+        """journal how the session is being run, e.g. ('example', 'runloop', ['ethusd']), so replay() can run it the same way"""
+        self.record(SESSION, json.dumps({'script': script, 'loop': loop, 'symbols': symbols, **options}))
+
+    def write(self, recv_ns: int, channel_id: int, status: int, payload: bytes) -> None:
+        end = self.pos + RECORD.size + len(payload)
+        if end > len(self.map):
+            # grow the file and remap it, the records written so far stay where they are
+            size = len(self.map) + max(self.chunk_size, RECORD.size + len(payload))
+            self.map.flush()
+            self.file.truncate(size)
+            self.map.resize(size)
+        # the payload goes in first, so a reader never sees a header for a half-written record
+        self.map[self.pos + RECORD.size:end] = payload
+        RECORD.pack_into(self.map, self.pos, recv_ns, len(payload), channel_id, status)
+        self.pos = end
+
+    def wrap_websocket(self, channel: str, ws) -> 'RecordingWebSocket':
+        return RecordingWebSocket(self, channel, ws)
+
+    def flush(self) -> None:
+        with self.lock:
+            self.map.flush()
+
+    def close(self) -> None:
+        """flush the log and trim it to the records written"""
+        with self.lock:
+            self.map.flush()
+            self.map.close()
+            self.file.truncate(self.pos)
+            self.file.close()
+
+
+class RecordingWebSocket:
+    """websocket-client connection proxy that records every message it receives"""
+
+    def __init__(self, recorder: Recorder, channel: str, ws) -> None:
+        self.recorder = recorder
+        self.channel = channel
+        self.ws = ws
+
+    def recv(self):
+        message = self.ws.recv()
+        if message:
+            # an empty read is the connection closing, which a replay's own websockets report
+            self.recorder.record(self.channel, message)
+        return message
+
+    def __getattr__(self, attr):
+        return getattr(self.ws, attr)
+
+
+def read_log(path: str) -> Iterator[Tuple[int, str, int, bytes]]:
+    """(recv_ns, channel, status, payload) of every record in a log, in the order they were received"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size <= len(MAGIC):
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as log:
+            if log[:len(MAGIC)] != MAGIC:
+                raise ValueError(f'{path} is not an API recording')
+            channels: Dict[int, str] = {}
+            pos = len(MAGIC)
+            while pos + RECORD.size <= len(log):
+                recv_ns, length, channel_id, status = RECORD.unpack_from(log, pos)
+                if recv_ns == 0 or pos + RECORD.size + length > len(log):
+                    break   # the unused end of the file, or a record torn by a crash
+                payload = log[pos + RECORD.size:pos + RECORD.size + length]
+                pos += RECORD.size + length
+                if recv_ns == DEFINE:
+                    channels[channel_id] = payload.decode()
+                else:
+                    yield recv_ns, channels[channel_id], status, payload
+
+
+### Replay
+
+class EndOfReplay(BaseException):
+    """raised when the bot asks for a response the recording doesn't have
+
+    A BaseException, so the API's retry loops let it through instead of retrying.
+    """
+
+
+class ReplayClient:
+    """Drop-in for gemini_api.client that answers each request with the next response recorded for it"""
+
+    def __init__(self, path: str, realtime: bool=False) -> None:
+        self.realtime = realtime
+        self.responses: Dict[str, Deque[Tuple[int, int, bytes]]] = {}
+        self.session: Optional[dict] = None     # how the session was run, if it was recorded
+        self.start_ns: Optional[int] = None
+        for recv_ns, channel, status, payload in read_log(path):
+            if self.start_ns is None:
+                self.start_ns = recv_ns
+            if channel == SESSION:
+                self.session = json.loads(payload)
+            else:
+                self.responses.setdefault(channel, deque()).append((recv_ns - self.start_ns, status, payload))
+        # the REST responses that hold back later websocket messages, heartbeats are answered without them
+        self.rest = [
+            queue for channel, queue in self.responses.items()
+            if not channel.startswith('WS ') and not channel.endswith(' /heartbeat')
+        ]
+        self.feeds = {channel for channel in self.responses if channel.startswith('WS /marketdata/')}
+        self.finished = threading.Event()   # set once the market data runs out, or a request can't be answered
+        self.ws_url = 'replay://'
+        self.recorder = None
+        self.clock_ns = 0           # position in the recording, as of the last response handed out
+        self.skipped_ns = 0         # REST responses recorded before this no longer hold back websocket messages
+        self.started = perf_counter()
+        self.progress = self.started    # when a response or message was last handed out
+        self.requests = 0
+        self.closed = False
+        self.lock = threading.Condition()
+
+    def advance(self, offset_ns: int) -> None:
+        """move the recording's clock up to a response, waiting for it in real time mode"""
+        if self.realtime:
+            delay = offset_ns / 1e9 - (perf_counter() - self.started)
+            if delay > 0:
+                sleep(delay)
+        with self.lock:
+            self.clock_ns = max(self.clock_ns, offset_ns)
+            self.progress = perf_counter()
+            self.lock.notify_all()
+
+    def due(self, offset_ns: int) -> bool:
+        """whether a websocket message recorded at offset_ns can be handed out yet, call with the lock held"""
+        if self.realtime or offset_ns <= max(self.clock_ns, self.skipped_ns):
+            return True
+        # most trades don't lead to a request, so waiting for the clock alone would stall the replay
+        if all(queue[0][0] > offset_ns for queue in self.rest if queue):
+            return True
+        if perf_counter() - self.progress > REPLAY_STALL_TIMEOUT:
+            print(f'[!] Replay skipping responses recorded before {offset_ns / 1e9:.3f}s that were never requested')
+            self.skipped_ns = offset_ns
+            return True
+        return False
+
+    def request(self, url: str, request_json: dict=None, method='POST', public: bool=False) -> dict:
+        from gemini_api import RateLimitExceeded
+
+        if url == '/heartbeat':
+            return {'result': 'ok'}    # heartbeats run on a timer, so they don't line up with the recording
+        queue = self.responses.get(f'{method} {url}')
+        with self.lock:
+            if not queue:
+                self.finished.set()
+                raise EndOfReplay(f'No more recorded responses for {method} {url}')
+            offset_ns, status, payload = self.next_response(queue, request_json)
+            self.requests += 1
+        self.advance(offset_ns)
+        if status == 429:
+            raise RateLimitExceeded()
+        return json.loads(payload)
+
+    @staticmethod
+    def next_response(queue: Deque[Tuple[int, int, bytes]], request_json: dict=None) -> Tuple[int, int, bytes]:
+        """pop the response recorded for a request, which for concurrent requests about different
+        orders is the one about the same order, not just the next one, since they can be answered in any order"""
+        keys = {key: str(request_json[key]) for key in ('client_order_id', 'order_id') if key in (request_json or {})}
+        if keys:
+            for i, (_, _, payload) in enumerate(islice(queue, MAX_CONCURRENT_REQUESTS)):
+                response = json.loads(payload)
+                if isinstance(response, dict) and all(str(response.get(key)) == value for key, value in keys.items()):
+                    response = queue[i]
+                    del queue[i]
+                    return response
+        return queue.popleft()
+
+    def websocket(self, url: str, request_json: dict=None, public: bool=False) -> 'ReplayWebSocket':
+        channel = f'WS {url}'
+        return ReplayWebSocket(self, channel, self.responses.get(channel, deque()))
+
+    def exhausted(self, channel: str) -> None:
+        """note a websocket has handed out all its messages, the replay is finished once every feed has"""
+        with self.lock:
+            self.feeds.discard(channel)
+            if not self.feeds:
+                self.finished.set()
+
+    def close(self) -> None:
+        with self.lock:
+            self.closed = True
+            self.lock.notify_all()
+
+
+class ReplayWebSocket:
+    """websocket connection that hands out the recorded messages once the replay's clock reaches them"""
+
+    def __init__(self, client: ReplayClient, channel: str, messages: Deque[Tuple[int, int, bytes]]) -> None:
+        self.client = client
+        self.channel = channel
+        self.messages = messages
+        self.closed = False
+
+    def settimeout(self, timeout: float) -> None:
+        pass
+
+    def recv(self) -> str:
+        client = self.client
+        with client.lock:
+            while True:
+                if self.closed or client.closed:
+                    raise ConnectionError('Replay websocket closed')
+                if self.messages and client.due(self.messages[0][0]):
+                    break
+                if not self.messages:
+                    client.exhausted(self.channel)
+                client.lock.wait(0.1 if client.realtime else REPLAY_STALL_TIMEOUT)
+            offset_ns, _, payload = self.messages.popleft()
+            client.progress = perf_counter()
+        if client.realtime:
+            client.advance(offset_ns)
+        return payload.decode()
+
+    def send(self, message: str) -> None:
+        pass
+
+    def close(self) -> None:
+        with self.client.lock:
+            self.closed = True
+            self.client.lock.notify_all()
+
+
+class AsyncReplayClient:
+    """Drop-in for gemini_api_async.client that answers each request from a ReplayClient"""
+
+    def __init__(self, replay: ReplayClient) -> None:
+        self.replay = replay
+        self.recorder = None
+
+    async def request(self, url: str, request_json: dict=None, method='POST', public: bool=False) -> dict:
+        return self.replay.request(url, request_json, method=method, public=public)
+
+    async def close(self) -> None:
+        pass
+
+
+def infer_session(channels: Iterable[str]) -> dict:
+    """how example.py ran a session recorded without a session record, from the channels it used"""
+    channels = set(channels)
+
+    def traded(prefix: str) -> List[str]:
+        return sorted({channel[len(prefix):].split('?')[0] for channel in channels if channel.startswith(prefix)})
+
+    streamed, polled = traded('WS /marketdata/'), traded('GET /pubticker/')
+    symbols = streamed or polled
+    if not symbols:
+        raise ValueError('The recording has no market data or ticker responses to drive a replay')
+    return {
+        'script': 'example',
+        'loop': 'multiloop' if len(symbols) > 1 else 'streamloop' if streamed else 'runloop',
+        'symbols': symbols,
+        'use_order_events': 'WS /order/events' in channels,
+        'use_market_data': bool(streamed),
+    }
+
+def run_session(client: ReplayClient, session: dict, data_dir: str) -> None:
+    """run the loop a session was recorded with against a ReplayClient, the bots keep their files in data_dir/<symbol>"""
+    script, loop, symbols = session['script'], session['loop'], session['symbols']
+    use_order_events = session.get('use_order_events', False)
+
+    if (script, loop) == ('example_async', 'runloop'):
+        import asyncio
+        import gemini_api_async
+        import example_async
+
+        gemini_api_async.client = AsyncReplayClient(client)
+        asyncio.run(example_async.runloop(symbols[0], poll_delay=0, data_dir=os.path.join(data_dir, symbols[0])))
+        return
+    if script != 'example' or loop not in ('runloop', 'streamloop', 'multiloop'):
+        raise ValueError(f"Can't replay a session recorded by {script}.{loop}")
+
+    import gemini_api
+    import example
+
+    gemini_api.client = client
+    if loop == 'runloop':
+        example.runloop(symbols[0], poll_delay=0, data_dir=os.path.join(data_dir, symbols[0]),
+                        use_order_events=use_order_events)
+    elif loop == 'streamloop':
+        example.streamloop(symbols[0], data_dir=os.path.join(data_dir, symbols[0]),
+                           use_order_events=use_order_events, stopped=client.finished)
+    else:
+        use_market_data = session.get('use_market_data', False)
+        example.multiloop(
+            symbols,
+            data_dir=data_dir,
+            use_order_events=use_order_events,
+            use_market_data=use_market_data,
+            # polled ticks drive the replay, so rounds only wait long enough for every lane to take its turn
+            poll_delay=POLL_DELAY if use_market_data else 0.01,
+            stopped=client.finished,
+        )
+
+def replay(path: str, symbol: str=None, realtime: bool=False, data_dir: str=None) -> ReplayClient:
+    """run a recording back through the loop it was recorded with, in a scratch data dir unless one is given
+
+    symbol, if given, has to be one the recording traded.  Raises ValueError for recordings that
+    can't be replayed, e.g. ones with nothing but order responses in them.
+    """
+    client = ReplayClient(path, realtime)
+    session = client.session or infer_session(client.responses)
+    if symbol and symbol not in session['symbols']:
+        raise ValueError(f'{path} was recorded trading {", ".join(session["symbols"])}, not {symbol}')
+
+    # the end of the recording can surface on any of the bot's threads, it's only an error on the main one
+    excepthook = threading.excepthook
+    threading.excepthook = lambda args: None if issubclass(args.exc_type, EndOfReplay) else excepthook(args)
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        try:
+            run_session(client, session, data_dir or scratch_dir)
+        except EndOfReplay:
+            pass
+        finally:
+            threading.excepthook = excepthook
+            client.close()
+    return client
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3 or sys.argv[1] not in ('replay', 'show'):
+        print(__doc__)
+        raise SystemExit(1)
+
+    if sys.argv[1] == 'show':
+        counts, size = Counter(), 0
+        for _, channel, _, payload in read_log(sys.argv[2]):
+            counts[channel] += 1
+            size += len(payload)
+        for channel, count in counts.most_common():
+            print(f'{count:>10}   {channel}')
+        print(f'{sum(counts.values()):>10}   messages, {size / 1e6:.1f}MB of payloads')
+    else:
+        args = [arg for arg in sys.argv[2:] if arg != '--realtime']
+        path, symbol = args[0], args[1] if len(args) > 1 else None
+        started = perf_counter()
+        try:
+            client = replay(path, symbol, realtime='--realtime' in sys.argv)
+        except ValueError as e:
+            print(f'[X] {e}')
+            raise SystemExit(1)
+        elapsed = perf_counter() - started
+        print(f'[√] Replayed {client.requests} responses in {elapsed:.2f}s ({client.requests / elapsed:.0f}/s)')
@@ -0,0 +1,105 @@
+"""
+Fair scheduling of many symbols' work on one shared pool of threads
+
+Each key (e.g. a symbol) gets its own lane: its jobs run one at a time, so a
+strategy never races itself, but different lanes run in parallel, so a slow
+API call for one symbol never delays another's ticks.  Ready lanes take turns
+round-robin, and a newer job replaces one with the same name that hasn't
+started yet (e.g. a tick for a price that's already stale), so a lane that
+falls behind catches up instead of building a backlog, e.g.:
+
+    scheduler = FairScheduler(workers=3).start()
+    scheduler.submit('ethusd', 'tick', lambda: bot.tick(price))
+"""
+
+import threading
+
+from time import monotonic
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, List, Optional, Set
+
+Job = Callable[[], None]
+
+
+class FairScheduler:
+    """Round-robin scheduler of per-key job lanes over a shared pool of worker threads"""
+
+    def __init__(self, workers: int=4, on_error: Callable[[str, str, Exception], None]=None) -> None:
+        self.workers = workers
+        self.on_error = on_error                            # called with (key, name, exception) when a job fails
+        self.pending: Dict[str, OrderedDict] = {}           # {key: {name: (job, submitted_at)}}
+        self.ready: Deque[str] = deque()                    # keys with pending jobs that aren't running
+        self.running: Set[str] = set()
+        self.paused: Set[str] = set()
+        self.latency: Dict[str, float] = {}                 # {key: seconds from submit to finish of its last job}
+        self.condition = threading.Condition()
+        self.threads: List[threading.Thread] = []
+        self.stopped = False
+
+    def start(self) -> 'FairScheduler':
+        for i in range(self.workers):
+            thread = threading.Thread(target=self.run, name=f'scheduler-{i}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def stop(self) -> None:
+        """finish the jobs that are running, drop the rest, and wait for the workers to exit"""
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join()
+
+    def submit(self, key: str, name: str, job: Job) -> None:
+        """queue a job in key's lane, replacing any job with the same name that hasn't started yet"""
+        with self.condition:
+            if self.stopped or key in self.paused:
+                return
+            lane = self.pending.setdefault(key, OrderedDict())
+            submitted_at = lane[name][1] if name in lane else monotonic()
+            lane[name] = (job, submitted_at)
+            if key not in self.running and key not in self.ready:
+                self.ready.append(key)
+                self.condition.notify()
+
+    def pause(self, key: str) -> None:
+        """drop key's pending jobs and ignore new ones, e.g. once its strategy has stopped trading"""
+        with self.condition:
+            self.paused.add(key)
+            self.pending.pop(key, None)
+            if key in self.ready:
+                self.ready.remove(key)
+
+    def next_job(self) -> Optional[tuple]:
+        with self.condition:
+            while not (self.ready or self.stopped):
+                self.condition.wait()
+            if self.stopped:
+                return None
+            key = self.ready.popleft()
+            name, (job, submitted_at) = self.pending[key].popitem(last=False)
+            self.running.add(key)
+            return key, name, job, submitted_at
+
+    def run(self) -> None:
+        while True:
+            next_job = self.next_job()
+            if next_job is None:
+                return
+            key, name, job, submitted_at = next_job
+            try:
+                job()
+            except Exception as e:
+                if self.on_error:
+                    self.on_error(key, name, e)
+                else:
+                    print(f'[!] {key} {name} failed: {e}')
+            finally:
+                with self.condition:
+                    self.latency[key] = monotonic() - submitted_at
+                    self.running.discard(key)
+                    # back of the line, so every other ready lane gets a turn first
+                    if self.pending.get(key):
+                        self.ready.append(key)
+                        self.condition.notify()
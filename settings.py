@@ -5,6 +5,27 @@ API_VERSION = 1
 API_URL = 'https://api.gemini.com'
 API_WS_URL = 'wss://api.gemini.com'
 STARTING_NONCE = 800                # must always increase incrementally
+NONCE_BLOCK_SIZE = 1000             # nonces reserved on disk per write to DATA_DIR/.last_nonce.txt
+HTTP_POOL_SIZE = 10                 # max number of keep-alive connections to hold open to the API
+HTTP_TIMEOUT = (3.05, 15)           # (connect, read) timeout in seconds for API requests
+MAX_CONCURRENT_REQUESTS = 5         # max requests in flight at once when fanning out, e.g. placing a batch of orders
+USE_ORDER_EVENTS = True             # track order state over one /order/events websocket instead of polling
+ORDER_EVENTS_TIMEOUT = 15           # seconds without a message (gemini heartbeats every 5s) before reconnecting
+USE_MARKET_DATA = True              # react to every trade on the /marketdata websocket instead of polling the ticker
+MARKET_DATA_TIMEOUT = 15            # seconds without a market data message before reconnecting
+HEARTBEAT_INTERVAL = 15             # seconds between keep-alive heartbeats sent from a background thread
+FANOUT_RING_SIZE = 65536            # market data updates the shared memory ring holds before a slow worker misses some
+FANOUT_WORKERS = 2                  # strategy worker processes fed from one feed handler & gateway by fanout.py
+FANOUT_POLL_INTERVAL = 0.001        # seconds a worker sleeps when it has read every update in the ring
+FANOUT_GATEWAY_TIMEOUT = 60         # seconds a worker waits for the gateway to answer a request before giving up on it
+PUBLIC_RATE_LIMIT = 1               # public requests per second, gemini allows 120/minute
+PUBLIC_RATE_BURST = 5               # public requests that can be sent at once after being idle
+PRIVATE_RATE_LIMIT = 5              # private requests per second, gemini allows 600/minute
+PRIVATE_RATE_BURST = 10             # private requests that can be sent at once after being idle
+PRIVATE_ORDER_RESERVE = 2           # private request tokens status polls leave for order placement & cancellation
+MAX_RETRIES = 4                     # times to retry a failed request before giving up
+RETRY_BASE_DELAY = 0.5              # seconds before the first retry, doubling (with random jitter) each time
+RETRY_MAX_DELAY = 30                # max seconds between retries
 
 SYMBOL = 'ethusd'                   # currency pair to trade
 POLL_DELAY = 30                     # runloop interval in seconds
@@ -14,11 +35,27 @@ USD_MAX_ORDER_AMT = Decimal(25.00)  # max amount to use when making new orders
 MAX_GAIN_RATIO = Decimal(0.02)      # maximum percentage gains before selling the order
 MAX_LOSS_RATIO = Decimal(-0.0075)   # maximum percentage losses before selling the order
 OVERPAY_RATIO = Decimal(0.0025)     # percentage to pay over current price in order to guarantee orders closing quickly
+INDICATOR_WINDOW = 60               # price updates the streaming indicators (EMA, VWAP, volatility, min/max) look back over
+MAX_BUY_VOLATILITY = None           # skip buying while the stddev of log returns over INDICATOR_WINDOW is above this, e.g. 0.002
+PRICE_FROM_BOOK = True              # price orders from the live order book depth when streaming, instead of OVERPAY_RATIO
 
 USD_MAX_NET_GAINS = 10000           # total maximum USD gains before quitting the program
 USD_MAX_NET_LOSS = -20              # total maximum USD losses before quitting the program
 
 DATA_DIR = './data'                # where to store the state and logs
+JOURNAL_FSYNC_INTERVAL = 1.0        # max seconds of order journal entries that can be lost in a crash
+JOURNAL_COMPACT_AFTER = 10000       # journal entries to accumulate before rewriting the order snapshots
+INDICATOR_CHECKPOINT_INTERVAL = 60  # max seconds between checkpoints of the streaming indicators' state
+PRICE_STORE_CHUNK_SIZE = 1024       # price history rows to buffer in memory before appending them to disk
+PRICE_STORE_FLUSH_INTERVAL = 5.0    # max seconds to buffer price history rows before appending them to disk
+CANDLE_BUFFER_SIZE = 1440           # latest candles of each resolution (1s, 1m, 5m, 1h, 1d) to keep in memory
+BACKTEST_CHUNK_SIZE = 2**18         # ticks the backtester builds range tables for at a time, ~log2 of it x 8 bytes each
+METRICS_ENABLED = False             # time every API request stage & tick stage, and export them below
+METRICS_FILE = os.path.join(DATA_DIR, 'metrics.prom')  # Prometheus textfile the metrics are written to
+METRICS_INTERVAL = 60               # seconds between metrics exports & summary logs
+RECORD_SESSION = False              # journal every API response & websocket message to DATA_DIR/recordings for replay
+RECORDER_CHUNK_SIZE = 4 * 1024**2   # bytes the recording file is grown by at a time
+REPLAY_STALL_TIMEOUT = 0.5          # seconds a fast replay waits on responses the bot never asks for before skipping them
 
 try:
     from secrets import *               # copy and edit secrets_default.py to secrets.py
@@ -0,0 +1,224 @@
+"""
+Binary snapshot of a bot's order state, for fast restarts
+
+DATA_DIR/<symbol>/orders-snapshot.bin holds a header, then:
+
+    active      json list of the active orders' data (there are only ever a few)
+    timestamps  int64 per closed pair, the sell order's timestampms
+    profits     int64 per closed pair, its net profit in USD units (cents)
+    offsets     int64 per closed pair + 1, where each pair's json starts in `pairs`
+    hours       int64 (hour_start_ms, profit_units) per hour with a closed pair
+    ids         the closed pairs' buy order ids, newline separated
+    pairs       each closed pair's json [buy_data, sell_data], back to back
+
+The file is memory-mapped, so loading it only reads the header and the
+active orders.  The ids are decoded the first time they're needed, each pair
+is parsed the first time it's accessed, and the hourly profit summary lets
+the P&L ledger load without looking at any pairs at all, e.g.:
+
+    active_orders, closed_orders = read_snapshot('data/ethusd')
+    closed_orders['44375901']['sell']       # parses just this pair
+    hours, trades = closed_orders.profit_by_hour()
+"""
+
+import os
+import sys
+import json
+import mmap
+import struct
+
+from array import array
+from typing import Dict, Iterator, List, MutableMapping, Optional, Tuple
+
+from symbols import Order
+from strategy import net_profit
+
+SNAPSHOT_FILE = 'orders-snapshot.bin'
+MAGIC = b'ORDSNAP1'
+HEADER = struct.Struct('<8sQQQQQ')   # magic, active_len, closed_count, hours_count, ids_len, pairs_len
+ITEM_SIZE = 8
+HOUR_MS = 60 * 60 * 1000
+
+Pair = Dict[str, Order]
+
+
+def int64s(buffer: memoryview) -> array:
+    values = array('q')
+    values.frombytes(buffer)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values
+
+
+class ClosedOrders(MutableMapping):
+    """{buy_order_id: {'buy': Order, 'sell': Order}} backed by a snapshot, parsing each pair only when it's accessed"""
+
+    def __init__(self, count: int=0, timestamps: array=None, profits: array=None, offsets: array=None,
+                       hours: Dict[int, int]=None, id_bytes: memoryview=memoryview(b''),
+                       pairs: memoryview=memoryview(b'')) -> None:
+        self.count = count                                  # pairs in the snapshot
+        self.timestamps = timestamps if timestamps is not None else array('q')
+        self.profits = profits if profits is not None else array('q')
+        self.offsets = offsets if offsets is not None else array('q', [0])
+        self.hours = hours or {}                            # {hour_start_ms: profit_units} of the snapshot's pairs
+        self.id_bytes = id_bytes
+        self.pairs = pairs
+        self._ids: Optional[List[str]] = None
+        self._index: Optional[Dict[str, int]] = None
+        self.loaded: Dict[str, Pair] = {}       # {id: pair} parsed from the snapshot, or added since
+        self.changed: Dict[str, Pair] = {}      # {id: pair} added or replaced since the snapshot
+        self.removed: set = set()               # ids in the snapshot that have been deleted
+        self.added = 0                          # ids in changed that aren't in the snapshot
+
+    @property
+    def ids(self) -> List[str]:
+        if self._ids is None:
+            self._ids = bytes(self.id_bytes).decode().split('\n') if self.count else []
+        return self._ids
+
+    @property
+    def index(self) -> Dict[str, int]:
+        """{id: row} of the pairs in the snapshot"""
+        if self._index is None:
+            self._index = dict(zip(self.ids, range(self.count)))
+        return self._index
+
+    def __len__(self) -> int:
+        return self.count - len(self.removed) + self.added
+
+    def __contains__(self, id: object) -> bool:
+        return id in self.changed or (id in self.index and id not in self.removed)
+
+    def __iter__(self) -> Iterator[str]:
+        for id in self.ids:
+            if id not in self.removed:
+                yield id
+        for id in self.changed:
+            if id not in self.index:
+                yield id
+
+    def __getitem__(self, id: str) -> Pair:
+        pair = self.loaded.get(id)
+        if pair is not None:
+            return pair
+        if id not in self:
+            raise KeyError(id)
+        buy_data, sell_data = json.loads(bytes(self.raw(id)))
+        pair = self.loaded[id] = {'buy': Order(buy_data), 'sell': Order(sell_data)}
+        return pair
+
+    def __setitem__(self, id: str, pair: Pair) -> None:
+        if id not in self.changed and id not in self.index:
+            self.added += 1
+        self.loaded[id] = self.changed[id] = pair
+        self.removed.discard(id)
+
+    def __delitem__(self, id: str) -> None:
+        if id not in self:
+            raise KeyError(id)
+        self.loaded.pop(id, None)
+        self.changed.pop(id, None)
+        if id in self.index:
+            self.removed.add(id)
+        else:
+            self.added -= 1
+
+    def raw(self, id: str) -> memoryview:
+        """the json of a pair as it was in the snapshot, without parsing it"""
+        i = self.index[id]
+        return self.pairs[self.offsets[i]:self.offsets[i + 1]]
+
+    def profit_by_hour(self) -> Tuple[Dict[int, int], int]:
+        """({hour_start_ms: net profit in USD units}, number of pairs), only parsing the pairs changed since the snapshot"""
+        hours = dict(self.hours)
+        for id in (*self.removed, *(id for id in self.changed if id in self.index)):
+            i = self.index[id]
+            hour = self.timestamps[i] - self.timestamps[i] % HOUR_MS
+            hours[hour] -= self.profits[i]
+        for pair in self.changed.values():
+            timestamp_ms = pair['sell'].timestamp_ms
+            hour = timestamp_ms - timestamp_ms % HOUR_MS
+            hours[hour] = hours.get(hour, 0) + net_profit(pair).units
+        return hours, len(self)
+
+
+def snapshot_path(path: str) -> str:
+    return os.path.join(path, SNAPSHOT_FILE)
+
+def read_snapshot(path: str) -> Optional[Tuple[Dict[str, Order], ClosedOrders]]:
+    """map (active_orders, closed_orders) from a data dir's snapshot, or None if it doesn't have one"""
+    try:
+        with open(snapshot_path(path), 'rb') as f:
+            # the mapping stays valid after the file's closed, or replaced by the next snapshot
+            buffer = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    except FileNotFoundError:
+        return None
+
+    magic, active_len, count, hours_count, ids_len, pairs_len = HEADER.unpack_from(buffer)
+    if magic != MAGIC:
+        raise ValueError(f'{snapshot_path(path)} is not an order snapshot')
+
+    pos = HEADER.size
+    active_orders = {}
+    for data in json.loads(bytes(buffer[pos:pos + active_len])):
+        order = Order(data)
+        active_orders[order.id] = order
+    pos += active_len
+
+    columns = []
+    for length in (count, count, count + 1, 2 * hours_count):
+        columns.append(int64s(buffer[pos:pos + length * ITEM_SIZE]))
+        pos += length * ITEM_SIZE
+    timestamps, profits, offsets, hours = columns
+    id_bytes = buffer[pos:pos + ids_len]
+    pos += ids_len
+    pairs = buffer[pos:pos + pairs_len]
+
+    return active_orders, ClosedOrders(
+        count, timestamps, profits, offsets,
+        dict(zip(hours[::2], hours[1::2])), id_bytes, pairs,
+    )
+
+def write_snapshot(path: str, active_orders: Dict[str, Order], closed_orders: MutableMapping) -> None:
+    """atomically replace a data dir's snapshot, copying unchanged closed pairs without re-serializing them"""
+
+    timestamps, profits, offsets = array('q'), array('q'), array('q', [0])
+    ids, chunks = [], []
+    hours: Dict[int, int] = {}
+    lazy = isinstance(closed_orders, ClosedOrders)
+    for id in closed_orders:
+        if lazy and id not in closed_orders.changed:
+            i = closed_orders.index[id]
+            timestamp_ms, profit = closed_orders.timestamps[i], closed_orders.profits[i]
+            chunk = closed_orders.raw(id)
+        else:
+            pair = closed_orders[id]
+            timestamp_ms, profit = pair['sell'].timestamp_ms, net_profit(pair).units
+            chunk = json.dumps([pair['buy'].data, pair['sell'].data]).encode()
+        timestamps.append(timestamp_ms)
+        profits.append(profit)
+        hour = timestamp_ms - timestamp_ms % HOUR_MS
+        hours[hour] = hours.get(hour, 0) + profit
+        ids.append(id)
+        chunks.append(chunk)
+        offsets.append(offsets[-1] + len(chunk))
+
+    active = json.dumps([order.data for order in active_orders.values()]).encode()
+    hour_columns = array('q', (value for item in sorted(hours.items()) for value in item))
+    id_bytes = '\n'.join(ids).encode()
+    pairs_len = offsets[-1]
+    if sys.byteorder != 'little':
+        for column in (timestamps, profits, offsets, hour_columns):
+            column.byteswap()
+
+    tmp_path = f'{snapshot_path(path)}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(active), len(ids), len(hours), len(id_bytes), pairs_len))
+        f.write(active)
+        for column in (timestamps, profits, offsets, hour_columns):
+            column.tofile(f)
+        f.write(id_bytes)
+        f.writelines(chunks)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, snapshot_path(path))
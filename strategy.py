@@ -0,0 +1,54 @@
+"""
+Rules of the example threshold strategy
+
+Kept free of any API calls or IO, so the live bot (example.py) and the
+backtester (backtest.py) make their decisions with exactly the same logic.
+The price arguments can be Currency amounts, Decimals, or NumPy arrays.
+"""
+
+from random import randint
+from decimal import Decimal
+from typing import Optional, Tuple
+
+from symbols import Order, Currency
+from settings import (
+    USD_MIN_ORDER_AMT,
+    USD_MAX_ORDER_AMT,
+    MAX_LOSS_RATIO,
+    MAX_GAIN_RATIO,
+    USD_MAX_NET_GAINS,
+    USD_MAX_NET_LOSS,
+    MAX_BUY_VOLATILITY,
+)
+
+add_percentage = lambda price, ratio: price + (price * ratio)
+net_profit = lambda pair: pair['sell'].filled_amt - pair['buy'].filled_amt
+
+def random_order_amt(min_amt=USD_MIN_ORDER_AMT, max_amt=USD_MAX_ORDER_AMT) -> Decimal:
+    """pick a random USD amount between USD_MIN_ORDER_AMT and USD_MAX_ORDER_AMT"""
+    rand_amt = Decimal(randint(0, 100)/100) * (max_amt - min_amt)
+    return min_amt + rand_amt
+
+def sell_thresholds(buy_price, gain_ratio=MAX_GAIN_RATIO, loss_ratio=MAX_LOSS_RATIO) -> Tuple:
+    """the (upper, lower) prices past which an order bought at buy_price gets sold"""
+    return add_percentage(buy_price, gain_ratio), add_percentage(buy_price, loss_ratio)
+
+def hit_limit(order: Order, price: Currency) -> bool:
+    """check if an order has gained or lost enough at the given price to sell it"""
+    upper, lower = sell_thresholds(order.limit_price)
+    return price > upper or price < lower
+
+def net_limit_hit(net_gains, max_gains=USD_MAX_NET_GAINS, max_loss=USD_MAX_NET_LOSS) -> Optional[str]:
+    """'gains' or 'loss' if the total net gains have hit either limit, otherwise None"""
+    if net_gains > max_gains:
+        return 'gains'
+    elif net_gains < max_loss:
+        return 'loss'
+    return None
+
+def buy_allowed(indicators: dict, max_volatility=MAX_BUY_VOLATILITY) -> bool:
+    """check the streaming indicators (see indicators.py) before opening new orders"""
+    volatility = indicators.get('volatility')
+    if max_volatility is not None and volatility is not None:
+        return volatility <= max_volatility
+    return True
@@ -9,14 +9,47 @@ Order object representing a Gemini order:
 from decimal import Decimal
 
 class Currency:
-    """Base class for currencies that have a decimal place limit"""
-    amt: Decimal
+    """Base class for currencies that have a decimal place limit
+
+    Amounts are stored as an integer number of the smallest units
+    (e.g. cents for USD), so arithmetic & comparisons between amounts of the
+    same currency are plain int operations.  Decimals are only built at the
+    boundaries, when rounding a new amount in or reading .amt out.
+    """
+    __slots__ = ('units',)
+
+    units: int
     icon: str
     symbol: str
     decimal_places: int
+    _scale: int             # 10 ** decimal_places
+    _quantum: Decimal       # Decimal('0.01') for 2 decimal places
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        if 'decimal_places' in cls.__dict__:
+            cls._scale = 10 ** cls.decimal_places
+            cls._quantum = Decimal(1).scaleb(-cls.decimal_places)
 
     def __init__(self, amt: Decimal) -> None:
-        self.amt = Decimal(round(Decimal(amt), self.decimal_places))
+        if type(amt) is int:
+            self.units = amt * self._scale
+        else:
+            if type(amt) is not Decimal:
+                amt = Decimal(amt)
+            # same rounding as round(Decimal(amt), decimal_places), i.e. ROUND_HALF_EVEN
+            self.units = int(amt.quantize(self._quantum) * self._scale)
+
+    @classmethod
+    def from_units(cls, units: int) -> 'Currency':
+        """create an amount directly from an integer number of the smallest units"""
+        currency = object.__new__(cls)
+        currency.units = units
+        return currency
+
+    @property
+    def amt(self) -> Decimal:
+        return Decimal(self.units).scaleb(-self.decimal_places)
 
     def __str__(self) -> str:
         return str(self.amt)
@@ -26,77 +59,94 @@ class Currency:
 
     def __add__(self, other: object) -> 'Currency':
         if isinstance(other, self.__class__) and isinstance(other, Currency):
-            return self.__class__(other.amt + self.amt)
+            return self.from_units(other.units + self.units)
         return NotImplemented
 
     def __radd__(self, other: object) -> 'Currency':
         if other == 0:
             return self  # needed for sum(n for n in (USD(1), USD(2)))
         if isinstance(other, self.__class__) and isinstance(other, Currency):
-            return self.__class__(self.amt + other.amt)
+            return self.from_units(self.units + other.units)
         return NotImplemented
 
     def __sub__(self, other: object) -> 'Currency':
         if isinstance(other, self.__class__) and isinstance(other, Currency):
-            return self.__class__(self.amt - other.amt)
+            return self.from_units(self.units - other.units)
         return NotImplemented
 
     def __rsub__(self, other: object) -> 'Currency':
         if isinstance(other, self.__class__) and isinstance(other, Currency):
-            return self.__class__(other.amt - self.amt)
+            return self.from_units(other.units - self.units)
         return NotImplemented
 
     def __mul__(self, other: object) -> 'Currency':
+        if type(other) is int:
+            return self.from_units(self.units * other)
         if isinstance(other, (int, Decimal)):
-            return self.__class__(self.amt * other)
+            # Decimal(units) * other has the same digits as amt * other, just shifted,
+            # so this rounds exactly like self.__class__(self.amt * other)
+            return self.from_units(round(Decimal(self.units) * other))
         return NotImplemented
 
     def __eq__(self, other: object) -> bool:
+        if isinstance(other, self.__class__) and isinstance(other, Currency):
+            return self.units == other.units
+        if type(other) is int:
+            return self.units == other * self._scale
         if isinstance(other, (int, float, Decimal)):
             return self.amt == other
-        if isinstance(other, self.__class__) and isinstance(other, Currency):
-            return self.amt == other.amt
         return NotImplemented
 
     def __gt__(self, other: object) -> bool:
+        if isinstance(other, self.__class__) and isinstance(other, Currency):
+            return self.units > other.units
+        if type(other) is int:
+            return self.units > other * self._scale
         if isinstance(other, (int, float, Decimal)):
             return self.amt > other
-        if isinstance(other, self.__class__) and isinstance(other, Currency):
-            return self.amt > other.amt
         return NotImplemented
 
     def __ge__(self, other: object) -> bool:
+        if isinstance(other, self.__class__) and isinstance(other, Currency):
+            return self.units >= other.units
+        if type(other) is int:
+            return self.units >= other * self._scale
         if isinstance(other, (int, float, Decimal)):
             return self.amt >= other
-        if isinstance(other, self.__class__) and isinstance(other, Currency):
-            return self.amt >= other.amt
         return NotImplemented
 
     def __lt__(self, other: object) -> bool:
+        if isinstance(other, self.__class__) and isinstance(other, Currency):
+            return self.units < other.units
+        if type(other) is int:
+            return self.units < other * self._scale
         if isinstance(other, (int, float, Decimal)):
             return self.amt < other
-        if isinstance(other, self.__class__) and isinstance(other, Currency):
-            return self.amt < other.amt
         return NotImplemented
 
     def __le__(self, other: object) -> bool:
+        if isinstance(other, self.__class__) and isinstance(other, Currency):
+            return self.units <= other.units
+        if type(other) is int:
+            return self.units <= other * self._scale
         if isinstance(other, (int, float, Decimal)):
             return self.amt <= other
-        if isinstance(other, self.__class__) and isinstance(other, Currency):
-            return self.amt <= other.amt
         return NotImplemented
 
 class USD(Currency):
+    __slots__ = ()
     icon = '$'
     symbol = 'usd'
     decimal_places = 2
 
 class BTC(Currency):
+    __slots__ = ()
     icon = '𝔹'
     symbol = 'btc'
     decimal_places = 6
 
 class ETH(Currency):
+    __slots__ = ()
     icon = '𝔼'
     symbol = 'eth'
     decimal_places = 4
@@ -114,6 +164,23 @@ currency_pair_by_symbol = {
 }
 
 
+class OrderState:
+    """An order's status json and the fields parsed from it, replaced as a whole by Order.update()"""
+
+    __slots__ = (
+        'data', 'id', 'is_filled', 'limit_price', 'avg_price', 'original', 'executed', 'remaining',
+        'buy_amt', 'price_amt', 'filled_amt',
+    )
+
+    def __init__(self, json) -> None:
+        if 'result' in json and json['result'] == 'error':
+            print(json.get('message'))
+            raise Exception(json.get('reason'))
+
+        assert 'id' in json, 'Order json must have an id field.'
+        self.data = json
+
+
 class Order:
     """Object representing a Gemini order"""
     # Spec: https://docs.gemini.com/rest-api/#order-status
@@ -138,19 +205,39 @@ class Order:
       "original_amount": "3",
     }
 
+    # parsed fields are only set on first access, then cached in the state until the next update
+    __slots__ = ('state',)
+
     def __init__(self, json):
-        if json.get('result') == 'error':
-            print(json.get('message'))
-            raise Exception(json.get('reason'))
+        self.state = OrderState(json)
 
-        assert 'id' in json, 'Order json must have an id field.'
-        self.data = json
+    def update(self, json) -> None:
+        """replace the order data in place with a newer status json for the same order
+
+        The new json gets a fresh state that's swapped in with a single assignment, so
+        threads reading the order see either the old state or the new one, and a field
+        parsed from the old json is only ever cached in the old state.
+        """
+        self.state = OrderState(json)
+
+    @property
+    def data(self) -> dict:
+        return self.state.data
 
     def __getattr__(self, attr):
-        return self.data[attr]
+        # only called for raw json fields
+        if attr in ('state', 'data') or attr.startswith('_'):
+            raise AttributeError(attr)
+        return self.state.data[attr]
+
+    def __getstate__(self) -> dict:
+        return self.data
+
+    def __setstate__(self, json: dict) -> None:
+        self.__init__(json)
 
     def __repr__(self):
-        pct = round((Decimal(self.executed_amount) / Decimal(self.original_amount)) * 100)
+        pct = round((self.executed / self.original) * 100)
         return (
             f'{self.side.upper()} {self.symbol.upper()} '
             f'{repr(self.buy_amt)} @ {repr(self.price_amt)} ({pct}% filled '
@@ -158,20 +245,98 @@ class Order:
         )
 
     @property
-    def is_filled(self):
-        return self.remaining_amount == "0"
+    def id(self) -> str:
+        state = self.state
+        try:
+            return state.id
+        except AttributeError:
+            state.id = state.data['id']
+            return state.id
+
+    @property
+    def is_filled(self) -> bool:
+        state = self.state
+        try:
+            return state.is_filled
+        except AttributeError:
+            state.is_filled = state.data['remaining_amount'] == "0"
+            return state.is_filled
+
+    @property
+    def limit_price(self) -> Decimal:
+        state = self.state
+        try:
+            return state.limit_price
+        except AttributeError:
+            state.limit_price = Decimal(state.data['price'])
+            return state.limit_price
+
+    @property
+    def avg_price(self) -> Decimal:
+        state = self.state
+        try:
+            return state.avg_price
+        except AttributeError:
+            state.avg_price = Decimal(state.data['avg_execution_price'])
+            return state.avg_price
+
+    @property
+    def original(self) -> Decimal:
+        state = self.state
+        try:
+            return state.original
+        except AttributeError:
+            state.original = Decimal(state.data['original_amount'])
+            return state.original
+
+    @property
+    def executed(self) -> Decimal:
+        state = self.state
+        try:
+            return state.executed
+        except AttributeError:
+            state.executed = Decimal(state.data['executed_amount'])
+            return state.executed
+
+    @property
+    def remaining(self) -> Decimal:
+        state = self.state
+        try:
+            return state.remaining
+        except AttributeError:
+            state.remaining = Decimal(state.data['remaining_amount'])
+            return state.remaining
+
+    @property
+    def timestamp_ms(self) -> int:
+        return int(self.state.data['timestampms'])
 
     @property
     def buy_amt(self) -> Currency:
-        return currency_by_symbol[self.symbol[:3]](Decimal(self.original_amount))
+        state = self.state
+        try:
+            return state.buy_amt
+        except AttributeError:
+            state.buy_amt = currency_by_symbol[state.data['symbol'][:3]](Decimal(state.data['original_amount']))
+            return state.buy_amt
 
     @property
     def price_amt(self) -> Currency:
-        return currency_by_symbol[self.symbol[3:]](Decimal(self.price))
+        state = self.state
+        try:
+            return state.price_amt
+        except AttributeError:
+            state.price_amt = currency_by_symbol[state.data['symbol'][3:]](Decimal(state.data['price']))
+            return state.price_amt
 
     @property
     def filled_amt(self) -> Currency:
-        return USD(Decimal(self.price) * Decimal(self.executed_amount))
+        state = self.state
+        try:
+            return state.filled_amt
+        except AttributeError:
+            state.filled_amt = USD(Decimal(state.data['price']) * Decimal(state.data['executed_amount']))
+            return state.filled_amt
 
 currency_art = {
     'ethusd': '''
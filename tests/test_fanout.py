@@ -0,0 +1,63 @@
+"""
+End-to-end check of the fan-out: a trade on the mock exchange goes through the
+feed handler, into the shared memory ring, and gets a worker to place an order
+through the gateway.  The three normally run as processes, here they're threads
+sharing one process, with the API pointed at a local MockExchange.
+
+Usage:
+    python3 -m pytest tests
+"""
+
+import os
+import sys
+import queue
+import threading
+
+from time import sleep, monotonic
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fanout
+import gemini_api as api
+from nonces import NonceAllocator
+from mock_exchange import MockExchange
+
+
+def test_trade_reaches_worker(tmp_path, monkeypatch):
+    exchange = MockExchange('ethusd', heartbeat_interval=0.5).start()
+    monkeypatch.setattr(api, 'client', api.GeminiClient(exchange.url, ws_url=exchange.ws_url, rate_limit=False))
+    monkeypatch.setattr(api, 'nonce_allocator', NonceAllocator(str(tmp_path / '.last_nonce.txt')))
+    monkeypatch.setattr(fanout, 'DATA_DIR', str(tmp_path))
+
+    ring = fanout.create_ring(64)
+    stopped = threading.Event()
+    requests = queue.Queue()
+    responses = {0: queue.Queue()}
+    threads = [
+        threading.Thread(target=fanout.feed_handler_main, args=(ring.name, ['ethusd'], stopped), daemon=True),
+        threading.Thread(target=fanout.gateway_main, args=(requests, responses), daemon=True),
+        threading.Thread(target=fanout.worker_main, args=(0, 'ethusd', ring.name, requests, responses[0]), daemon=True),
+    ]
+    try:
+        for thread in threads:
+            thread.start()
+
+        # the worker only reads updates published after it attached, so keep trading until it buys
+        deadline = monotonic() + 15
+        while not exchange.engine.orders and monotonic() < deadline:
+            exchange.trade(Decimal('900'), Decimal('0.5'))
+            sleep(0.1)
+        orders = list(exchange.engine.orders.values())
+        assert orders, 'no order was placed from the fanned out trade'
+        assert orders[0].side == 'buy'
+    finally:
+        stopped.set()
+        threads[0].join(10)     # closing the ring ends the worker's read loop
+        threads[2].join(10)
+        requests.put(None)
+        threads[1].join(10)
+        ring.close()
+        ring.unlink()
+        exchange.stop()
+    assert not any(thread.is_alive() for thread in threads)
@@ -0,0 +1,49 @@
+"""
+Nonce allocation: nonces keep increasing across allocators & restarts, and
+only one process at a time can sign with a nonce file.
+
+Usage:
+    python3 -m pytest tests
+"""
+
+import os
+import sys
+import subprocess
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nonces import NonceAllocator, NonceFileInUse
+
+
+def test_nonces_increase_across_restarts(tmp_path):
+    path = str(tmp_path / '.last_nonce.txt')
+    first = NonceAllocator(path, block_size=10, min_nonce=0)
+    nonces = [first.allocate() for _ in range(25)]
+    assert nonces == sorted(set(nonces))
+    os.close(first.owner_fd)    # as if the process exited
+
+    restarted = NonceAllocator(path, block_size=10, min_nonce=0)
+    assert restarted.allocate() > nonces[-1]
+
+
+def test_second_process_is_refused(tmp_path):
+    path = str(tmp_path / '.last_nonce.txt')
+    owner = NonceAllocator(path, min_nonce=0)
+    owner.allocate()
+
+    # another process signing with the same file would interleave its blocks with ours
+    other = subprocess.run(
+        [sys.executable, '-c', 'import sys; from nonces import NonceAllocator; NonceAllocator(sys.argv[1]).allocate()', path],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        capture_output=True, text=True,
+    )
+    assert other.returncode != 0
+    assert 'NonceFileInUse' in other.stderr
+    assert f'process {os.getpid()}' in other.stderr
+
+    # the owner keeps allocating
+    assert owner.allocate() > 0
+    with pytest.raises(NonceFileInUse):
+        NonceAllocator(path).claim()
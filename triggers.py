@@ -0,0 +1,78 @@
+"""
+Index of the active orders' sell thresholds, so a price update only looks at
+the orders it actually triggers
+
+Each order's (upper, lower) sell prices from strategy.sell_thresholds are
+computed once when it's added, and kept in a min-heap of uppers and a max-heap
+of lowers.  A new price pops every order whose upper is below it or whose lower
+is above it, in O(k log n) for k triggered orders instead of checking all n, e.g.:
+
+    triggers = SellTriggers(active_orders.values())
+    triggers.add(buy_order)
+    for order_id in triggers.pop_triggered(price):
+        ...sell it
+
+Gives the same answers as strategy.hit_limit, for thousands of active orders.
+"""
+
+from heapq import heapify, heappop, heappush
+from decimal import Decimal
+from typing import Dict, Iterable, List, Tuple
+
+from symbols import Order, Currency
+from strategy import sell_thresholds
+
+
+class SellTriggers:
+    """Heaps of the active orders' upper & lower sell prices, with lazy deletion"""
+
+    def __init__(self, orders: Iterable[Order]=()) -> None:
+        self.thresholds: Dict[str, Tuple[Decimal, Decimal]] = {}   # {order_id: (upper, lower)}
+        self.uppers: List[Tuple[Decimal, str]] = []                 # min-heap of (upper, order_id)
+        self.lowers: List[Tuple[Decimal, str]] = []                 # min-heap of (-lower, order_id)
+        for order in orders:
+            self.add(order)
+
+    def __len__(self) -> int:
+        return len(self.thresholds)
+
+    def __contains__(self, order_id: str) -> bool:
+        return order_id in self.thresholds
+
+    def add(self, order: Order) -> None:
+        """start watching an order, replacing its thresholds if it's already watched"""
+        upper, lower = sell_thresholds(order.limit_price)
+        self.thresholds[order.id] = (upper, lower)
+        heappush(self.uppers, (upper, order.id))
+        heappush(self.lowers, (-lower, order.id))
+
+    def discard(self, order_id: str) -> None:
+        """stop watching an order, its heap entries are skipped once they reach the top"""
+        self.thresholds.pop(order_id, None)
+        self.compact()
+
+    def pop_triggered(self, price: Currency) -> List[str]:
+        """remove and return the ids of every order that should be sold at price"""
+        triggered = []
+        amt = price.amt
+        while self.uppers and self.uppers[0][0] < amt:
+            upper, order_id = heappop(self.uppers)
+            if self.thresholds.get(order_id, (None,))[0] == upper:
+                del self.thresholds[order_id]
+                triggered.append(order_id)
+        while self.lowers and -self.lowers[0][0] > amt:
+            lower, order_id = heappop(self.lowers)
+            thresholds = self.thresholds.get(order_id)
+            if thresholds is not None and thresholds[1] == -lower:
+                del self.thresholds[order_id]
+                triggered.append(order_id)
+        self.compact()
+        return triggered
+
+    def compact(self) -> None:
+        """drop the stale heap entries once they outnumber the live ones"""
+        if len(self.uppers) + len(self.lowers) > 4 * len(self.thresholds) + 64:
+            self.uppers = [(upper, id) for id, (upper, lower) in self.thresholds.items()]
+            self.lowers = [(-lower, id) for id, (upper, lower) in self.thresholds.items()]
+            heapify(self.uppers)
+            heapify(self.lowers)